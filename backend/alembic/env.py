@@ -6,12 +6,14 @@ from logging.config import fileConfig
 
 from sqlalchemy import engine_from_config
 from sqlalchemy import pool
+from sqlalchemy.engine import make_url
 
 from alembic import context
 import asyncio
 
 # Import models to ensure they are registered
-from app.models import Base
+import app.models  # noqa: F401
+from app.core.database import Base
 from app.core.config import get_settings
 
 # this is the Alembic Config object, which provides
@@ -32,6 +34,22 @@ settings = get_settings()
 config.set_main_option("sqlalchemy.url", settings.DATABASE_URL.replace("+asyncpg", ""))
 
 
+def include_object_for(dialect_name: str):
+    """
+    Autogenerate filter for one dialect: indexes limited to other dialects
+    with ddl_if() (e.g. the Postgres GIN indexes) are left out, so comparing
+    against SQLite does not propose creating them
+    """
+    def include_object(object, name, type_, reflected, compare_to):
+        ddl_if = getattr(object, "_ddl_if", None)
+        if type_ == "index" and ddl_if is not None and ddl_if.dialect is not None:
+            dialects = (ddl_if.dialect,) if isinstance(ddl_if.dialect, str) else ddl_if.dialect
+            return dialect_name in dialects
+        return True
+
+    return include_object
+
+
 def run_migrations_offline() -> None:
     """Run migrations in 'offline' mode.
 
@@ -47,6 +65,7 @@ def run_migrations_offline() -> None:
     context.configure(
         url=url,
         target_metadata=target_metadata,
+        include_object=include_object_for(make_url(url).get_backend_name()),
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
     )
@@ -56,7 +75,11 @@ def run_migrations_offline() -> None:
 
 
 def do_run_migrations(connection):
-    context.configure(connection=connection, target_metadata=target_metadata)
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        include_object=include_object_for(connection.dialect.name),
+    )
 
     with context.begin_transaction():
         context.run_migrations()
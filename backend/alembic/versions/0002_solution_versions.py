@@ -0,0 +1,74 @@
+"""solution versions
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17 14:00:00.000000
+
+Moves solution history out of the solutions.version_history JSON list into
+solution_versions rows (snapshots plus deltas)
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+CONTENT_FIELDS = ('requirements', 'recommendation', 'products', 'sources')
+
+
+def upgrade() -> None:
+    versions = op.create_table('solution_versions',
+    sa.Column('id', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), autoincrement=True, nullable=False),
+    sa.Column('solution_id', sa.String(length=36), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('is_snapshot', sa.Boolean(), nullable=False),
+    sa.Column('data', sa.JSON(), nullable=False),
+    sa.Column('note', sa.String(length=500), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['solution_id'], ['solutions.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('solution_id', 'version', name='uq_solution_versions_solution_version')
+    )
+
+    # Existing history becomes snapshots; the current content is the latest one
+    solutions = sa.table('solutions',
+        sa.column('id', sa.String), sa.column('version', sa.Integer), sa.column('updated_at', sa.DateTime),
+        sa.column('requirements', sa.Text), sa.column('recommendation', sa.Text),
+        sa.column('products', sa.JSON), sa.column('sources', sa.JSON), sa.column('version_history', sa.JSON),
+    )
+    rows = []
+    for solution in op.get_bind().execute(sa.select(solutions)).mappings():
+        current = {field: solution[field] for field in CONTENT_FIELDS}
+        for entry in solution['version_history'] or []:
+            if isinstance(entry, dict) and isinstance(entry.get('version'), int) and entry['version'] < solution['version']:
+                rows.append({
+                    'solution_id': solution['id'],
+                    'version': entry['version'],
+                    'is_snapshot': True,
+                    'data': {field: entry.get(field, current[field]) for field in CONTENT_FIELDS},
+                    'created_at': solution['updated_at'],
+                })
+        rows.append({
+            'solution_id': solution['id'],
+            'version': solution['version'],
+            'is_snapshot': True,
+            'data': current,
+            'created_at': solution['updated_at'],
+        })
+    if rows:
+        op.bulk_insert(versions, rows)
+
+    with op.batch_alter_table('solutions') as batch_op:
+        batch_op.drop_column('version_history')
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('solutions') as batch_op:
+        batch_op.add_column(sa.Column('version_history', sa.JSON(), nullable=True))
+    op.drop_table('solution_versions')
@@ -0,0 +1,45 @@
+"""token map jsonb
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17 16:00:00.000000
+
+Stores token map layers, providers and research_data as JSONB with GIN
+indexes on Postgres; other databases keep plain JSON
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMNS = ('layers', 'providers', 'research_data')
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for name in COLUMNS:
+        op.alter_column('token_maps', name, type_=postgresql.JSONB(), postgresql_using=f'{name}::jsonb')
+    op.create_index('ix_token_maps_providers', 'token_maps', ['providers'],
+                    postgresql_using='gin', postgresql_ops={'providers': 'jsonb_path_ops'})
+    op.create_index('ix_token_maps_layers', 'token_maps', ['layers'],
+                    postgresql_using='gin', postgresql_ops={'layers': 'jsonb_path_ops'})
+    op.create_index('ix_token_maps_research_data', 'token_maps', ['research_data'], postgresql_using='gin')
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.drop_index('ix_token_maps_research_data', table_name='token_maps')
+    op.drop_index('ix_token_maps_layers', table_name='token_maps')
+    op.drop_index('ix_token_maps_providers', table_name='token_maps')
+    for name in COLUMNS:
+        op.alter_column('token_maps', name, type_=sa.JSON(), postgresql_using=f'{name}::json')
@@ -0,0 +1,49 @@
+"""customer lookup indexes
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17 18:00:00.000000
+
+Indexes the customer foreign keys used by the bulk customer reads. Token map
+versions become unique per customer; customers whose maps share a version
+are renumbered in creation order first
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    token_maps = sa.table('token_maps',
+        sa.column('id', sa.String), sa.column('customer_id', sa.String),
+        sa.column('version', sa.Integer), sa.column('created_at', sa.DateTime),
+    )
+    duplicated = (
+        sa.select(token_maps.c.customer_id)
+        .group_by(token_maps.c.customer_id, token_maps.c.version)
+        .having(sa.func.count() > 1)
+    )
+    ranked = sa.select(
+        token_maps.c.id,
+        sa.func.row_number().over(
+            partition_by=token_maps.c.customer_id,
+            order_by=(token_maps.c.version, token_maps.c.created_at, token_maps.c.id),
+        ).label('rank'),
+    ).where(token_maps.c.customer_id.in_(duplicated)).subquery()
+    op.execute(token_maps.update().where(token_maps.c.id == ranked.c.id).values(version=ranked.c.rank))
+
+    op.create_index('ix_token_maps_customer_version', 'token_maps', ['customer_id', 'version'], unique=True)
+    op.create_index(op.f('ix_solutions_customer_id'), 'solutions', ['customer_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_solutions_customer_id'), table_name='solutions')
+    op.drop_index('ix_token_maps_customer_version', table_name='token_maps')
@@ -2,37 +2,156 @@
 AgentScope framework integration for multi-agent system
 """
 
-from typing import Optional, Dict, Any, List
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional, Dict, Any, List, Iterator, Set
 from abc import ABC, abstractmethod
-import asyncio
+import logging
 
+from redis.exceptions import RedisError
+
+from app.agents.memory import ConversationMemory
+from app.core.cache import CacheManager, cache_manager
 from app.core.config import get_settings
-from app.core.llm import LLMService, get_llm_service, TaskType
+from app.core.llm import LLMService, ModelType, TaskType, is_failover_error
+from app.core.llm import llm_service as default_llm_service
+from app.core.resilience import RetryPolicy, run_with_retries
 
 settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+class _RequestMemory:
+    """
+    Working memory of every agent in one request, keyed by agent instance
+    With a session id, each agent's summary and window are loaded from Redis
+    on first use and saved back after every generation
+    """
+
+    def __init__(self, session_id: Optional[str] = None):
+        self.session_id = session_id
+        self.memories: Dict[int, ConversationMemory] = {}
+        self.loaded: Set[int] = set()
+
+
+# Agents are shared across requests, so conversation state must never live
+# on the agent itself
+_request_memory: ContextVar[Optional[_RequestMemory]] = ContextVar("agent_request_memory", default=None)
+
+MEMORY_SUMMARY_PROMPT = """Update the running summary of a conversation.
+Keep names, figures, commitments and open questions; drop pleasantries.
+
+Current summary:
+{summary}
+
+New messages:
+{transcript}
+
+Updated summary:"""
+
+
+@contextmanager
+def agent_request_scope(session_id: Optional[str] = None) -> Iterator[None]:
+    """
+    Give every agent a fresh working memory for the duration of the block
+    Tasks spawned inside the block share that memory. Pass the conversation's
+    session id to carry summaries and windows over from earlier requests.
+    """
+    token = _request_memory.set(_RequestMemory(session_id))
+    try:
+        yield
+    finally:
+        _request_memory.reset(token)
+
+
+def _scope() -> _RequestMemory:
+    scope = _request_memory.get()
+    if scope is None:
+        # Each asyncio task runs in its own context copy, so a lazily created
+        # store is still private to the current request
+        scope = _RequestMemory()
+        _request_memory.set(scope)
+    return scope
 
 
 class AgentBase(ABC):
-    """Base class for all agents in the system"""
+    """
+    Base class for all agents in the system
+    Agents are cheap, reusable objects: construction has no I/O or event loop
+    side effects, and per-request state lives in agent_request_scope()
+    """
     
     def __init__(
         self,
         name: str,
         description: str,
         llm_service: Optional[LLMService] = None,
+        cache: Optional[CacheManager] = None,
     ):
         self.name = name
         self.description = description
-        self.llm_service = llm_service or asyncio.run(get_llm_service())
-        self.memory: List[Dict[str, Any]] = []
+        self.llm_service = llm_service or default_llm_service
+        self.cache = cache or cache_manager
+    
+    @property
+    def memory(self) -> ConversationMemory:
+        """Agent's token-budgeted working memory for the current request"""
+        memories = _scope().memories
+        memory = memories.get(id(self))
+        if memory is None:
+            memory = ConversationMemory(
+                token_budget=agent_config.max_memory_tokens,
+                max_messages=agent_config.max_memory_size,
+                summarizer=self.summarize_memory,
+            )
+            memories[id(self)] = memory
+        return memory
     
     def add_to_memory(self, message: Dict[str, Any]) -> None:
         """Add a message to agent's memory"""
         self.memory.append(message)
     
     def clear_memory(self) -> None:
-        """Clear agent's memory"""
-        self.memory = []
+        """Clear agent's memory; a session's stored memory is replaced at the next save"""
+        _scope().memories.pop(id(self), None)
+    
+    def _memory_key(self, session_id: str) -> str:
+        return f"agent:memory:{session_id}:{self.name}"
+    
+    async def load_memory(self) -> None:
+        """
+        Restore the session's summary and window, once per request
+        Messages added earlier in the request stay after the restored ones
+        """
+        scope = _scope()
+        if scope.session_id is None or id(self) in scope.loaded:
+            return
+        scope.loaded.add(id(self))
+        if not self.cache.is_connected:
+            return
+        try:
+            state = await self.cache.get(self._memory_key(scope.session_id))
+        except RedisError as exc:
+            logger.warning("Could not load %s memory for session %s: %s", self.name, scope.session_id, exc)
+            return
+        if state:
+            self.memory.restore(state)
+    
+    async def save_memory(self) -> None:
+        """Store the summary and window for the session's next request"""
+        scope = _scope()
+        if scope.session_id is None or not self.cache.is_connected:
+            return
+        try:
+            await self.cache.set(self._memory_key(scope.session_id), self.memory.dump())
+        except RedisError as exc:
+            logger.warning("Could not save %s memory for session %s: %s", self.name, scope.session_id, exc)
+    
+    async def summarize_memory(self, summary: str, messages: List[Dict[str, Any]]) -> str:
+        """Fold evicted messages into the running summary with a cheap model"""
+        transcript = "\n".join(f"{m.get('role', 'user')}: {m.get('content', '')}" for m in messages)
+        prompt = MEMORY_SUMMARY_PROMPT.format(summary=summary or "(none)", transcript=transcript)
+        return await self.llm_service.generate(prompt, model=ModelType.QWEN_TURBO, temperature=0.2)
     
     @abstractmethod
     async def process(self, input_data: Any) -> Any:
@@ -45,12 +164,51 @@ class AgentBase(ABC):
         task_type: TaskType,
         temperature: float = 0.7,
     ) -> str:
-        """Generate a response using the LLM"""
-        return await self.llm_service.generate(
-            prompt=prompt,
-            task=task_type,
-            temperature=temperature,
+        """
+        Generate a response using the LLM
+        Retries, backoff and per-attempt timeouts follow agent_config
+        """
+        return await run_with_retries(
+            lambda: self.llm_service.generate(
+                prompt=prompt,
+                task=task_type,
+                temperature=temperature,
+            ),
+            agent_config.retry_policy(),
+            is_failover_error,
+        )
+    
+    async def generate_with_memory(
+        self,
+        task_type: TaskType,
+        system_prompt: Optional[str] = None,
+        temperature: float = 0.7,
+        context_session: Optional[str] = None,
+    ) -> str:
+        """
+        Generate a response from the agent's memory
+        Older turns are summarized first if the window is over budget. With
+        context_session, the unchanged prompt prefix of earlier turns is
+        served from the provider's context cache; the window only shifts on
+        compaction, so the prefix stays stable between summaries. The reply
+        is added to memory, which is then saved for the request's session.
+        """
+        await self.load_memory()
+        await self.memory.compact()
+        messages = self.memory.prompt_messages(system_prompt)
+        reply = await run_with_retries(
+            lambda: self.llm_service.generate_with_history(
+                messages,
+                task=task_type,
+                temperature=temperature,
+                context_session=context_session,
+            ),
+            agent_config.retry_policy(),
+            is_failover_error,
         )
+        self.add_to_memory({"role": "assistant", "content": reply})
+        await self.save_memory()
+        return reply
 
 
 class AgentConfig:
@@ -61,6 +219,7 @@ class AgentConfig:
         self.retry_delay = 1.0
         self.timeout = 60.0
         self.max_memory_size = 100
+        self.max_memory_tokens = 6000
         
         # Agent-specific configurations
         self.research_agent = {
@@ -81,6 +240,11 @@ class AgentConfig:
             },
         }
         
+        self.pipeline = {
+            "max_concurrency": 4,
+            "timeout": 120.0,
+        }
+        
         self.evaluation_agent = {
             "criteria": [
                 "clarity",
@@ -90,6 +254,14 @@ class AgentConfig:
                 "handling_objections",
             ],
         }
+    
+    def retry_policy(self) -> RetryPolicy:
+        """Retry policy for agent LLM calls"""
+        return RetryPolicy(
+            max_retries=self.max_retries,
+            retry_delay=self.retry_delay,
+            timeout=self.timeout,
+        )
 
 
 # Global agent configuration
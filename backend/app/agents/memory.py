@@ -0,0 +1,141 @@
+"""
+Token-budgeted conversation memory for agents
+Keeps recent turns within a token budget and folds older turns into a
+running summary produced by a cheap model
+"""
+
+from collections import deque
+from typing import Optional, Dict, Any, List, Callable, Awaitable, Deque, Iterator, Tuple
+import logging
+
+from app.core.tokenizer import MESSAGE_OVERHEAD_TOKENS, count_tokens
+
+logger = logging.getLogger(__name__)
+
+Message = Dict[str, Any]
+Summarizer = Callable[[str, List[Message]], Awaitable[str]]
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+
+class ConversationMemory:
+    """
+    Sliding window of messages bounded by tokens rather than message count
+    append() is O(1) and keeps the prompt list up to date incrementally;
+    compact() summarizes evicted turns once the window overflows
+    """
+
+    def __init__(
+        self,
+        token_budget: int,
+        max_messages: int,
+        summarizer: Optional[Summarizer] = None,
+        count_tokens: Callable[[str], int] = count_tokens,
+        min_recent_messages: int = 2,
+    ):
+        self.token_budget = token_budget
+        self.max_messages = max_messages
+        self.summarizer = summarizer
+        self.count_tokens = count_tokens
+        self.min_recent_messages = min_recent_messages
+        self.summary = ""
+        self._summary_tokens = 0
+        self._window: Deque[Tuple[Message, int]] = deque()
+        self._window_tokens = 0
+        self._prompt: Optional[List[Message]] = None
+
+    def __iter__(self) -> Iterator[Message]:
+        return (message for message, _ in self._window)
+
+    def __len__(self) -> int:
+        return len(self._window)
+
+    @property
+    def tokens(self) -> int:
+        """Tokens the prompt currently needs: window plus summary"""
+        return self._window_tokens + self._summary_tokens
+
+    @property
+    def overflowing(self) -> bool:
+        return self.tokens > self.token_budget or len(self._window) > self.max_messages
+
+    def _message_tokens(self, message: Message) -> int:
+        return self.count_tokens(str(message.get("content", ""))) + MESSAGE_OVERHEAD_TOKENS
+
+    def append(self, message: Message) -> None:
+        """Add a message to the window"""
+        tokens = self._message_tokens(message)
+        self._window.append((message, tokens))
+        self._window_tokens += tokens
+        if self._prompt is not None:
+            self._prompt.append(message)
+
+    def dump(self) -> Dict[str, Any]:
+        """Summary and window as plain data, for persisting between requests"""
+        return {"summary": self.summary, "window": [[message, tokens] for message, tokens in self._window]}
+
+    def restore(self, state: Dict[str, Any]) -> None:
+        """
+        Load a dumped summary and window
+        Messages already in the window are kept and placed after the restored ones
+        """
+        pending = list(self._window)
+        self.clear()
+        self.summary = state.get("summary") or ""
+        if self.summary:
+            self._summary_tokens = self.count_tokens(self.summary) + MESSAGE_OVERHEAD_TOKENS
+        for message, tokens in [*(tuple(entry) for entry in state.get("window", [])), *pending]:
+            self._window.append((message, tokens))
+            self._window_tokens += tokens
+
+    def clear(self) -> None:
+        self._window.clear()
+        self._window_tokens = 0
+        self.summary = ""
+        self._summary_tokens = 0
+        self._prompt = None
+
+    def _evict(self) -> List[Message]:
+        """Pop oldest turns until the window fits in three quarters of the budget"""
+        target = self.token_budget * 3 // 4
+        evicted: List[Message] = []
+        while len(self._window) > self.min_recent_messages and (
+            self.tokens > target or len(self._window) > self.max_messages
+        ):
+            message, tokens = self._window.popleft()
+            self._window_tokens -= tokens
+            evicted.append(message)
+        return evicted
+
+    async def compact(self) -> None:
+        """Fold overflowing turns into the running summary"""
+        if not self.overflowing:
+            return
+        evicted = self._evict()
+        if not evicted:
+            return
+        self._prompt = None
+        if self.summarizer is None:
+            return
+        try:
+            self.summary = await self.summarizer(self.summary, evicted)
+        except Exception as exc:
+            # Losing detail is better than failing the turn
+            logger.warning("Memory summarization failed, dropping %d messages: %s", len(evicted), exc)
+            return
+        self._summary_tokens = self.count_tokens(self.summary) + MESSAGE_OVERHEAD_TOKENS
+
+    def prompt_messages(self, system_prompt: Optional[str] = None) -> List[Message]:
+        """
+        Messages to send: optional system prompt, summary, then recent turns
+        Built once and extended on append rather than rebuilt every turn
+        """
+        if self._prompt is None:
+            prompt: List[Message] = []
+            if self.summary:
+                prompt.append({"role": "system", "content": SUMMARY_PREFIX + self.summary})
+            prompt.extend(self)
+            self._prompt = prompt
+        if system_prompt:
+            return [{"role": "system", "content": system_prompt}, *self._prompt]
+        return list(self._prompt)
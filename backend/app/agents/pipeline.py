@@ -0,0 +1,302 @@
+"""
+Agent pipeline engine
+Runs agent steps as a dependency graph with bounded concurrency, streaming
+each step's result as soon as it finishes; streaming steps start right away
+and receive their dependencies' outputs one by one as they complete
+"""
+
+from dataclasses import dataclass
+from enum import Enum
+from typing import Optional, Dict, Any, List, Callable, Awaitable, AsyncIterator, Sequence, Union
+import asyncio
+import time
+
+from app.agents.base import AgentBase, agent_config
+from app.core.resilience import deadline_scope, remaining_time
+
+StepRunner = Union[AgentBase, Callable[[Any], Awaitable[Any]]]
+
+
+class StepStatus(str, Enum):
+    """Final state of a pipeline step"""
+    COMPLETED = "completed"
+    FAILED = "failed"
+    SKIPPED = "skipped"       # A required dependency did not complete
+    CANCELLED = "cancelled"   # The pipeline deadline was hit
+
+
+@dataclass
+class StepResult:
+    """Outcome of one pipeline step"""
+    name: str
+    status: StepStatus
+    output: Any = None
+    error: Optional[BaseException] = None
+    duration: float = 0.0
+
+
+_END = object()
+
+
+class DependencyStream:
+    """
+    Input of a streaming step: (dependency name, output) pairs in completion
+    order. Failed optional dependencies contribute nothing; iteration ends once
+    every dependency is final.
+    """
+
+    def __init__(self):
+        self._queue: "asyncio.Queue[Any]" = asyncio.Queue()
+
+    def put(self, name: str, output: Any) -> None:
+        self._queue.put_nowait((name, output))
+
+    def close(self) -> None:
+        self._queue.put_nowait(_END)
+
+    def __aiter__(self) -> "DependencyStream":
+        return self
+
+    async def __anext__(self) -> Any:
+        item = await self._queue.get()
+        if item is _END:
+            raise StopAsyncIteration
+        return item
+
+
+class PipelineStep:
+    """A node in the pipeline graph"""
+
+    def __init__(
+        self,
+        name: str,
+        runner: StepRunner,
+        depends_on: Sequence[str] = (),
+        build_input: Optional[Callable[[Any, Any], Any]] = None,
+        required: bool = True,
+        streaming: bool = False,
+    ):
+        self.name = name
+        self.runner = runner
+        self.depends_on = list(depends_on)
+        self.build_input = build_input
+        self.required = required
+        self.streaming = streaming
+
+    def input_for(self, pipeline_input: Any, outputs: Dict[str, Any]) -> Any:
+        """
+        Input for this step: build_input(pipeline_input, dependency outputs),
+        the pipeline input for root steps, or the dependency outputs by name
+        """
+        upstream: Any = {name: outputs[name] for name in self.depends_on if name in outputs}
+        if self.build_input:
+            return self.build_input(pipeline_input, upstream)
+        return upstream if self.depends_on else pipeline_input
+
+    def stream_input(self, pipeline_input: Any, upstream: DependencyStream) -> Any:
+        """Input for a streaming step: build_input(pipeline_input, stream), or the stream"""
+        if self.build_input:
+            return self.build_input(pipeline_input, upstream)
+        return upstream
+
+    async def run(self, input_data: Any) -> Any:
+        if isinstance(self.runner, AgentBase):
+            return await self.runner.process(input_data)
+        return await self.runner(input_data)
+
+
+class PipelineResult:
+    """Results of a complete pipeline run"""
+
+    def __init__(self, steps: Dict[str, StepResult], duration: float):
+        self.steps = steps
+        self.duration = duration
+
+    @property
+    def outputs(self) -> Dict[str, Any]:
+        return {name: r.output for name, r in self.steps.items() if r.status == StepStatus.COMPLETED}
+
+    @property
+    def succeeded(self) -> bool:
+        return all(r.status == StepStatus.COMPLETED for r in self.steps.values())
+
+    @property
+    def timed_out(self) -> bool:
+        return any(r.status == StepStatus.CANCELLED for r in self.steps.values())
+
+
+class AgentPipeline:
+    """Dependency-graph executor for agent steps"""
+
+    def __init__(self, name: str, max_concurrency: Optional[int] = None):
+        self.name = name
+        self.max_concurrency = max_concurrency or agent_config.pipeline["max_concurrency"]
+        self.steps: Dict[str, PipelineStep] = {}
+
+    def add_step(
+        self,
+        name: str,
+        runner: StepRunner,
+        depends_on: Sequence[str] = (),
+        build_input: Optional[Callable[[Any, Any], Any]] = None,
+        required: bool = True,
+        streaming: bool = False,
+    ) -> "AgentPipeline":
+        """
+        Add a step; required=False lets dependents run even if this step fails
+        streaming=True starts the step immediately with a DependencyStream of
+        its dependencies' outputs instead of waiting for all of them
+        """
+        if name in self.steps:
+            raise ValueError(f"Duplicate pipeline step: {name}")
+        self.steps[name] = PipelineStep(name, runner, depends_on, build_input, required, streaming)
+        return self
+
+    def validate(self) -> None:
+        """Check that dependencies exist and the graph has no cycles"""
+        for step in self.steps.values():
+            missing = [dep for dep in step.depends_on if dep not in self.steps]
+            if missing:
+                raise ValueError(f"Step {step.name} depends on unknown steps: {missing}")
+
+        remaining = {name: set(step.depends_on) for name, step in self.steps.items()}
+        while remaining:
+            ready = [name for name, deps in remaining.items() if not deps]
+            if not ready:
+                raise ValueError(f"Pipeline {self.name} has a dependency cycle: {sorted(remaining)}")
+            for name in ready:
+                del remaining[name]
+            for deps in remaining.values():
+                deps.difference_update(ready)
+
+    def _blocked(self, step: PipelineStep, results: Dict[str, StepResult]) -> bool:
+        """Whether a required dependency finished without completing"""
+        return any(
+            dep in results and results[dep].status != StepStatus.COMPLETED and self.steps[dep].required
+            for dep in step.depends_on
+        )
+
+    async def stream(self, input_data: Any, timeout: Optional[float] = None) -> AsyncIterator[StepResult]:
+        """
+        Run the graph and yield each StepResult as soon as it is final
+        A step starts once all of its dependencies are final; a streaming step
+        starts at once, is fed each dependency output as it completes and is
+        cancelled (SKIPPED) if a required dependency fails. Streaming steps
+        take no concurrency slot, since they mostly wait on their
+        dependencies. When the timeout (or the enclosing request deadline)
+        passes, running steps are cancelled and everything unfinished is
+        reported as CANCELLED.
+        """
+        self.validate()
+        budget = timeout if timeout is not None else agent_config.pipeline["timeout"]
+        remaining = remaining_time()
+        if remaining is not None:
+            budget = min(budget, remaining)
+        deadline = time.monotonic() + budget
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        results: Dict[str, StepResult] = {}
+        outputs: Dict[str, Any] = {}
+        started: Dict[str, float] = {}
+        running: Dict[asyncio.Task, str] = {}
+        feeds: Dict[str, DependencyStream] = {}
+        fed: Dict[str, set] = {}
+
+        async def run_step(step: PipelineStep, step_input: Any) -> Any:
+            async with semaphore:
+                started[step.name] = time.monotonic()
+                with deadline_scope(deadline - time.monotonic()):
+                    return await step.run(step_input)
+
+        async def run_streaming_step(step: PipelineStep, step_input: Any) -> Any:
+            started[step.name] = time.monotonic()
+            with deadline_scope(deadline - time.monotonic()):
+                return await step.run(step_input)
+
+        def feed(step: PipelineStep) -> None:
+            """Pass newly completed dependency outputs to a running streaming step"""
+            stream = feeds[step.name]
+            for dep in step.depends_on:
+                if dep in results and dep not in fed[step.name]:
+                    fed[step.name].add(dep)
+                    if dep in outputs:
+                        stream.put(dep, outputs[dep])
+            if len(fed[step.name]) == len(step.depends_on):
+                stream.close()
+
+        def finish(result: StepResult) -> StepResult:
+            results[result.name] = result
+            if result.status == StepStatus.COMPLETED:
+                outputs[result.name] = result.output
+            return result
+
+        try:
+            while len(results) < len(self.steps):
+                for step in self.steps.values():
+                    if step.name in results:
+                        continue
+                    if step.name in running.values():
+                        if step.name not in feeds:
+                            continue
+                        if self._blocked(step, results):
+                            task = next(task for task, name in running.items() if name == step.name)
+                            del running[task]
+                            task.cancel()
+                            await asyncio.gather(task, return_exceptions=True)
+                            yield finish(StepResult(step.name, StepStatus.SKIPPED))
+                        else:
+                            feed(step)
+                        continue
+                    if self._blocked(step, results):
+                        yield finish(StepResult(step.name, StepStatus.SKIPPED))
+                        continue
+                    if step.streaming:
+                        feeds[step.name] = DependencyStream()
+                        fed[step.name] = set()
+                        feed(step)
+                        step_input = step.stream_input(input_data, feeds[step.name])
+                        task = asyncio.create_task(run_streaming_step(step, step_input))
+                        running[task] = step.name
+                        continue
+                    if not all(dep in results for dep in step.depends_on):
+                        continue
+                    task = asyncio.create_task(run_step(step, step.input_for(input_data, outputs)))
+                    running[task] = step.name
+
+                if not running:
+                    continue
+
+                done, _ = await asyncio.wait(
+                    running,
+                    timeout=max(0.0, deadline - time.monotonic()),
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    break
+
+                for task in done:
+                    name = running.pop(task)
+                    duration = time.monotonic() - started.get(name, time.monotonic())
+                    if task.exception() is not None:
+                        yield finish(StepResult(name, StepStatus.FAILED, error=task.exception(), duration=duration))
+                    else:
+                        yield finish(StepResult(name, StepStatus.COMPLETED, output=task.result(), duration=duration))
+
+            # Deadline hit: cancel in-flight work and report whatever is left
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+            running.clear()
+            for name in self.steps:
+                if name not in results:
+                    yield finish(StepResult(name, StepStatus.CANCELLED))
+        finally:
+            # The consumer stopped early; don't leave orphaned work behind
+            for task in running:
+                task.cancel()
+
+    async def run(self, input_data: Any, timeout: Optional[float] = None) -> PipelineResult:
+        """Run the graph to completion (or deadline) and collect every result"""
+        started = time.monotonic()
+        steps = {result.name: result async for result in self.stream(input_data, timeout)}
+        return PipelineResult(steps, time.monotonic() - started)
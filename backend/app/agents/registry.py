@@ -0,0 +1,42 @@
+"""
+Agent registry
+Reuses agent instances across requests instead of constructing them per call
+"""
+
+from typing import Any, Dict, Tuple, Type, TypeVar
+
+from app.agents.base import AgentBase
+
+A = TypeVar("A", bound=AgentBase)
+
+
+class AgentRegistry:
+    """Shared agent instances keyed by class and construction arguments"""
+
+    def __init__(self):
+        self._agents: Dict[Tuple[type, Tuple[Tuple[str, Any], ...]], AgentBase] = {}
+
+    def __len__(self) -> int:
+        return len(self._agents)
+
+    def get(self, agent_cls: Type[A], **kwargs: Any) -> A:
+        """Return the shared instance for agent_cls and kwargs, creating it once"""
+        key = (agent_cls, tuple(sorted(kwargs.items())))
+        agent = self._agents.get(key)
+        if agent is None:
+            agent = agent_cls(**kwargs)
+            self._agents[key] = agent
+        return agent
+
+    def clear(self) -> None:
+        """Drop all shared instances"""
+        self._agents.clear()
+
+
+# Global agent registry instance
+agent_registry = AgentRegistry()
+
+
+def get_agent(agent_cls: Type[A], **kwargs: Any) -> A:
+    """Get a shared agent instance"""
+    return agent_registry.get(agent_cls, **kwargs)
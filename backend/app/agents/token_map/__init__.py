@@ -6,5 +6,6 @@ Token Map agents initialization
 # from .research_agent import ResearchAgent
 # from .analysis_agent import AnalysisAgent
 # from .visualization_agent import VisualizationAgent
+from .pipeline import build_token_map_pipeline
 
-__all__ = []
+__all__ = ["build_token_map_pipeline"]
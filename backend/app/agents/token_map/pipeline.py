@@ -0,0 +1,58 @@
+"""
+Token Map generation pipeline
+Independent research sub-queries fan out concurrently; analysis starts right
+away and takes each finding as its sub-query completes, followed by
+visualization
+"""
+
+from typing import Any, AsyncIterator, Dict, Tuple
+
+from app.agents.base import AgentBase
+from app.agents.pipeline import AgentPipeline
+
+# Research sub-queries that do not depend on each other
+RESEARCH_FOCUSES = (
+    "company_news",
+    "job_postings",
+    "tech_stack",
+    "provider_signals",
+)
+
+
+def _research_input(focus: str):
+    def build(company: Any, _: Dict[str, Any]) -> Dict[str, Any]:
+        return {"company": company, "focus": focus}
+    return build
+
+
+async def _findings(results: AsyncIterator[Tuple[str, Any]]) -> AsyncIterator[Tuple[str, Any]]:
+    """(focus, finding) pairs in the order the research sub-queries complete"""
+    async for step, output in results:
+        yield step.split(":", 1)[1], output
+
+
+def build_token_map_pipeline(
+    research_agent: AgentBase,
+    analysis_agent: AgentBase,
+    visualization_agent: AgentBase,
+) -> AgentPipeline:
+    """
+    Wire the Research -> Analysis -> Visualization agents into a graph
+    Analysis receives findings as an async iterator of (focus, finding) so it
+    can work on early results while slower sub-queries are still running; a
+    failed sub-query does not block it, it just contributes nothing
+    """
+    pipeline = AgentPipeline("token_map")
+    research_steps = [f"research:{focus}" for focus in RESEARCH_FOCUSES]
+    for focus, step in zip(RESEARCH_FOCUSES, research_steps):
+        pipeline.add_step(step, research_agent, build_input=_research_input(focus), required=False)
+
+    pipeline.add_step(
+        "analysis",
+        analysis_agent,
+        depends_on=research_steps,
+        build_input=lambda company, results: {"company": company, "findings": _findings(results)},
+        streaming=True,
+    )
+    pipeline.add_step("visualization", visualization_agent, depends_on=["analysis"])
+    return pipeline
@@ -4,12 +4,13 @@ API routes initialization
 
 from fastapi import APIRouter
 
-from app.api.routes import health
+from app.api.routes import health, metrics
 
 api_router = APIRouter()
 
 # Include all route modules
 api_router.include_router(health.router, prefix="/health", tags=["health"])
+api_router.include_router(metrics.router, prefix="/metrics", tags=["metrics"])
 
 # Future routes will be added here:
 # api_router.include_router(customers.router, prefix="/customers", tags=["customers"])
@@ -2,6 +2,6 @@
 API routes module initialization
 """
 
-from . import health
+from . import health, metrics
 
-__all__ = ["health"]
+__all__ = ["health", "metrics"]
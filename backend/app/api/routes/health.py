@@ -4,6 +4,10 @@ Health check routes
 
 from fastapi import APIRouter
 
+from app.core.cache import cache_manager
+from app.core.database import pool_stats
+from app.core.llm import llm_service
+
 router = APIRouter()
 
 
@@ -44,3 +48,85 @@ async def liveness_check():
     Simple ping to verify the service is running
     """
     return {"status": "alive"}
+
+
+@router.get("/llm-pool")
+async def llm_pool_stats():
+    """
+    LLM connection pool statistics
+    Reports in-flight requests and saturation per provider
+    """
+    return {"providers": llm_service.pool_stats()}
+
+
+@router.get("/cache")
+async def cache_stats():
+    """
+    Cache statistics
+    Reports in-process (L1) and Redis (L2) hit rates
+    """
+    return cache_manager.stats()
+
+
+@router.get("/llm-budget")
+async def llm_budget():
+    """
+    LLM rate-limit budget
+    Reports remaining requests and tokens per model for the current minute
+    """
+    return {"models": await llm_service.remaining_budget()}
+
+
+@router.get("/llm-routing")
+async def llm_routing_stats():
+    """
+    LLM routing statistics
+    Reports rolling latency, error rate and cost per model
+    """
+    return llm_service.routing_stats()
+
+
+@router.get("/llm-usage")
+async def llm_usage():
+    """
+    LLM usage statistics
+    Reports calls, tokens, cost and cache hits per model and task, and how
+    many records the telemetry buffer dropped before they were persisted
+    """
+    return llm_service.telemetry.snapshot()
+
+
+@router.get("/llm-scheduler")
+async def llm_scheduler_stats():
+    """
+    LLM scheduler statistics
+    Reports active slots, queue depth, rejections and average wait per class
+    """
+    return llm_service.scheduler.stats()
+
+
+@router.get("/embeddings")
+async def embedding_stats():
+    """
+    Embedding statistics
+    Reports vector cache hits and misses, provider requests and stored vectors
+    """
+    return llm_service.embeddings.stats()
+
+
+@router.get("/context-cache")
+async def context_cache_stats():
+    """
+    Context cache statistics
+    Reports session prefix hits and misses and prompt tokens served from cache
+    """
+    return llm_service.context_cache.stats()
+
+
+@router.get("/database")
+async def database_pool_stats():
+    """
+    Database pool statistics
+    Reports this worker's pool size, connections in use and checkout waits
+    """
+    return pool_stats()
@@ -0,0 +1,26 @@
+"""
+Metrics routes
+"""
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.core.database import render_pool_prometheus
+from app.core.llm import llm_service
+
+router = APIRouter()
+
+
+@router.get("", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """
+    Prometheus scrape endpoint
+    Exposes LLM call, token, cost, latency and queueing metrics, and database
+    pool usage, in text format
+    """
+    return PlainTextResponse(
+        llm_service.telemetry.render_prometheus()
+        + llm_service.scheduler.render_prometheus()
+        + render_pool_prometheus(),
+        media_type="text/plain; version=0.0.4",
+    )
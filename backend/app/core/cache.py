@@ -2,23 +2,171 @@
 Redis cache manager for caching LLM responses and session data
 """
 
+import asyncio
 import json
-from typing import Optional, Any
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Optional, Any, Dict, Tuple, List, Iterable, Callable, AsyncIterator
 from datetime import timedelta
 
 import redis.asyncio as redis
 from redis.asyncio import Redis
+from redis.asyncio.client import Pipeline
+from redis.exceptions import RedisError
 
 from app.core.config import get_settings
 
 settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Key prefixes eligible for the in-process tier, with their local TTL in
+# seconds. Keys without a matching prefix (e.g. rate-limit counters) always
+# go to Redis.
+L1_PREFIX_POLICIES: Dict[str, float] = {
+    "session:": 60,
+    "llm:": 300,
+    "retrieval:": 300,
+}
+
+INVALIDATION_CHANNEL = "cache:invalidate"
+
+# Delete a lock only if it still holds the caller's token
+RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+# Increment a fixed-window counter and start its window in one round trip
+INCREMENT_WINDOW_SCRIPT = """
+local current = redis.call("incr", KEYS[1])
+if current == 1 then
+    redis.call("expire", KEYS[1], ARGV[1])
+end
+return current
+"""
+
+
+def _decode(value: Optional[str]) -> Optional[Any]:
+    """Decode a stored value, falling back to the raw string"""
+    if not value:
+        return None
+    try:
+        return json.loads(value)
+    except json.JSONDecodeError:
+        return value
+
+
+def _encode(value: Any) -> Any:
+    return json.dumps(value) if isinstance(value, (dict, list)) else value
+
+
+class LocalCache:
+    """Bounded in-process LRU cache with per-entry expiry"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """Return (found, value); expired entries count as missing"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return False, None
+        self._entries.move_to_end(key)
+        return True, value
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+class CachePipeline:
+    """
+    Cache commands queued and sent in a single round trip
+    Values are encoded/decoded like CacheManager; results are available on
+    .results once the pipeline has executed
+    """
+
+    def __init__(self, manager: "CacheManager", pipe: Pipeline):
+        self._manager = manager
+        self._pipe = pipe
+        self._decoders: List[Callable[[Any], Any]] = []
+        self.touched: set = set()
+        self.results: List[Any] = []
+
+    def get(self, key: str) -> "CachePipeline":
+        self._pipe.get(key)
+        self._decoders.append(_decode)
+        return self
+
+    def set(self, key: str, value: Any, expire: Optional[int] = None) -> "CachePipeline":
+        self._pipe.set(key, _encode(value), ex=expire or settings.SESSION_EXPIRE_HOURS * 3600)
+        self._decoders.append(bool)
+        self.touched.add(key)
+        return self
+
+    def delete(self, *keys: str) -> "CachePipeline":
+        self._pipe.delete(*keys)
+        self._decoders.append(int)
+        self.touched.update(keys)
+        return self
+
+    def expire(self, key: str, seconds: int) -> "CachePipeline":
+        self._pipe.expire(key, seconds)
+        self._decoders.append(bool)
+        self.touched.add(key)
+        return self
+
+    def incr(self, key: str, amount: int = 1) -> "CachePipeline":
+        self._pipe.incrby(key, amount)
+        self._decoders.append(int)
+        self.touched.add(key)
+        return self
+
+    async def execute(self) -> List[Any]:
+        """Send queued commands plus any L1 invalidations"""
+        self._manager._queue_invalidations(self._pipe, self.touched)
+        raw = await self._pipe.execute()
+        self.results = [decode(value) for decode, value in zip(self._decoders, raw)]
+        self._decoders, self.touched = [], set()
+        return self.results
 
 
 class CacheManager:
-    """Redis cache manager for caching responses and session data"""
+    """
+    Redis cache manager for caching responses and session data
+    With the L1 tier enabled, values for keys matching L1_PREFIX_POLICIES are
+    also kept in process; returned objects are shared and must be treated as
+    read-only.
+    """
 
-    def __init__(self):
+    def __init__(self, l1_enabled: Optional[bool] = None):
         self._client: Optional[Redis] = None
+        enabled = settings.CACHE_L1_ENABLED if l1_enabled is None else l1_enabled
+        self._local: Optional[LocalCache] = LocalCache(settings.CACHE_L1_MAX_ENTRIES) if enabled else None
+        self._worker_id = uuid.uuid4().hex
+        self._listener: Optional[asyncio.Task] = None
+        self._stats = {"l1_hits": 0, "l2_hits": 0, "misses": 0}
 
     async def connect(self) -> None:
         """Connect to Redis server"""
@@ -29,13 +177,28 @@ class CacheManager:
                 encoding="utf-8",
                 decode_responses=True,
             )
+        await self.start_invalidation_listener()
 
     async def disconnect(self) -> None:
         """Disconnect from Redis server"""
+        if self._listener:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        if self._local:
+            self._local.clear()
         if self._client:
             await self._client.close()
             self._client = None
 
+    @property
+    def is_connected(self) -> bool:
+        """Whether connect() has been called"""
+        return self._client is not None
+
     @property
     def client(self) -> Redis:
         """Get Redis client"""
@@ -43,14 +206,86 @@ class CacheManager:
             raise RuntimeError("Redis client not connected. Call connect() first.")
         return self._client
 
+    # In-process tier
+    async def start_invalidation_listener(self) -> None:
+        """Subscribe to cross-worker invalidations when the L1 tier is on"""
+        if self._local is not None and self._listener is None:
+            self._listener = asyncio.create_task(self._listen_invalidations())
+
+    async def _listen_invalidations(self) -> None:
+        """Drop L1 entries that another worker has changed"""
+        while True:
+            try:
+                pubsub = self.client.pubsub()
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+                try:
+                    async for message in pubsub.listen():
+                        if message.get("type") != "message":
+                            continue
+                        origin, _, key = message["data"].partition(":")
+                        if origin != self._worker_id:
+                            self._local.invalidate(key)
+                finally:
+                    await pubsub.aclose()
+            except asyncio.CancelledError:
+                raise
+            except (RedisError, OSError) as exc:
+                # Invalidations may have been missed while disconnected
+                logger.warning("Cache invalidation listener failed: %s", exc)
+                self._local.clear()
+                await asyncio.sleep(1.0)
+
+    def _l1_ttl(self, key: str) -> Optional[float]:
+        """Local TTL for a key, or None if it is not eligible for L1"""
+        if self._local is None:
+            return None
+        for prefix, ttl in L1_PREFIX_POLICIES.items():
+            if key.startswith(prefix):
+                return ttl
+        return None
+
+    def _queue_invalidations(self, pipe: Pipeline, keys: Iterable[str]) -> None:
+        """Drop keys locally and queue their cross-worker invalidation on pipe"""
+        for key in keys:
+            if self._l1_ttl(key) is None:
+                continue
+            self._local.invalidate(key)
+            pipe.publish(INVALIDATION_CHANNEL, f"{self._worker_id}:{key}")
+
+    async def _invalidate(self, key: str) -> None:
+        """Drop a key locally and tell other workers to do the same"""
+        if self._l1_ttl(key) is None:
+            return
+        self._local.invalidate(key)
+        await self.client.publish(INVALIDATION_CHANNEL, f"{self._worker_id}:{key}")
+
+    def stats(self) -> Dict[str, Any]:
+        """L1/L2 hit counters and rates"""
+        lookups = sum(self._stats.values())
+        return {
+            **self._stats,
+            "l1_entries": len(self._local) if self._local else 0,
+            "l1_hit_rate": round(self._stats["l1_hits"] / lookups, 4) if lookups else 0.0,
+            "l2_hit_rate": round(self._stats["l2_hits"] / lookups, 4) if lookups else 0.0,
+            "hit_rate": round((lookups - self._stats["misses"]) / lookups, 4) if lookups else 0.0,
+        }
+
     async def get(self, key: str) -> Optional[Any]:
         """Get value from cache"""
-        value = await self.client.get(key)
-        if value:
-            try:
-                return json.loads(value)
-            except json.JSONDecodeError:
+        l1_ttl = self._l1_ttl(key)
+        if l1_ttl is not None:
+            found, value = self._local.get(key)
+            if found:
+                self._stats["l1_hits"] += 1
                 return value
+
+        value = _decode(await self.client.get(key))
+        if value is not None:
+            self._stats["l2_hits"] += 1
+            if l1_ttl is not None:
+                self._local.set(key, value, l1_ttl)
+            return value
+        self._stats["misses"] += 1
         return None
 
     async def set(
@@ -60,15 +295,21 @@ class CacheManager:
         expire: Optional[int] = None,
     ) -> bool:
         """Set value in cache with optional expiration"""
-        if isinstance(value, (dict, list)):
-            value = json.dumps(value)
-        
         ttl = expire or settings.SESSION_EXPIRE_HOURS * 3600
-        return await self.client.set(key, value, ex=ttl)
+        l1_ttl = self._l1_ttl(key)
+        if l1_ttl is None:
+            return await self.client.set(key, _encode(value), ex=ttl)
+
+        async with self.pipeline(transaction=False) as pipe:
+            pipe.set(key, value, ttl)
+        self._local.set(key, value, min(l1_ttl, ttl))
+        return pipe.results[0]
 
     async def delete(self, key: str) -> bool:
         """Delete key from cache"""
-        return await self.client.delete(key) > 0
+        deleted = await self.client.delete(key) > 0
+        await self._invalidate(key)
+        return deleted
 
     async def exists(self, key: str) -> bool:
         """Check if key exists"""
@@ -76,12 +317,119 @@ class CacheManager:
 
     async def expire(self, key: str, seconds: int) -> bool:
         """Set expiration on key"""
-        return await self.client.expire(key, seconds)
+        result = await self.client.expire(key, seconds)
+        await self._invalidate(key)
+        return result
 
     async def ttl(self, key: str) -> int:
         """Get time-to-live for key"""
         return await self.client.ttl(key)
 
+    # Bulk Operations
+    @asynccontextmanager
+    async def pipeline(self, transaction: bool = True) -> AsyncIterator[CachePipeline]:
+        """
+        Queue commands and send them in one round trip on exit
+        With transaction=True the commands run atomically in MULTI/EXEC
+        """
+        async with self.client.pipeline(transaction=transaction) as pipe:
+            cache_pipe = CachePipeline(self, pipe)
+            yield cache_pipe
+            await cache_pipe.execute()
+
+    async def get_many(self, keys: List[str]) -> Dict[str, Optional[Any]]:
+        """Get several values in one round trip; missing keys map to None"""
+        values: Dict[str, Optional[Any]] = {}
+        remote: List[str] = []
+        for key in keys:
+            if self._l1_ttl(key) is not None:
+                found, value = self._local.get(key)
+                if found:
+                    self._stats["l1_hits"] += 1
+                    values[key] = value
+                    continue
+            remote.append(key)
+
+        if remote:
+            for key, raw in zip(remote, await self.client.mget(remote)):
+                value = _decode(raw)
+                values[key] = value
+                if value is None:
+                    self._stats["misses"] += 1
+                    continue
+                self._stats["l2_hits"] += 1
+                l1_ttl = self._l1_ttl(key)
+                if l1_ttl is not None:
+                    self._local.set(key, value, l1_ttl)
+        return {key: values[key] for key in keys}
+
+    async def set_many(self, mapping: Dict[str, Any], expire: Optional[int] = None) -> bool:
+        """Set several values with a shared expiration in one round trip"""
+        if not mapping:
+            return True
+        async with self.pipeline(transaction=False) as pipe:
+            for key, value in mapping.items():
+                pipe.set(key, value, expire)
+        return all(pipe.results)
+
+    async def delete_many(self, keys: List[str]) -> int:
+        """Delete several keys in one round trip; returns the number removed"""
+        if not keys:
+            return 0
+        async with self.pipeline(transaction=False) as pipe:
+            pipe.delete(*keys)
+        return pipe.results[0]
+
+    # Capped Lists
+    async def extend_list(
+        self,
+        key: str,
+        values: List[Any],
+        max_length: int,
+        expire: Optional[int] = None,
+    ) -> bool:
+        """
+        Append to an existing list, keeping only its newest max_length items
+        Returns False without writing if the list does not exist, so a
+        partial list is never started from the middle
+        """
+        ttl = expire or settings.SESSION_EXPIRE_HOURS * 3600
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.rpushx(key, *(_encode(value) for value in values))
+            pipe.ltrim(key, -max_length, -1)
+            pipe.expire(key, ttl)
+            length, _, _ = await pipe.execute()
+        return length > 0
+
+    async def push_list(
+        self,
+        key: str,
+        values: List[Any],
+        max_length: int,
+        expire: Optional[int] = None,
+    ) -> None:
+        """Append to a list, creating it if needed, keeping only its newest max_length items"""
+        ttl = expire or settings.SESSION_EXPIRE_HOURS * 3600
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.rpush(key, *(_encode(value) for value in values))
+            pipe.ltrim(key, -max_length, -1)
+            pipe.expire(key, ttl)
+            await pipe.execute()
+
+    async def replace_list(self, key: str, values: List[Any], expire: Optional[int] = None) -> None:
+        """Atomically replace a list's contents"""
+        ttl = expire or settings.SESSION_EXPIRE_HOURS * 3600
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.delete(key)
+            if values:
+                pipe.rpush(key, *(_encode(value) for value in values))
+                pipe.expire(key, ttl)
+            await pipe.execute()
+
+    async def get_list(self, key: str) -> List[Any]:
+        """All items of a list, oldest first"""
+        return [_decode(raw) for raw in await self.client.lrange(key, 0, -1)]
+
     # LLM Response Caching
     async def get_llm_response(self, prompt_hash: str) -> Optional[dict]:
         """Get cached LLM response by prompt hash"""
@@ -120,13 +468,45 @@ class CacheManager:
         key = f"session:{session_id}"
         return await self.delete(key)
 
+    # Distributed Leases
+    async def acquire_lock(self, name: str, ttl: int) -> Optional[str]:
+        """Try to take a lease for ttl seconds; returns its token or None"""
+        token = uuid.uuid4().hex
+        acquired = await self.client.set(f"lock:{name}", token, nx=True, ex=ttl)
+        return token if acquired else None
+
+    async def release_lock(self, name: str, token: str) -> bool:
+        """Release a lease held with token"""
+        released = await self.client.eval(RELEASE_LOCK_SCRIPT, 1, f"lock:{name}", token)
+        return released == 1
+
+    async def wait_for(
+        self,
+        key: str,
+        lock_name: str,
+        timeout: float,
+        poll_interval: float = 0.05,
+    ) -> Optional[Any]:
+        """
+        Wait for another worker to fill key while it holds lock_name
+        Returns None if the lease ends or timeout passes without a value
+        """
+        deadline = time.monotonic() + timeout
+        delay = poll_interval
+        while time.monotonic() < deadline:
+            value = await self.get(key)
+            if value is not None:
+                return value
+            if not await self.exists(f"lock:{lock_name}"):
+                return await self.get(key)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 1.0)
+        return None
+
     # Rate Limiting
     async def increment_rate_limit(self, key: str, window: int = 60) -> int:
         """Increment rate limit counter and return current count"""
-        current = await self.client.incr(key)
-        if current == 1:
-            await self.client.expire(key, window)
-        return current
+        return await self.client.eval(INCREMENT_WINDOW_SCRIPT, 1, key, window)
 
 
 # Global cache manager instance
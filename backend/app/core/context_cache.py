@@ -0,0 +1,152 @@
+"""
+Prompt-prefix reuse for multi-turn sessions
+Tracks which prefix of each session's prompt the provider already holds in
+its context cache, marks the next cache breakpoint on outgoing messages and
+reports how many prompt tokens the cache will serve
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Dict, Any, List
+import hashlib
+import json
+import logging
+import time
+
+from redis.exceptions import RedisError
+
+from app.core.cache import CacheManager
+from app.core.config import get_settings
+from app.core.tokenizer import MESSAGE_OVERHEAD_TOKENS, Tokenizer
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Marker the provider treats as the end of a cacheable prefix
+CACHE_MARKER = {"type": "ephemeral"}
+
+
+def prefix_hashes(messages: List[Dict[str, Any]]) -> List[str]:
+    """Chained hash per message: equal hashes at i mean equal prefixes up to i"""
+    hashes: List[str] = []
+    previous = ""
+    for message in messages:
+        canonical = json.dumps(
+            [previous, message.get("role"), message.get("content")], ensure_ascii=False, separators=(",", ":")
+        )
+        previous = hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:32]
+        hashes.append(previous)
+    return hashes
+
+
+@dataclass
+class PrefixPlan:
+    """How one request reuses, and extends, its session's cached prefix"""
+    key: str
+    messages: List[Dict[str, Any]]     # Outgoing messages, breakpoint marked
+    cached_tokens: int                 # Prompt tokens expected from the cache
+    prefix_length: int = 0             # Messages up to and including the breakpoint
+    prefix_hash: Optional[str] = None
+    prefix_tokens: int = 0
+
+
+class ContextCache:
+    """
+    Per-session record of the provider-side cached prompt prefix
+    Each request marks its last message as a cache breakpoint, so the next
+    turn, which repeats this prompt and appends to it, is prefilled from the
+    cache. Only one hash and length per session is stored; a changed prefix
+    (e.g. after memory compaction) simply starts a new cached block. Records
+    live in Redis and fall back to process memory when it is unavailable.
+    """
+
+    def __init__(self, cache: CacheManager):
+        self.cache = cache
+        self._local: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.cached_tokens_total = 0
+
+    @staticmethod
+    def _key(session: str, model: str) -> str:
+        return f"ctxcache:{model}:{session}"
+
+    async def _load(self, key: str) -> Optional[Dict[str, Any]]:
+        state = None
+        if self.cache.is_connected:
+            try:
+                state = await self.cache.get(key)
+            except RedisError as exc:
+                logger.warning("Context cache lookup failed: %s", exc)
+        if state is None:
+            state = self._local.get(key)
+        if state is None or state["expires"] < time.time():
+            return None
+        return state
+
+    async def _save(self, key: str, state: Dict[str, Any]) -> None:
+        self._local[key] = state
+        self._local.move_to_end(key)
+        while len(self._local) > settings.CONTEXT_CACHE_LOCAL_SESSIONS:
+            self._local.popitem(last=False)
+        if self.cache.is_connected:
+            try:
+                await self.cache.set(key, state, settings.CONTEXT_CACHE_TTL)
+            except RedisError as exc:
+                logger.warning("Context cache write failed: %s", exc)
+
+    async def plan(
+        self,
+        session: str,
+        model: str,
+        messages: List[Dict[str, Any]],
+        tokenizer: Tokenizer,
+        supported: bool = True,
+    ) -> PrefixPlan:
+        """
+        Cached tokens for this request and the messages to send
+        Models without context caching get an unmarked plan with no savings
+        """
+        key = self._key(session, model)
+        if not (settings.CONTEXT_CACHE_ENABLED and supported and messages):
+            return PrefixPlan(key, messages, 0)
+
+        hashes = prefix_hashes(messages)
+        cached_tokens = 0
+        state = await self._load(key)
+        if state is not None and state["length"] <= len(messages) and hashes[state["length"] - 1] == state["hash"]:
+            cached_tokens = state["tokens"]
+            self.hits += 1
+        else:
+            self.misses += 1
+
+        prefix_tokens = sum(
+            tokenizer.count(str(message.get("content", ""))) + MESSAGE_OVERHEAD_TOKENS for message in messages
+        )
+        if prefix_tokens < settings.CONTEXT_CACHE_MIN_TOKENS:
+            # The provider does not cache prefixes this short
+            return PrefixPlan(key, messages, cached_tokens)
+
+        marked = list(messages)
+        marked[-1] = {**marked[-1], "cache_control": CACHE_MARKER}
+        return PrefixPlan(key, marked, cached_tokens, len(messages), hashes[-1], prefix_tokens)
+
+    async def commit(self, plan: PrefixPlan) -> None:
+        """Record the prefix a successful request left in the provider's cache"""
+        self.cached_tokens_total += plan.cached_tokens
+        if plan.prefix_hash is None:
+            return
+        await self._save(plan.key, {
+            "length": plan.prefix_length,
+            "hash": plan.prefix_hash,
+            "tokens": plan.prefix_tokens,
+            "expires": time.time() + settings.CONTEXT_CACHE_TTL,
+        })
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "cached_tokens": self.cached_tokens_total,
+            "local_sessions": len(self._local),
+        }
@@ -1,24 +1,172 @@
 """
 Database connection module
-SQLAlchemy async setup with PostgreSQL
+SQLAlchemy async setup with PostgreSQL, with per-worker pool sizing and
+pool checkout metrics
 """
 
+from typing import Dict, Any, List, Tuple
+import os
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
-from sqlalchemy.pool import NullPool
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, Pool, QueuePool
 
-from app.core.config import get_settings
+from app.core.config import Settings, get_settings
+from app.core.telemetry import Histogram, format_labels
 
 settings = get_settings()
 
+METRIC_PREFIX = "tokenholic_db"
+
+# Checkout waits are usually sub-millisecond; the tail is what matters
+POOL_WAIT_BUCKETS: Tuple[float, ...] = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _pool_gauges(pool: QueuePool) -> Dict[str, int]:
+    # overflow() counts up from -size while the pool is still filling
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "idle": pool.checkedin(),
+        "overflow": max(0, pool.overflow()),
+    }
+
+
+class PoolMetrics:
+    """Checkout waits, timeouts and new connections for this worker's pool"""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.connects = 0
+        self.wait_seconds = Histogram(POOL_WAIT_BUCKETS)
+
+    def stats(self, pool: Pool) -> Dict[str, Any]:
+        stats: Dict[str, Any] = {
+            "worker": os.getpid(),
+            "pool": type(pool).__name__,
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "connects": self.connects,
+            "avg_wait_ms": round(self.wait_seconds.sum / self.wait_seconds.count * 1000, 3)
+            if self.wait_seconds.count else 0.0,
+        }
+        if isinstance(pool, QueuePool):
+            stats.update(_pool_gauges(pool))
+        return stats
+
+    def render_prometheus(self, pool: Pool) -> str:
+        """Pool gauges, counters and the checkout wait histogram, labelled by worker"""
+        worker = str(os.getpid())
+        labels = format_labels(worker=worker)
+        lines: List[str] = []
+        if isinstance(pool, QueuePool):
+            gauges = _pool_gauges(pool)
+            for gauge, help_text in (
+                ("size", "Connections the pool keeps open when idle"),
+                ("checked_out", "Connections currently in use"),
+                ("idle", "Open connections waiting in the pool"),
+                ("overflow", "Connections open beyond the pool size"),
+            ):
+                lines.append(f"# HELP {METRIC_PREFIX}_pool_{gauge} {help_text}")
+                lines.append(f"# TYPE {METRIC_PREFIX}_pool_{gauge} gauge")
+                lines.append(f"{METRIC_PREFIX}_pool_{gauge}{labels} {gauges[gauge]}")
+        for name, value, help_text in (
+            ("pool_checkouts_total", self.checkouts, "Connections handed out by the pool"),
+            ("pool_timeouts_total", self.timeouts, "Checkouts that gave up waiting for a connection"),
+            ("connections_opened_total", self.connects, "New database connections established"),
+        ):
+            lines.append(f"# HELP {METRIC_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name} counter")
+            lines.append(f"{METRIC_PREFIX}_{name}{labels} {value}")
+
+        name = f"{METRIC_PREFIX}_pool_wait_seconds"
+        lines.append(f"# HELP {name} Time to obtain a connection, including opening one")
+        lines.append(f"# TYPE {name} histogram")
+        for le, count in self.wait_seconds.cumulative():
+            lines.append(f"{name}_bucket{format_labels(worker=worker, le=le)} {count}")
+        lines.append(f"{name}_sum{labels} {self.wait_seconds.sum:.6f}")
+        lines.append(f"{name}_count{labels} {self.wait_seconds.count}")
+        return "\n".join(lines) + "\n"
+
+
+# Metrics for this process's engine
+pool_metrics = PoolMetrics()
+
+
+class _InstrumentedPool:
+    """Times every checkout; metrics is a class attribute so pool.recreate() keeps it"""
+
+    metrics: PoolMetrics = pool_metrics
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            record = super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.timeouts += 1
+            raise
+        self.metrics.checkouts += 1
+        self.metrics.wait_seconds.observe(time.perf_counter() - start)
+        return record
+
+    def _create_connection(self):
+        self.metrics.connects += 1
+        return super()._create_connection()
+
+
+class InstrumentedQueuePool(_InstrumentedPool, AsyncAdaptedQueuePool):
+    pass
+
+
+class InstrumentedNullPool(_InstrumentedPool, NullPool):
+    pass
+
+
+def pool_sizes(config: Settings = settings) -> Tuple[int, int]:
+    """
+    Pool size and overflow for one worker
+    With DATABASE_MAX_CONNECTIONS set, the configured sizes are capped so all
+    WEB_CONCURRENCY workers together stay within that budget
+    """
+    pool_size, overflow = config.DATABASE_POOL_SIZE, config.DATABASE_MAX_OVERFLOW
+    if config.DATABASE_MAX_CONNECTIONS:
+        budget = max(1, config.DATABASE_MAX_CONNECTIONS // max(1, config.WEB_CONCURRENCY))
+        pool_size = min(pool_size, budget)
+        overflow = max(0, min(overflow, budget - pool_size))
+    return pool_size, overflow
+
+
+def engine_options(config: Settings = settings) -> Dict[str, Any]:
+    """Keyword arguments for create_async_engine; independent of DEBUG"""
+    options: Dict[str, Any] = {"echo": config.DATABASE_ECHO}
+    if config.DATABASE_POOLING:
+        pool_size, overflow = pool_sizes(config)
+        options.update(
+            poolclass=InstrumentedQueuePool,
+            pool_size=pool_size,
+            max_overflow=overflow,
+            pool_timeout=config.DATABASE_POOL_TIMEOUT,
+            pool_recycle=config.DATABASE_POOL_RECYCLE,
+            pool_pre_ping=config.DATABASE_POOL_PRE_PING,
+        )
+    else:
+        options["poolclass"] = InstrumentedNullPool
+    if make_url(config.DATABASE_URL).get_driver_name() == "asyncpg":
+        # Both caches must be off behind PgBouncer in transaction mode, where
+        # consecutive transactions may run on different server connections
+        options["connect_args"] = {
+            "prepared_statement_cache_size": config.DATABASE_STATEMENT_CACHE_SIZE,
+            "statement_cache_size": config.DATABASE_STATEMENT_CACHE_SIZE,
+        }
+    return options
+
+
 # Create async engine
-engine = create_async_engine(
-    settings.DATABASE_URL,
-    echo=settings.DEBUG,
-    pool_size=settings.DATABASE_POOL_SIZE,
-    max_overflow=settings.DATABASE_MAX_OVERFLOW,
-    poolclass=NullPool if settings.DEBUG else None,
-)
+engine = create_async_engine(settings.DATABASE_URL, **engine_options())
 
 # Create async session factory
 async_session_maker = async_sessionmaker(
@@ -58,3 +206,12 @@ async def init_db():
 async def close_db():
     """Close database connections"""
     await engine.dispose()
+
+
+def pool_stats() -> Dict[str, Any]:
+    """Pool usage for this worker"""
+    return pool_metrics.stats(engine.pool)
+
+
+def render_pool_prometheus() -> str:
+    return pool_metrics.render_prometheus(engine.pool)
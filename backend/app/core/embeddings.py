@@ -0,0 +1,304 @@
+"""
+Embedding service
+Batches texts up to the provider's per-request limit, runs batches with
+bounded concurrency and caches vectors on disk by content hash, so
+re-embedding unchanged text costs no API calls
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional, Dict, Any, List, Iterable, Tuple
+import asyncio
+import hashlib
+import logging
+import sqlite3
+
+import numpy as np
+
+from app.core.config import get_settings
+from app.core.llm_transport import LLMTransport
+from app.core.resilience import call_timeout
+from app.core.telemetry import CallTrace
+from app.core.tokenizer import get_tokenizer
+
+if TYPE_CHECKING:
+    from app.core.rate_limit import LLMRateLimiter
+    from app.core.telemetry import LLMTelemetry
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+# Provider limits per embedding model
+EMBEDDING_MODELS: Dict[str, Dict[str, Any]] = {
+    "text-embedding-v3": {
+        "provider": "dashscope",
+        "batch_size": 10,           # Texts per request
+        "max_input_tokens": 8192,   # Per text; longer texts are truncated
+        "rpm": 1800,
+        "tpm": 1200000,
+        "input_price": 0.0005,      # CNY per 1K tokens
+    },
+    "text-embedding-v2": {
+        "provider": "dashscope",
+        "batch_size": 25,
+        "max_input_tokens": 2048,
+        "rpm": 1800,
+        "tpm": 1200000,
+        "input_price": 0.0007,
+    },
+}
+
+# Vector encodings the on-disk cache supports
+STORE_DTYPES = ("float16", "int8")
+
+
+def content_key(model: str, dimensions: int, text: str) -> bytes:
+    """Cache key for one text; changing model or dimensions invalidates it"""
+    return hashlib.sha256(f"{model}\x00{dimensions}\x00{text}".encode("utf-8")).digest()
+
+
+def encode_vector(vector: np.ndarray, dtype: str) -> Tuple[float, bytes]:
+    """
+    Compact encoding of a vector as (scale, payload)
+    float16 halves the size; int8 quarters it with one scale per vector
+    """
+    vector = np.asarray(vector, dtype=np.float32)
+    if dtype == "int8":
+        peak = float(np.abs(vector).max()) if vector.size else 0.0
+        scale = peak / 127 if peak else 1.0
+        return scale, np.clip(np.rint(vector / scale), -127, 127).astype(np.int8).tobytes()
+    return 1.0, vector.astype("<f2").tobytes()
+
+
+def decode_vector(scale: float, payload: bytes, dtype: str) -> np.ndarray:
+    if dtype == "int8":
+        return np.frombuffer(payload, dtype=np.int8).astype(np.float32) * scale
+    return np.frombuffer(payload, dtype="<f2").astype(np.float32)
+
+
+def local_embedding(text: str, dimensions: int) -> np.ndarray:
+    """
+    Deterministic bag-of-words vector used when no API key is configured
+    Texts sharing words come out similar, which keeps local retrieval usable
+    """
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for word in text.lower().split():
+        vector[int.from_bytes(hashlib.md5(word.encode("utf-8")).digest()[:8], "little") % dimensions] += 1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class EmbeddingStore:
+    """
+    SQLite table of vectors keyed by content hash
+    The async methods run queries on one dedicated thread, which keeps disk
+    I/O off the event loop and never shares the connection between two
+    concurrent queries
+    """
+
+    # Keeps each lookup under SQLite's bound-parameter limit
+    LOOKUP_BATCH = 500
+
+    def __init__(self, path: Path, dtype: str = "float16"):
+        if dtype not in STORE_DTYPES:
+            raise ValueError(f"Unsupported embedding store dtype {dtype!r}; use one of {STORE_DTYPES}")
+        self.path = Path(path)
+        self.dtype = dtype
+        self._db: Optional[sqlite3.Connection] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._db is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key BLOB PRIMARY KEY, dtype TEXT, scale REAL, vector BLOB) WITHOUT ROWID"
+            )
+            self._db.commit()
+        return self._db
+
+    def get_many(self, keys: List[bytes]) -> Dict[bytes, np.ndarray]:
+        db = self._connection()
+        found: Dict[bytes, np.ndarray] = {}
+        for start in range(0, len(keys), self.LOOKUP_BATCH):
+            batch = keys[start:start + self.LOOKUP_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            rows = db.execute(
+                f"SELECT key, dtype, scale, vector FROM embeddings WHERE key IN ({placeholders})", batch
+            )
+            for key, dtype, scale, payload in rows:
+                found[key] = decode_vector(scale, payload, dtype)
+        return found
+
+    def put_many(self, items: Iterable[Tuple[bytes, np.ndarray]]) -> None:
+        db = self._connection()
+        db.executemany(
+            "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)",
+            [(key, self.dtype, *encode_vector(vector, self.dtype)) for key, vector in items],
+        )
+        db.commit()
+
+    def count(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    async def _run(self, function, *args):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embedding-store")
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    async def aget_many(self, keys: List[bytes]) -> Dict[bytes, np.ndarray]:
+        return await self._run(self.get_many, keys)
+
+    async def aput_many(self, items: Iterable[Tuple[bytes, np.ndarray]]) -> None:
+        await self._run(self.put_many, list(items))
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+class EmbeddingService:
+    """
+    Embeds texts with settings.EMBEDDING_MODEL through the shared LLM transport
+    Cached vectors are served from the EmbeddingStore; only new texts reach
+    the provider, in batches of the model's per-request limit
+    """
+
+    def __init__(
+        self,
+        transport: LLMTransport,
+        providers: Dict[str, Dict[str, Any]],
+        model: Optional[str] = None,
+        dimensions: Optional[int] = None,
+        store: Optional[EmbeddingStore] = None,
+        rate_limiter: Optional["LLMRateLimiter"] = None,
+        telemetry: Optional["LLMTelemetry"] = None,
+    ):
+        self.transport = transport
+        self.providers = providers
+        self.model = model or settings.EMBEDDING_MODEL
+        self.dimensions = dimensions or settings.EMBEDDING_DIMENSIONS
+        self.spec = EMBEDDING_MODELS.get(self.model, EMBEDDING_MODELS["text-embedding-v3"])
+        if store is None and settings.EMBEDDING_CACHE_ENABLED:
+            store = EmbeddingStore(Path(settings.EMBEDDING_CACHE_PATH), settings.EMBEDDING_CACHE_DTYPE)
+        self.store = store
+        self.rate_limiter = rate_limiter
+        self.telemetry = telemetry
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.requests = 0
+
+    @property
+    def provider(self) -> str:
+        return self.spec.get("provider", "dashscope")
+
+    @property
+    def has_credentials(self) -> bool:
+        return bool(self.providers.get(self.provider, {}).get("api_key"))
+
+    def _limit(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(settings.EMBEDDING_CONCURRENCY)
+        return self._semaphore
+
+    async def embed(self, text: str) -> List[float]:
+        """Embedding of a single text"""
+        return (await self.embed_many([text]))[0].tolist()
+
+    async def embed_many(self, texts: List[str]) -> np.ndarray:
+        """
+        Embeddings of texts as a (len(texts), dimensions) float32 array
+        Duplicate and previously seen texts are not sent to the provider
+        """
+        if not texts:
+            return np.empty((0, self.dimensions), dtype=np.float32)
+
+        # Without credentials, embed locally so development exercises the
+        # same code paths; these vectors are never written to the store
+        if not self.has_credentials:
+            return np.stack([local_embedding(text, self.dimensions) for text in texts])
+
+        keys = [content_key(self.model, self.dimensions, text) for text in texts]
+        unique: Dict[bytes, str] = dict(zip(keys, texts))
+        vectors = await self.store.aget_many(list(unique)) if self.store is not None else {}
+        missing = [key for key in unique if key not in vectors]
+        self.cache_hits += len(unique) - len(missing)
+        self.cache_misses += len(missing)
+
+        batch_size = self.spec["batch_size"]
+        batches = [missing[i:i + batch_size] for i in range(0, len(missing), batch_size)]
+
+        async def run(batch: List[bytes]) -> None:
+            async with self._limit():
+                embedded = await self._request([unique[key] for key in batch])
+            pairs = list(zip(batch, embedded))
+            # Stored per batch, so an interrupted ingest keeps what it paid for
+            if self.store is not None:
+                await self.store.aput_many(pairs)
+            vectors.update(pairs)
+
+        if batches:
+            await asyncio.gather(*(run(batch) for batch in batches))
+        return np.stack([vectors[key] for key in keys]).astype(np.float32, copy=False)
+
+    async def _request(self, texts: List[str]) -> List[np.ndarray]:
+        """One provider call for up to batch_size texts"""
+        tokenizer = get_tokenizer()
+        limit = self.spec["max_input_tokens"]
+        texts = [tokenizer.truncate(text, limit) or " " for text in texts]
+        trace = CallTrace("embedding", self.model)
+        try:
+            if self.rate_limiter is not None:
+                tokens = sum(tokenizer.count(text) for text in texts)
+                await self.rate_limiter.acquire(self.model, self.spec, tokens)
+            # Checked before the call exists, so a spent deadline leaves no
+            # un-awaited coroutine behind
+            timeout = call_timeout(settings.LLM_CALL_TIMEOUT)
+            self.requests += 1
+            response = await asyncio.wait_for(
+                self.transport.post(self.provider, "/embeddings", {
+                    "model": self.model,
+                    "input": texts,
+                    "dimensions": self.dimensions,
+                    "encoding_format": "float",
+                }),
+                timeout,
+            )
+        except BaseException:
+            self._record(trace, success=False)
+            raise
+        trace.first_token()
+        usage = response.get("usage") or {}
+        prompt_tokens = usage.get("prompt_tokens") or usage.get("total_tokens") or 0
+        trace.usage(
+            prompt_tokens, 0, prompt_tokens * self.spec.get("input_price", 0.0) / 1000, estimated=not usage
+        )
+        self._record(trace, success=True)
+        rows = sorted(response["data"], key=lambda row: row["index"])
+        return [np.asarray(row["embedding"], dtype=np.float32) for row in rows]
+
+    def _record(self, trace: CallTrace, success: bool) -> None:
+        if self.telemetry is not None:
+            self.telemetry.record(trace.finish(success=success))
+
+    def close(self) -> None:
+        if self.store is not None:
+            self.store.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "dimensions": self.dimensions,
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "requests": self.requests,
+            "stored_vectors": self.store.count() if self.store is not None else 0,
+        }
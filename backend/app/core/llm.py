@@ -3,11 +3,35 @@ LLM integration module for Bailian/DashScope
 Supports Qwen and GLM models via Bailian SDK
 """
 
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, AsyncIterator, Callable, Awaitable
+from dataclasses import dataclass
 from enum import Enum
+import asyncio
 import json
+import time
+import uuid
 
+import httpx
+
+from app.core.cache import cache_manager
 from app.core.config import get_settings
+from app.core.context_cache import ContextCache, PrefixPlan
+from app.core.embeddings import EmbeddingService
+from app.core.llm_batch import BatchRequest, BatchResult, LLMBatchRunner
+from app.core.llm_cache import LLMResponseCache, Embedder, compute_prompt_hash
+from app.core.llm_transport import LLMTransport
+from app.core.model_router import ModelRouter
+from app.core.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    DeadlineExceeded,
+    call_timeout,
+)
+from app.core.rate_limit import LLMRateLimiter, RateLimitExceeded
+from app.core.scheduler import LLMScheduler, Priority, current_schedule
+from app.core.singleflight import SingleFlight
+from app.core.telemetry import CacheOutcome, CallTrace, LLMTelemetry
+from app.core.tokenizer import Tokenizer, fit_messages, get_tokenizer
 
 settings = get_settings()
 
@@ -34,19 +58,104 @@ class TaskType(str, Enum):
     EVALUATION = "evaluation"       # Role play evaluation
 
 
+class ChunkType(str, Enum):
+    """Kinds of incremental output produced while streaming"""
+    THINKING = "thinking"           # Reasoning trace from thinking models
+    ANSWER = "answer"               # User-facing answer text
+
+
+@dataclass
+class StreamChunk:
+    """A single incremental piece of a streamed completion"""
+    type: ChunkType
+    content: str
+    model: ModelType
+    finish_reason: Optional[str] = None
+    usage: Optional[Dict[str, int]] = None  # Provider-reported token counts, on the final chunk
+
+
 # Task to model mapping
 TASK_MODEL_MAP: Dict[TaskType, ModelType] = {
     TaskType.RESEARCH: ModelType.QWEN_THINKING,
     TaskType.ANALYSIS: ModelType.QWEN_MAX,
     TaskType.VISUALIZATION: ModelType.QWEN_TURBO,
     TaskType.QUERY: ModelType.QWEN_MAX,
-    TaskType.RETRIEVAL: ModelType.QWEN_PLUS,
+    TaskType.RETRIEVAL: ModelType.QWEN_TURBO,   # Reranks hits from the local index
     TaskType.SYNTHESIS: ModelType.QWEN_THINKING,
     TaskType.PERSONA: ModelType.QWEN_MAX,
     TaskType.EVALUATION: ModelType.QWEN_MAX,
 }
 
 
+def fallback_chains(chains: Optional[Dict[str, List[str]]] = None) -> Dict[ModelType, List[ModelType]]:
+    """Failover order per model from LLM_FALLBACK_CHAINS; unknown model names raise"""
+    chains = settings.LLM_FALLBACK_CHAINS if chains is None else chains
+    return {ModelType(model): [ModelType(m) for m in fallbacks] for model, fallbacks in chains.items()}
+
+# p95 latency SLO per task in seconds; models breaking it are routed around
+TASK_LATENCY_SLO: Dict[TaskType, float] = {
+    TaskType.RESEARCH: 60.0,
+    TaskType.ANALYSIS: 30.0,
+    TaskType.VISUALIZATION: 10.0,
+    TaskType.QUERY: 10.0,
+    TaskType.RETRIEVAL: 5.0,
+    TaskType.SYNTHESIS: 60.0,
+    TaskType.PERSONA: 5.0,
+    TaskType.EVALUATION: 10.0,
+}
+
+# Scheduling class per task; a user is waiting on role play replies
+TASK_PRIORITY: Dict[TaskType, Priority] = {
+    TaskType.PERSONA: Priority.INTERACTIVE,
+    TaskType.EVALUATION: Priority.INTERACTIVE,
+    TaskType.QUERY: Priority.STANDARD,
+    TaskType.RETRIEVAL: Priority.STANDARD,
+    TaskType.SYNTHESIS: Priority.STANDARD,
+    TaskType.VISUALIZATION: Priority.STANDARD,
+    TaskType.RESEARCH: Priority.BULK,
+    TaskType.ANALYSIS: Priority.BULK,
+}
+
+
+def is_failover_error(exc: BaseException) -> bool:
+    """
+    Errors where another model or a later retry may succeed: 429/5xx,
+    transport errors, call timeouts, local quota and open circuits
+    """
+    if isinstance(exc, DeadlineExceeded):
+        return False
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code == 429 or exc.response.status_code >= 500
+    return isinstance(
+        exc,
+        (httpx.TransportError, asyncio.TimeoutError, RateLimitExceeded, CircuitOpenError),
+    )
+
+
+def _is_provider_failure(exc: BaseException) -> bool:
+    """Failover errors that reflect on the provider rather than on local limits"""
+    return is_failover_error(exc) and not isinstance(exc, (RateLimitExceeded, CircuitOpenError))
+
+
+# Response cache TTL per task in seconds; None disables caching for
+# tasks whose output is meant to vary between calls
+TASK_CACHE_TTL: Dict[TaskType, Optional[int]] = {
+    TaskType.RESEARCH: 24 * 3600,
+    TaskType.ANALYSIS: 24 * 3600,
+    TaskType.VISUALIZATION: 24 * 3600,
+    TaskType.QUERY: 3600,
+    TaskType.RETRIEVAL: 6 * 3600,
+    TaskType.SYNTHESIS: 6 * 3600,
+    TaskType.PERSONA: None,
+    TaskType.EVALUATION: 3600,
+}
+
+# Tasks where a near-identical prompt may reuse an earlier answer
+SEMANTIC_CACHE_TASKS = {TaskType.RESEARCH, TaskType.ANALYSIS}
+
+DEFAULT_CACHE_TTL = 3600
+
+
 class LLMConfig:
     """LLM configuration for different models"""
     
@@ -54,44 +163,98 @@ class LLMConfig:
         self.dashscope_api_key = settings.DASHSCOPE_API_KEY
         self.bailian_api_key = settings.BAILIAN_API_KEY
         
+        # Provider endpoints (OpenAI-compatible chat completions)
+        self.providers = {
+            "dashscope": {
+                "base_url": settings.DASHSCOPE_BASE_URL,
+                "api_key": self.dashscope_api_key,
+            },
+            "bailian": {
+                "base_url": settings.BAILIAN_BASE_URL,
+                "api_key": self.bailian_api_key,
+            },
+        }
+        
         # Model configurations
         self.models = {
             ModelType.QWEN_THINKING: {
                 "name": "qwen3-max-thinking",
                 "provider": "dashscope",
                 "max_tokens": 8192,
+                "context_window": 262144,
+                "tokenizer": "qwen",
                 "temperature": 0.7,
+                "rpm": 600,
+                "tpm": 1000000,
+                "input_price": 0.006,  # CNY per 1K tokens
+                "output_price": 0.024,
+                "cached_input_price": 0.0006,  # Prompt tokens served from the context cache
+                "context_cache": True,
                 "enable_thinking": True,
             },
             ModelType.QWEN_MAX: {
                 "name": "qwen-max",
                 "provider": "dashscope",
                 "max_tokens": 8192,
+                "context_window": 32768,
+                "tokenizer": "qwen",
                 "temperature": 0.7,
+                "rpm": 1200,
+                "tpm": 1000000,
+                "input_price": 0.0024,  # CNY per 1K tokens
+                "output_price": 0.0096,
+                "cached_input_price": 0.00024,
+                "context_cache": True,
             },
             ModelType.QWEN_PLUS: {
                 "name": "qwen-plus",
                 "provider": "dashscope",
                 "max_tokens": 4096,
+                "context_window": 131072,
+                "tokenizer": "qwen",
                 "temperature": 0.7,
+                "rpm": 15000,
+                "tpm": 1200000,
+                "input_price": 0.0008,  # CNY per 1K tokens
+                "output_price": 0.002,
+                "cached_input_price": 0.00008,
+                "context_cache": True,
             },
             ModelType.QWEN_TURBO: {
                 "name": "qwen-turbo",
                 "provider": "dashscope",
                 "max_tokens": 4096,
+                "context_window": 131072,
+                "tokenizer": "qwen",
                 "temperature": 0.7,
+                "rpm": 1200,
+                "tpm": 5000000,
+                "input_price": 0.0003,  # CNY per 1K tokens
+                "output_price": 0.0006,
             },
             ModelType.GLM_5: {
                 "name": "glm-5.0",
                 "provider": "bailian",
                 "max_tokens": 8192,
+                "context_window": 131072,
+                "tokenizer": "glm",
                 "temperature": 0.7,
+                "rpm": 300,
+                "tpm": 500000,
+                "input_price": 0.004,  # CNY per 1K tokens
+                "output_price": 0.016,
             },
             ModelType.GLM_4: {
                 "name": "glm-4",
                 "provider": "bailian",
                 "max_tokens": 4096,
+                "context_window": 128000,
+                "tokenizer": "glm",
                 "temperature": 0.7,
+                "rpm": 300,
+                "tpm": 500000,
+                "input_price": 0.005,  # CNY per 1K tokens
+                "output_price": 0.005,
             },
         }
     
@@ -102,13 +265,42 @@ class LLMConfig:
     def get_model_config(self, model: ModelType) -> Dict[str, Any]:
         """Get configuration for a specific model"""
         return self.models.get(model, self.models[ModelType.QWEN_MAX])
+    
+    def get_provider_config(self, provider: str) -> Dict[str, Any]:
+        """Get endpoint configuration for a provider"""
+        return self.providers.get(provider, self.providers["dashscope"])
+
+
+def parse_stream_event(event: Dict[str, Any], model: ModelType) -> List[StreamChunk]:
+    """Split one streamed chat-completion event into thinking and answer chunks"""
+    chunks: List[StreamChunk] = []
+    for choice in event.get("choices") or []:
+        delta = choice.get("delta") or {}
+        finish_reason = choice.get("finish_reason")
+        
+        reasoning = delta.get("reasoning_content")
+        if reasoning:
+            chunks.append(StreamChunk(ChunkType.THINKING, reasoning, model))
+        
+        content = delta.get("content")
+        if content or finish_reason:
+            chunks.append(StreamChunk(ChunkType.ANSWER, content or "", model, finish_reason))
+    
+    # With stream_options.include_usage the last event carries only usage
+    usage = event.get("usage")
+    if usage:
+        chunks.append(StreamChunk(ChunkType.ANSWER, "", model, usage=usage))
+    return chunks
 
 
 class BaseLLMClient:
     """Base class for LLM clients"""
     
-    def __init__(self, config: LLMConfig):
+    provider: str = "dashscope"
+    
+    def __init__(self, config: LLMConfig, transport: LLMTransport):
         self.config = config
+        self.transport = transport
     
     async def generate(
         self,
@@ -131,11 +323,98 @@ class BaseLLMClient:
     ) -> str:
         """Generate with conversation history"""
         raise NotImplementedError("Subclasses must implement generate_with_history()")
+    
+    async def stream(
+        self,
+        prompt: str,
+        model: ModelType,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        **kwargs,
+    ) -> AsyncIterator[StreamChunk]:
+        """Stream text completion chunk by chunk"""
+        messages = [{"role": "user", "content": prompt}]
+        async for chunk in self.stream_with_history(
+            messages, model, temperature=temperature, max_tokens=max_tokens, **kwargs
+        ):
+            yield chunk
+    
+    async def stream_with_history(
+        self,
+        messages: List[Dict[str, str]],
+        model: ModelType,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        **kwargs,
+    ) -> AsyncIterator[StreamChunk]:
+        """Stream a completion for a conversation using server-sent events"""
+        provider_config = self.config.get_provider_config(self.provider)
+        
+        # Without credentials, stream the placeholder response so local
+        # development exercises the same code path as production
+        if not provider_config.get("api_key"):
+            text = await self.generate_with_history(
+                messages, model, temperature=temperature, max_tokens=max_tokens, **kwargs
+            )
+            for piece in text.split(" "):
+                yield StreamChunk(ChunkType.ANSWER, piece + " ", model)
+            yield StreamChunk(ChunkType.ANSWER, "", model, finish_reason="stop")
+            return
+        
+        payload = self._build_payload(messages, model, temperature, max_tokens, stream=True, **kwargs)
+        async with self.transport.stream(self.provider, "/chat/completions", payload) as response:
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                for chunk in parse_stream_event(json.loads(data), model):
+                    yield chunk
+    
+    def _build_payload(
+        self,
+        messages: List[Dict[str, str]],
+        model: ModelType,
+        temperature: Optional[float],
+        max_tokens: Optional[int],
+        stream: bool = False,
+        **kwargs,
+    ) -> Dict[str, Any]:
+        """Build an OpenAI-compatible chat completion request body"""
+        model_config = self.config.get_model_config(model)
+        payload: Dict[str, Any] = {
+            "model": model_config["name"],
+            "messages": messages,
+            "temperature": temperature if temperature is not None else model_config["temperature"],
+            "max_tokens": max_tokens or model_config["max_tokens"],
+            "stream": stream,
+        }
+        if stream:
+            payload["stream_options"] = {"include_usage": True}
+        if any("cache_control" in message for message in messages):
+            payload["messages"] = [_payload_message(message) for message in messages]
+        if model_config.get("enable_thinking"):
+            payload["enable_thinking"] = True
+        payload.update(kwargs)
+        return payload
+
+
+def _payload_message(message: Dict[str, Any]) -> Dict[str, Any]:
+    """Provider form of a message; a cache_control key becomes an explicit cache breakpoint"""
+    if "cache_control" not in message:
+        return message
+    message = dict(message)
+    marker = message.pop("cache_control")
+    message["content"] = [{"type": "text", "text": message["content"], "cache_control": marker}]
+    return message
 
 
 class DashScopeClient(BaseLLMClient):
     """Client for Alibaba DashScope (Qwen models)"""
     
+    provider = "dashscope"
+    
     async def generate(
         self,
         prompt: str,
@@ -169,6 +448,8 @@ class DashScopeClient(BaseLLMClient):
 class BailianClient(BaseLLMClient):
     """Client for Bailian (GLM models)"""
     
+    provider = "bailian"
+    
     async def generate(
         self,
         prompt: str,
@@ -195,13 +476,86 @@ class BailianClient(BaseLLMClient):
         return f"[Bailian {model.value}] Response to: {last_message[:100]}..."
 
 
+# One provider call: candidate model and the messages trimmed to fit it
+CompletionCall = Callable[[ModelType, List[Dict[str, str]]], Awaitable[str]]
+
+
 class LLMService:
     """Main LLM service for generating completions"""
     
-    def __init__(self):
+    def __init__(self, embedder: Optional[Embedder] = None):
         self.config = LLMConfig()
-        self.dashscope_client = DashScopeClient(self.config)
-        self.bailian_client = BailianClient(self.config)
+        self.transport = LLMTransport(self.config.providers)
+        self.dashscope_client = DashScopeClient(self.config, self.transport)
+        self.bailian_client = BailianClient(self.config, self.transport)
+        self.in_flight = SingleFlight()
+        self.rate_limiter = LLMRateLimiter(cache_manager)
+        self.router = ModelRouter(fallback_chains())
+        self.telemetry = LLMTelemetry(cache_manager)
+        self.embeddings = EmbeddingService(
+            self.transport,
+            self.config.providers,
+            rate_limiter=self.rate_limiter,
+            telemetry=self.telemetry,
+        )
+        self.response_cache = LLMResponseCache(cache_manager, embedder or self.embeddings.embed)
+        self.batch = LLMBatchRunner(self, cache_manager)
+        self.scheduler = LLMScheduler()
+        self.context_cache = ContextCache(cache_manager)
+        self.breakers = {
+            provider: CircuitBreaker(
+                provider,
+                settings.LLM_BREAKER_FAILURE_THRESHOLD,
+                settings.LLM_BREAKER_RECOVERY_SECONDS,
+            )
+            for provider in self.config.providers
+        }
+    
+    async def connect(self) -> None:
+        """Open the pooled provider connections and start telemetry flushing"""
+        await self.transport.open()
+        self.telemetry.start()
+    
+    async def disconnect(self) -> None:
+        """Flush telemetry and close the pooled provider connections"""
+        await self.telemetry.stop()
+        await self.transport.close()
+        self.embeddings.close()
+    
+    def pool_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Connection pool saturation per provider"""
+        return self.transport.stats()
+    
+    def _tokenizer(self, model: ModelType) -> Tokenizer:
+        return get_tokenizer(self.config.get_model_config(model).get("tokenizer", "qwen"))
+    
+    def fit_context(
+        self,
+        messages: List[Dict[str, str]],
+        model: ModelType,
+        max_tokens: Optional[int] = None,
+    ) -> List[Dict[str, str]]:
+        """
+        Trim messages so the prompt plus the reply budget fits the model's
+        context window, counted with the model's tokenizer
+        """
+        model_config = self.config.get_model_config(model)
+        budget = model_config["context_window"] - (max_tokens or model_config["max_tokens"])
+        return fit_messages(messages, budget, self._tokenizer(model))
+    
+    def _priority(self, task: Optional[TaskType]) -> Priority:
+        """Scheduling class: the context's override, else the task's class"""
+        override, _ = current_schedule()
+        if override is not None:
+            return override
+        return TASK_PRIORITY.get(task, Priority.STANDARD) if task else Priority.STANDARD
+    
+    async def _acquire_slot(self, task: Optional[TaskType], trace: CallTrace) -> Priority:
+        """Wait for a scheduler slot; returns the class to release it with"""
+        _, tenant = current_schedule()
+        priority = self._priority(task)
+        trace.queue_time += await self.scheduler.acquire(priority, tenant)
+        return priority
     
     def _get_client(self, model: ModelType) -> BaseLLMClient:
         """Get the appropriate client for a model"""
@@ -212,37 +566,490 @@ class LLMService:
             return self.bailian_client
         return self.dashscope_client
     
+    def _resolve_model(
+        self,
+        task: Optional[TaskType],
+        model: Optional[ModelType],
+    ) -> ModelType:
+        """Pick the explicit model, the task's model, or the default"""
+        if model is None and task:
+            return self.config.get_model_for_task(task)
+        return model or ModelType.QWEN_MAX
+    
+    def prompt_hash(
+        self,
+        messages: List[Dict[str, str]],
+        model: ModelType,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        **kwargs,
+    ) -> str:
+        """Canonical cache key for a request, with model defaults filled in"""
+        model_config = self.config.get_model_config(model)
+        return compute_prompt_hash(
+            model_config["name"],
+            temperature if temperature is not None else model_config["temperature"],
+            max_tokens or model_config["max_tokens"],
+            messages,
+            kwargs,
+        )
+    
+    async def _admit(
+        self,
+        model: ModelType,
+        messages: List[Dict[str, str]],
+        max_tokens: Optional[int] = None,
+    ) -> None:
+        """Reserve rate-limit budget for a request before it is dispatched"""
+        model_config = self.config.get_model_config(model)
+        tokens = self._tokenizer(model).count_messages(messages) + (max_tokens or model_config["max_tokens"])
+        await self.rate_limiter.acquire(model.value, model_config, tokens)
+    
+    async def remaining_budget(self) -> Dict[str, Dict[str, int]]:
+        """Remaining request/token budget per model"""
+        return {
+            model.value: await self.rate_limiter.remaining(model.value, model_config)
+            for model, model_config in self.config.models.items()
+        }
+    
+    def _candidates(
+        self,
+        task: Optional[TaskType],
+        model: Optional[ModelType],
+    ) -> List[ModelType]:
+        """Models to try in order; an explicit model pins the request"""
+        if model is not None:
+            return [model]
+        preferred = self._resolve_model(task, None)
+        return self.router.route(preferred, TASK_LATENCY_SLO.get(task) if task else None)
+    
+    def _cost(
+        self,
+        model: ModelType,
+        prompt_tokens: int,
+        completion_tokens: int,
+        cached_tokens: int = 0,
+    ) -> float:
+        """Call cost in CNY for the given token counts"""
+        model_config = self.config.get_model_config(model)
+        input_price = model_config.get("input_price", 0.0)
+        return (
+            (prompt_tokens - cached_tokens) * input_price
+            + cached_tokens * model_config.get("cached_input_price", input_price)
+            + completion_tokens * model_config.get("output_price", 0.0)
+        ) / 1000
+    
+    def _estimate_cost(
+        self,
+        model: ModelType,
+        messages: List[Dict[str, str]],
+        content: str,
+    ) -> float:
+        """Approximate call cost in CNY from estimated token counts"""
+        tokenizer = self._tokenizer(model)
+        return self._cost(model, tokenizer.count_messages(messages), tokenizer.count(content))
+    
+    def _trace_usage(
+        self,
+        trace: CallTrace,
+        model: ModelType,
+        messages: List[Dict[str, str]],
+        content: str,
+        usage: Optional[Dict[str, Any]] = None,
+        cached_tokens: int = 0,
+    ) -> None:
+        """
+        Attach token counts and cost to a trace, preferring provider-reported usage
+        cached_tokens is the context cache's own estimate, used when the
+        provider does not report its cache hits
+        """
+        if usage:
+            prompt_tokens = usage.get("prompt_tokens", 0)
+            completion_tokens = usage.get("completion_tokens", 0)
+            details = usage.get("prompt_tokens_details") or {}
+            cached_tokens = details.get("cached_tokens", cached_tokens)
+        else:
+            tokenizer = self._tokenizer(model)
+            prompt_tokens = tokenizer.count_messages(messages)
+            completion_tokens = tokenizer.count(content)
+        cached_tokens = min(cached_tokens, prompt_tokens)
+        trace.model = model.value
+        trace.usage(
+            prompt_tokens,
+            completion_tokens,
+            self._cost(model, prompt_tokens, completion_tokens, cached_tokens),
+            estimated=not usage,
+            cached_tokens=cached_tokens,
+        )
+    
+    async def _plan_context(
+        self,
+        session: Optional[str],
+        model: ModelType,
+        messages: List[Dict[str, str]],
+    ) -> Optional[PrefixPlan]:
+        """Context-cache plan for a session's request to one candidate model"""
+        if session is None:
+            return None
+        return await self.context_cache.plan(
+            session,
+            model.value,
+            messages,
+            self._tokenizer(model),
+            supported=bool(self.config.get_model_config(model).get("context_cache")),
+        )
+    
+    def routing_stats(self) -> Dict[str, Any]:
+        """Rolling latency/error/cost per model, failovers and circuit states"""
+        return {
+            "models": self.router.stats(),
+            "failovers": self.router.failovers,
+            "circuits": {name: breaker.stats() for name, breaker in self.breakers.items()},
+        }
+    
+    def _breaker(self, model: ModelType) -> CircuitBreaker:
+        provider = self.config.get_model_config(model).get("provider", "dashscope")
+        return self.breakers[provider]
+    
+    def _record_outcome(
+        self,
+        model: ModelType,
+        started: float,
+        exc: Optional[BaseException] = None,
+        content: str = "",
+        messages: Optional[List[Dict[str, str]]] = None,
+    ) -> None:
+        """Feed one call's outcome to the router and the provider's circuit"""
+        breaker = self._breaker(model)
+        latency = time.perf_counter() - started
+        if exc is None:
+            breaker.record_success()
+            self.router.record(model, latency, True, self._estimate_cost(model, messages or [], content))
+        elif _is_provider_failure(exc):
+            breaker.record_failure()
+            self.router.record(model, latency, False)
+        elif isinstance(exc, httpx.HTTPStatusError):
+            # The provider answered with a client error; it is reachable
+            breaker.record_success()
+        else:
+            breaker.release()
+    
+    async def _dispatch(
+        self,
+        task: Optional[TaskType],
+        candidates: List[ModelType],
+        messages: List[Dict[str, str]],
+        params: Dict[str, Any],
+        call: CompletionCall,
+        trace: CallTrace,
+        context_session: Optional[str] = None,
+    ) -> str:
+        """
+        Call candidates in order until one succeeds, recording each outcome
+        The whole attempt holds one scheduler slot. Each call is bounded by
+        LLM_CALL_TIMEOUT and the request deadline, and skipped while its
+        provider's circuit is open.
+        """
+        priority = await self._acquire_slot(task, trace)
+        try:
+            return await self._dispatch_candidates(candidates, messages, params, call, trace, context_session)
+        finally:
+            self.scheduler.release(priority)
+    
+    async def _dispatch_candidates(
+        self,
+        candidates: List[ModelType],
+        messages: List[Dict[str, str]],
+        params: Dict[str, Any],
+        call: CompletionCall,
+        trace: CallTrace,
+        context_session: Optional[str] = None,
+    ) -> str:
+        last_error: Optional[BaseException] = None
+        for index, candidate in enumerate(candidates):
+            if index:
+                self.router.failovers += 1
+            try:
+                self._breaker(candidate).before_call()
+            except CircuitOpenError as exc:
+                last_error = exc
+                continue
+            trace.model = candidate.value
+            started = time.perf_counter()
+            plan: Optional[PrefixPlan] = None
+            fitted = messages
+            try:
+                # Each candidate gets as much history as its own window holds
+                fitted = self.fit_context(messages, candidate, params.get("max_tokens"))
+                # Inside the try so a planning error still releases the circuit slot
+                plan = await self._plan_context(context_session, candidate, fitted)
+                await self._admit(candidate, fitted, params.get("max_tokens"))
+                trace.queue_time += time.perf_counter() - started
+                # Check the deadline before creating the call, which would otherwise never be awaited
+                timeout = call_timeout(settings.LLM_CALL_TIMEOUT)
+                content = await asyncio.wait_for(call(candidate, plan.messages if plan else fitted), timeout)
+            except BaseException as exc:
+                self._record_outcome(candidate, started, exc)
+                if not is_failover_error(exc):
+                    raise
+                last_error = exc
+                continue
+            trace.first_token()
+            self._record_outcome(candidate, started, content=content, messages=fitted)
+            self._trace_usage(trace, candidate, fitted, content, cached_tokens=plan.cached_tokens if plan else 0)
+            if plan is not None:
+                await self.context_cache.commit(plan)
+            return content
+        raise last_error
+    
+    async def _complete(
+        self,
+        messages: List[Dict[str, str]],
+        task: Optional[TaskType],
+        model: Optional[ModelType],
+        call: CompletionCall,
+        use_cache: bool,
+        cache_scope: Optional[str],
+        params: Dict[str, Any],
+        context_session: Optional[str] = None,
+    ) -> str:
+        """Run a completion and record its usage and timings"""
+        trace = CallTrace(task.value if task else None, self._resolve_model(task, model).value)
+        try:
+            content = await self._cached_complete(
+                messages, task, model, call, use_cache, cache_scope, params, trace, context_session
+            )
+        except BaseException:
+            self.telemetry.record(trace.finish(success=False))
+            raise
+        self.telemetry.record(trace.finish(success=True))
+        return content
+    
+    async def _cached_complete(
+        self,
+        messages: List[Dict[str, str]],
+        task: Optional[TaskType],
+        model: Optional[ModelType],
+        call: CompletionCall,
+        use_cache: bool,
+        cache_scope: Optional[str],
+        params: Dict[str, Any],
+        trace: CallTrace,
+        context_session: Optional[str] = None,
+    ) -> str:
+        """
+        Run a completion behind the response cache
+        Identical concurrent requests share one provider call per worker, and
+        a Redis lease makes other workers wait for the cached result. The cache
+        key uses the preferred model even when a fallback model answers.
+        """
+        candidates = self._candidates(task, model)
+        model = self._resolve_model(task, model)
+        
+        ttl = TASK_CACHE_TTL.get(task, DEFAULT_CACHE_TTL) if task else DEFAULT_CACHE_TTL
+        if not use_cache or ttl is None:
+            return await self._dispatch(task, candidates, messages, params, call, trace, context_session)
+        
+        async def dispatch() -> str:
+            trace.cache = CacheOutcome.MISS
+            return await self._dispatch(task, candidates, messages, params, call, trace, context_session)
+        
+        # Candidates fit the prompt to their own windows; the key is the preferred model's fit
+        preferred = self.fit_context(messages, model, params.get("max_tokens"))
+        prompt_hash = self.prompt_hash(preferred, model, **params)
+        cached = await self.response_cache.get(prompt_hash)
+        if cached is not None:
+            trace.cache = CacheOutcome.HIT
+            return cached
+        
+        semantic = cache_scope is not None and task in SEMANTIC_CACHE_TASKS
+        if semantic:
+            cached = await self.response_cache.get_similar(model.value, cache_scope, preferred)
+            if cached is not None:
+                trace.cache = CacheOutcome.SEMANTIC_HIT
+                return cached
+        
+        # Stays COALESCED unless this request ends up calling the provider itself
+        trace.cache = CacheOutcome.COALESCED
+        
+        async def fill() -> str:
+            content = await self.response_cache.fill(prompt_hash, model.value, ttl, dispatch)
+            if semantic:
+                await self.response_cache.remember_similar(
+                    model.value, cache_scope, preferred, prompt_hash, ttl
+                )
+            return content
+        
+        return await self.in_flight.do(prompt_hash, fill)
+    
     async def generate(
         self,
         prompt: str,
         task: Optional[TaskType] = None,
         model: Optional[ModelType] = None,
+        use_cache: bool = True,
+        cache_scope: Optional[str] = None,
         **kwargs,
     ) -> str:
-        """Generate text completion"""
-        if model is None and task:
-            model = self.config.get_model_for_task(task)
-        elif model is None:
-            model = ModelType.QWEN_MAX
-        
-        client = self._get_client(model)
-        return await client.generate(prompt, model, **kwargs)
+        """
+        Generate text completion
+        cache_scope (e.g. a customer id) enables similarity reuse for research tasks
+        """
+        messages = [{"role": "user", "content": prompt}]
+        return await self._complete(
+            messages, task, model,
+            lambda candidate, fitted: self._get_client(candidate).generate(
+                fitted[-1]["content"], candidate, **kwargs
+            ),
+            use_cache, cache_scope, kwargs,
+        )
     
     async def generate_with_history(
         self,
         messages: List[Dict[str, str]],
         task: Optional[TaskType] = None,
         model: Optional[ModelType] = None,
+        use_cache: bool = True,
+        cache_scope: Optional[str] = None,
+        context_session: Optional[str] = None,
         **kwargs,
     ) -> str:
-        """Generate with conversation history"""
-        if model is None and task:
-            model = self.config.get_model_for_task(task)
-        elif model is None:
-            model = ModelType.QWEN_MAX
-        
-        client = self._get_client(model)
-        return await client.generate_with_history(messages, model, **kwargs)
+        """
+        Generate with conversation history
+        context_session (e.g. a role-play session id) reuses the provider's
+        cached prompt prefix from the session's previous turn
+        """
+        return await self._complete(
+            messages, task, model,
+            lambda candidate, fitted: self._get_client(candidate).generate_with_history(
+                fitted, candidate, **kwargs
+            ),
+            use_cache, cache_scope, kwargs, context_session,
+        )
+    
+    async def generate_batch(
+        self,
+        requests: List[BatchRequest],
+        job_id: Optional[str] = None,
+        timeout: Optional[float] = None,
+        on_result: Optional[Callable[[BatchResult], Awaitable[None]]] = None,
+    ) -> Dict[str, BatchResult]:
+        """
+        Generate completions for many requests as one resumable job
+        Re-running with the same job_id skips items that already succeeded
+        """
+        return await self.batch.run(job_id or uuid.uuid4().hex, requests, timeout, on_result)
+    
+    async def stream(
+        self,
+        prompt: str,
+        task: Optional[TaskType] = None,
+        model: Optional[ModelType] = None,
+        include_thinking: bool = False,
+        **kwargs,
+    ) -> AsyncIterator[StreamChunk]:
+        """Stream text completion as it is generated"""
+        messages = [{"role": "user", "content": prompt}]
+        async for chunk in self.stream_with_history(
+            messages, task=task, model=model, include_thinking=include_thinking, **kwargs
+        ):
+            yield chunk
+    
+    async def stream_with_history(
+        self,
+        messages: List[Dict[str, str]],
+        task: Optional[TaskType] = None,
+        model: Optional[ModelType] = None,
+        include_thinking: bool = False,
+        context_session: Optional[str] = None,
+        **kwargs,
+    ) -> AsyncIterator[StreamChunk]:
+        """
+        Stream a completion with conversation history
+        Thinking-trace chunks are dropped unless include_thinking is set.
+        Failover to the next candidate only happens before the first chunk.
+        context_session reuses the session's cached prompt prefix.
+        """
+        trace = CallTrace(task.value if task else None, self._resolve_model(task, model).value)
+        succeeded = False
+        slot: Optional[Priority] = None
+        try:
+            last_error: Optional[BaseException] = None
+            candidates = self._candidates(task, model)
+            # The slot is held until the stream is fully consumed or closed
+            slot = await self._acquire_slot(task, trace)
+            for index, candidate in enumerate(candidates):
+                if index:
+                    self.router.failovers += 1
+                try:
+                    self._breaker(candidate).before_call()
+                except CircuitOpenError as exc:
+                    last_error = exc
+                    continue
+                trace.model = candidate.value
+                started = time.perf_counter()
+                plan: Optional[PrefixPlan] = None
+                chunks: Optional[AsyncIterator[StreamChunk]] = None
+                fitted = messages
+                try:
+                    fitted = self.fit_context(messages, candidate, kwargs.get("max_tokens"))
+                    # Inside the try so a planning error still releases the circuit slot
+                    plan = await self._plan_context(context_session, candidate, fitted)
+                    chunks = self._get_client(candidate).stream_with_history(
+                        plan.messages if plan else fitted, candidate, **kwargs
+                    )
+                    await self._admit(candidate, fitted, kwargs.get("max_tokens"))
+                    trace.queue_time += time.perf_counter() - started
+                    timeout = call_timeout(settings.LLM_CALL_TIMEOUT)
+                    first = await asyncio.wait_for(anext(chunks, None), timeout)
+                except BaseException as exc:
+                    if chunks is not None:
+                        await chunks.aclose()
+                    self._record_outcome(candidate, started, exc)
+                    if not is_failover_error(exc):
+                        raise
+                    last_error = exc
+                    continue
+                
+                answer: List[str] = []
+                usage: Optional[Dict[str, int]] = None
+                try:
+                    if first is not None:
+                        async for chunk in _prepend(first, chunks):
+                            if chunk.usage:
+                                usage = chunk.usage
+                                if not chunk.content and not chunk.finish_reason:
+                                    continue
+                            if chunk.type == ChunkType.ANSWER:
+                                answer.append(chunk.content)
+                            elif not include_thinking:
+                                continue
+                            trace.first_token()
+                            yield chunk
+                except BaseException as exc:
+                    self._record_outcome(candidate, started, exc)
+                    raise
+                content = "".join(answer)
+                self._record_outcome(candidate, started, content=content, messages=fitted)
+                self._trace_usage(
+                    trace, candidate, fitted, content, usage, cached_tokens=plan.cached_tokens if plan else 0
+                )
+                if plan is not None:
+                    await self.context_cache.commit(plan)
+                succeeded = True
+                return
+            raise last_error
+        finally:
+            if slot is not None:
+                self.scheduler.release(slot)
+            self.telemetry.record(trace.finish(success=succeeded))
+
+
+async def _prepend(first: StreamChunk, rest: AsyncIterator[StreamChunk]) -> AsyncIterator[StreamChunk]:
+    """Re-attach an already consumed first chunk to its stream"""
+    yield first
+    async for chunk in rest:
+        yield chunk
 
 
 # Global LLM service instance
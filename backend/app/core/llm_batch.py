@@ -0,0 +1,251 @@
+"""
+Batch generation for offline LLM jobs
+Runs many prompts with per-provider concurrency caps, leaves rate-limit
+headroom for interactive traffic and checkpoints results in Redis so an
+interrupted job resumes where it stopped
+"""
+
+from dataclasses import dataclass, field, asdict
+from typing import TYPE_CHECKING, Optional, Dict, Any, List, Callable, Awaitable
+import asyncio
+import json
+import logging
+import time
+
+from redis.exceptions import RedisError
+
+from app.core.cache import CacheManager
+from app.core.config import get_settings
+from app.core.resilience import deadline_scope, remaining_time
+from app.core.scheduler import Priority, scheduling_scope
+
+if TYPE_CHECKING:
+    from app.core.llm import LLMService, ModelType, TaskType
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BatchRequest:
+    """One prompt in a batch job; id must be stable across resumes"""
+    id: str
+    prompt: Optional[str] = None
+    messages: Optional[List[Dict[str, str]]] = None
+    task: Optional["TaskType"] = None
+    model: Optional["ModelType"] = None
+    params: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class BatchResult:
+    """Outcome of one batch request"""
+    id: str
+    content: Optional[str] = None
+    error: Optional[str] = None
+    duration: float = 0.0
+
+    @property
+    def succeeded(self) -> bool:
+        return self.error is None and self.content is not None
+
+
+class BatchCheckpoint:
+    """Redis record of a job's finished and failed items"""
+
+    def __init__(self, cache: CacheManager, job_id: str):
+        self.cache = cache
+        self.job_id = job_id
+        self.ttl = settings.LLM_BATCH_CHECKPOINT_TTL
+
+    @property
+    def available(self) -> bool:
+        return self.cache.is_connected
+
+    def _key(self, part: str) -> str:
+        return f"llmbatch:{self.job_id}:{part}"
+
+    async def completed(self) -> Dict[str, BatchResult]:
+        """Results already checkpointed by earlier runs"""
+        if not self.available:
+            return {}
+        try:
+            raw = await self.cache.client.hgetall(self._key("done"))
+        except RedisError as exc:
+            logger.warning("Could not read batch checkpoint %s: %s", self.job_id, exc)
+            return {}
+        return {item_id: BatchResult(**json.loads(value)) for item_id, value in raw.items()}
+
+    async def start(self, total: int) -> None:
+        if not self.available:
+            return
+        try:
+            async with self.cache.client.pipeline(transaction=False) as pipe:
+                pipe.hset(self._key("meta"), mapping={"total": total, "status": "running", "updated": time.time()})
+                pipe.hsetnx(self._key("meta"), "started", time.time())
+                pipe.expire(self._key("meta"), self.ttl)
+                await pipe.execute()
+        except RedisError as exc:
+            logger.warning("Could not write batch checkpoint %s: %s", self.job_id, exc)
+
+    async def save(self, result: BatchResult) -> None:
+        """Checkpoint one result; failures are kept apart and retried on resume"""
+        if not self.available:
+            return
+        done, failed = self._key("done"), self._key("failed")
+        try:
+            async with self.cache.client.pipeline(transaction=False) as pipe:
+                if result.succeeded:
+                    pipe.hset(done, result.id, json.dumps(asdict(result)))
+                    pipe.hdel(failed, result.id)
+                else:
+                    pipe.hset(failed, result.id, result.error or "")
+                    pipe.hdel(done, result.id)
+                for key in (done, failed):
+                    pipe.expire(key, self.ttl)
+                pipe.hset(self._key("meta"), "updated", time.time())
+                await pipe.execute()
+        except RedisError as exc:
+            logger.warning("Could not checkpoint batch item %s/%s: %s", self.job_id, result.id, exc)
+
+    async def finish(self, status: str) -> None:
+        if not self.available:
+            return
+        try:
+            await self.cache.client.hset(self._key("meta"), mapping={"status": status, "updated": time.time()})
+        except RedisError as exc:
+            logger.warning("Could not write batch checkpoint %s: %s", self.job_id, exc)
+
+    async def progress(self) -> Dict[str, Any]:
+        client = self.cache.client
+        meta = await client.hgetall(self._key("meta"))
+        return {
+            "job_id": self.job_id,
+            "status": meta.get("status", "unknown"),
+            "total": int(meta.get("total", 0)),
+            "completed": await client.hlen(self._key("done")),
+            "failed": await client.hlen(self._key("failed")),
+        }
+
+
+class LLMBatchRunner:
+    """
+    Executes batch jobs through an LLMService
+    Each provider gets its own concurrency cap, and an item is only sent
+    while the model keeps LLM_BATCH_RESERVED_FRACTION of its rate-limit
+    budget free for interactive requests
+    """
+
+    def __init__(self, service: "LLMService", cache: CacheManager):
+        self.service = service
+        self.cache = cache
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def _semaphore(self, provider: str) -> asyncio.Semaphore:
+        if provider not in self._semaphores:
+            self._semaphores[provider] = asyncio.Semaphore(settings.LLM_BATCH_CONCURRENCY)
+        return self._semaphores[provider]
+
+    async def _wait_for_headroom(self, model: "ModelType") -> bool:
+        """
+        Wait until the model has spare budget beyond the interactive reserve
+        Returns False if the job deadline passes first; while Redis cannot
+        report the budget, items are paced one backoff apart instead
+        """
+        model_config = self.service.config.get_model_config(model)
+        fraction = settings.LLM_BATCH_RESERVED_FRACTION
+        while True:
+            try:
+                budget = await self.service.rate_limiter.remaining(model.value, model_config)
+            except RedisError as exc:
+                logger.warning("Could not read rate-limit budget for %s, pacing batch: %s", model.value, exc)
+                budget = None
+            if budget is not None and (
+                budget["requests"] > model_config["rpm"] * fraction
+                and budget["tokens"] > model_config["tpm"] * fraction
+            ):
+                return True
+            left = remaining_time()
+            if left is not None and left <= settings.LLM_BATCH_BACKOFF:
+                return False
+            await asyncio.sleep(settings.LLM_BATCH_BACKOFF)
+            if budget is None:
+                return True
+
+    async def _run_one(self, request: BatchRequest) -> Optional[BatchResult]:
+        """Run one request, or return None if the job deadline left no time"""
+        model = self.service._resolve_model(request.task, request.model)
+        provider = self.service.config.get_model_config(model).get("provider", "dashscope")
+        async with self._semaphore(provider):
+            left = remaining_time()
+            if left is not None and left <= 0:
+                return None
+            if not await self._wait_for_headroom(model):
+                return None
+            started = time.perf_counter()
+            try:
+                if request.messages is not None:
+                    content = await self.service.generate_with_history(
+                        request.messages, task=request.task, model=request.model, **request.params
+                    )
+                else:
+                    content = await self.service.generate(
+                        request.prompt or "", task=request.task, model=request.model, **request.params
+                    )
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                return BatchResult(request.id, error=f"{type(exc).__name__}: {exc}",
+                                   duration=time.perf_counter() - started)
+            return BatchResult(request.id, content=content, duration=time.perf_counter() - started)
+
+    async def run(
+        self,
+        job_id: str,
+        requests: List[BatchRequest],
+        timeout: Optional[float] = None,
+        on_result: Optional[Callable[[BatchResult], Awaitable[None]]] = None,
+    ) -> Dict[str, BatchResult]:
+        """
+        Run a job to completion, skipping items finished by earlier runs
+        Items not started before the timeout stay pending for the next run.
+        on_result is awaited for each newly finished item (e.g. to persist it).
+        """
+        checkpoint = BatchCheckpoint(self.cache, job_id)
+        results = await checkpoint.completed()
+        pending = [request for request in requests if request.id not in results]
+        await checkpoint.start(len(requests))
+        if results:
+            logger.info("Resuming batch %s: %d done, %d pending", job_id, len(results), len(pending))
+
+        async def run_item(request: BatchRequest) -> None:
+            # One item failing outside the call itself (budget lookup,
+            # on_result) is recorded against that item, not the whole job
+            try:
+                result = await self._run_one(request)
+                if result is None:
+                    return
+                results[request.id] = result
+                await checkpoint.save(result)
+                if on_result is not None:
+                    await on_result(result)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning("Batch item %s/%s failed: %s", job_id, request.id, exc)
+                failed = BatchResult(request.id, error=f"{type(exc).__name__}: {exc}")
+                results[request.id] = failed
+                await checkpoint.save(failed)
+
+        # Batch calls queue behind every interactive and API request
+        with scheduling_scope(tenant=f"batch:{job_id}", priority=Priority.BACKGROUND):
+            with deadline_scope(timeout if timeout is not None else settings.LLM_BATCH_TIMEOUT):
+                await asyncio.gather(*(run_item(request) for request in pending))
+
+        finished = all(request.id in results and results[request.id].succeeded for request in requests)
+        await checkpoint.finish("completed" if finished else "incomplete")
+        return results
+
+    async def progress(self, job_id: str) -> Dict[str, Any]:
+        """Checkpointed progress of a job"""
+        return await BatchCheckpoint(self.cache, job_id).progress()
@@ -0,0 +1,240 @@
+"""
+LLM response caching
+Exact lookups by canonical prompt hash, plus optional embedding-similarity
+lookups scoped to a customer or session
+"""
+
+from typing import Optional, Dict, Any, List, Callable, Awaitable
+import hashlib
+import json
+import logging
+import math
+import time
+
+from redis.exceptions import RedisError
+
+from app.core.cache import CacheManager
+from app.core.config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+Embedder = Callable[[str], Awaitable[List[float]]]
+
+
+def compute_prompt_hash(
+    model: str,
+    temperature: float,
+    max_tokens: int,
+    messages: List[Dict[str, str]],
+    extra: Optional[Dict[str, Any]] = None,
+) -> str:
+    """
+    Canonical SHA-256 of a completion request
+    Keys are sorted and separators fixed so equivalent requests hash equally
+    """
+    canonical = json.dumps(
+        {
+            "model": model,
+            "temperature": round(float(temperature), 4),
+            "max_tokens": int(max_tokens),
+            "messages": [{"role": m["role"], "content": m["content"]} for m in messages],
+            "extra": extra or {},
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def compute_context_hash(messages: List[Dict[str, str]]) -> str:
+    """
+    Hash of everything before the final message: system prompt, persona and
+    prior turns. Similar questions are only reused under the same context.
+    """
+    canonical = json.dumps(
+        [{"role": m["role"], "content": m["content"]} for m in messages[:-1]],
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:32]
+
+
+def cosine_similarity(a: List[float], b: List[float]) -> float:
+    """Cosine similarity of two equal-length vectors"""
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class LLMResponseCache:
+    """Exact and semantic response cache on top of CacheManager"""
+
+    def __init__(self, cache: CacheManager, embedder: Optional[Embedder] = None):
+        self.cache = cache
+        self.embedder = embedder
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.lease_waits = 0
+
+    @property
+    def available(self) -> bool:
+        return settings.LLM_CACHE_ENABLED and self.cache.is_connected
+
+    @property
+    def semantic_enabled(self) -> bool:
+        return settings.LLM_SEMANTIC_CACHE_ENABLED and self.embedder is not None
+
+    @staticmethod
+    def _semantic_key(model: str, scope: str, messages: List[Dict[str, str]]) -> str:
+        return f"llm:semantic:{model}:{scope}:{compute_context_hash(messages)}"
+
+    async def get(self, prompt_hash: str) -> Optional[str]:
+        """Exact lookup; cache errors are treated as misses"""
+        if not self.available:
+            return None
+        try:
+            cached = await self.cache.get_llm_response(prompt_hash)
+        except RedisError as exc:
+            logger.warning("LLM cache lookup failed: %s", exc)
+            return None
+        if cached:
+            self.hits += 1
+            return cached["content"]
+        self.misses += 1
+        return None
+
+    async def set(self, prompt_hash: str, content: str, model: str, expire: int) -> None:
+        """Store a response under its prompt hash"""
+        if not self.available:
+            return
+        try:
+            await self.cache.set_llm_response(
+                prompt_hash,
+                {"content": content, "model": model, "created_at": time.time()},
+                expire,
+            )
+        except RedisError as exc:
+            logger.warning("LLM cache write failed: %s", exc)
+
+    async def fill(
+        self,
+        prompt_hash: str,
+        model: str,
+        expire: int,
+        call: Callable[[], Awaitable[str]],
+    ) -> str:
+        """
+        Run call and cache its result under a cross-worker lease
+        Workers that lose the lease wait for the holder's cached result
+        instead of repeating the provider call
+        """
+        if not self.available:
+            return await call()
+
+        lease = f"llm:{prompt_hash}"
+        try:
+            token = await self.cache.acquire_lock(lease, settings.LLM_LEASE_TIMEOUT)
+        except RedisError as exc:
+            logger.warning("LLM cache lease failed: %s", exc)
+            return await call()
+
+        if token is None:
+            self.lease_waits += 1
+            try:
+                cached = await self.cache.wait_for(f"llm:{prompt_hash}", lease, settings.LLM_LEASE_TIMEOUT)
+            except RedisError as exc:
+                logger.warning("LLM cache lease wait failed: %s", exc)
+                cached = None
+            if cached:
+                return cached["content"]
+            # The holder failed or timed out; do the work ourselves
+            content = await call()
+            await self.set(prompt_hash, content, model, expire)
+            return content
+
+        try:
+            content = await call()
+            await self.set(prompt_hash, content, model, expire)
+            return content
+        finally:
+            try:
+                await self.cache.release_lock(lease, token)
+            except RedisError as exc:
+                logger.warning("LLM cache lease release failed: %s", exc)
+
+    async def _embed(self, text: str) -> Optional[List[float]]:
+        """Prompt embedding, or None if the embedder fails; similarity reuse is best-effort"""
+        try:
+            return [float(x) for x in await self.embedder(text)]
+        except Exception as exc:
+            logger.warning("Semantic LLM cache embedding failed: %s", exc)
+            return None
+
+    async def get_similar(self, model: str, scope: str, messages: List[Dict[str, str]]) -> Optional[str]:
+        """
+        Return a cached response whose final prompt message is close enough to
+        this one's, asked under the same preceding context
+        """
+        if not (self.available and self.semantic_enabled and messages):
+            return None
+        try:
+            entries = await self.cache.get_list(self._semantic_key(model, scope, messages))
+            if not entries:
+                return None
+            vector = await self._embed(messages[-1]["content"])
+            if vector is None:
+                return None
+            best_hash, best_score = None, settings.LLM_SEMANTIC_CACHE_THRESHOLD
+            for entry in entries:
+                score = cosine_similarity(vector, entry["vector"])
+                if score >= best_score:
+                    best_hash, best_score = entry["hash"], score
+            if best_hash is None:
+                return None
+            cached = await self.cache.get_llm_response(best_hash)
+        except RedisError as exc:
+            logger.warning("Semantic LLM cache lookup failed: %s", exc)
+            return None
+        if cached:
+            self.semantic_hits += 1
+            return cached["content"]
+        return None
+
+    async def remember_similar(
+        self,
+        model: str,
+        scope: str,
+        messages: List[Dict[str, str]],
+        prompt_hash: str,
+        expire: int,
+    ) -> None:
+        """
+        Index a cached response by its final message's embedding
+        Entries are appended to a capped Redis list in one transaction, so
+        concurrent writers never drop each other's entries
+        """
+        if not (self.available and self.semantic_enabled and messages):
+            return
+        vector = await self._embed(messages[-1]["content"])
+        if vector is None:
+            return
+        try:
+            await self.cache.push_list(
+                self._semantic_key(model, scope, messages),
+                [{"hash": prompt_hash, "vector": vector}],
+                settings.LLM_SEMANTIC_CACHE_MAX_ENTRIES,
+                expire,
+            )
+        except RedisError as exc:
+            logger.warning("Semantic LLM cache write failed: %s", exc)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "lease_waits": self.lease_waits,
+        }
@@ -0,0 +1,152 @@
+"""
+Pooled HTTP transport for LLM providers
+One long-lived keep-alive/HTTP2 connection pool per provider
+"""
+
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, Any, AsyncIterator
+import importlib.util
+import logging
+
+import httpx
+
+from app.core.config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+class ProviderPoolStats:
+    """Rolling counters for a single provider pool"""
+
+    def __init__(self, max_connections: int):
+        self.max_connections = max_connections
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests_total = 0
+        self.saturated_total = 0  # Requests started while every connection was busy
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "max_connections": self.max_connections,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "requests_total": self.requests_total,
+            "saturated_total": self.saturated_total,
+            "saturation": round(self.in_flight / self.max_connections, 3) if self.max_connections else 0.0,
+        }
+
+
+class LLMTransport:
+    """Managed async HTTP transport shared by all LLM clients"""
+
+    def __init__(
+        self,
+        providers: Dict[str, Dict[str, Any]],
+        http_transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.providers = providers
+        self._http_transport = http_transport
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._stats: Dict[str, ProviderPoolStats] = {
+            name: ProviderPoolStats(self._limits_for(name).max_connections)
+            for name in providers
+        }
+
+    @staticmethod
+    def _limits_for(provider: str) -> httpx.Limits:
+        """Connection limits for a provider, falling back to the shared defaults"""
+        max_connections = {
+            "dashscope": settings.DASHSCOPE_MAX_CONNECTIONS,
+            "bailian": settings.BAILIAN_MAX_CONNECTIONS,
+        }.get(provider) or settings.LLM_MAX_CONNECTIONS
+        return httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=min(settings.LLM_MAX_KEEPALIVE_CONNECTIONS, max_connections),
+            keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY,
+        )
+
+    @staticmethod
+    def _http2_available() -> bool:
+        """HTTP/2 needs the optional h2 package"""
+        if not settings.LLM_HTTP2:
+            return False
+        if importlib.util.find_spec("h2") is None:
+            logger.warning("h2 is not installed; LLM transport falls back to HTTP/1.1")
+            return False
+        return True
+
+    @property
+    def is_open(self) -> bool:
+        return bool(self._clients)
+
+    async def open(self) -> None:
+        """Create one pooled client per provider"""
+        if self._clients:
+            return
+        http2 = self._http2_available()
+        for name, provider in self.providers.items():
+            headers = {}
+            if provider.get("api_key"):
+                headers["Authorization"] = f"Bearer {provider['api_key']}"
+            self._clients[name] = httpx.AsyncClient(
+                base_url=provider["base_url"],
+                headers=headers,
+                limits=self._limits_for(name),
+                timeout=httpx.Timeout(settings.LLM_REQUEST_TIMEOUT, connect=10.0),
+                http2=http2,
+                transport=self._http_transport,
+            )
+
+    async def close(self) -> None:
+        """Close every provider pool"""
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
+
+    async def _client(self, provider: str) -> httpx.AsyncClient:
+        # Scripts and tests may use the service outside the app lifespan
+        if not self._clients:
+            await self.open()
+        return self._clients[provider]
+
+    @asynccontextmanager
+    async def _track(self, provider: str) -> AsyncIterator[None]:
+        stats = self._stats[provider]
+        if stats.in_flight >= stats.max_connections:
+            stats.saturated_total += 1
+        stats.in_flight += 1
+        stats.requests_total += 1
+        stats.peak_in_flight = max(stats.peak_in_flight, stats.in_flight)
+        try:
+            yield
+        finally:
+            stats.in_flight -= 1
+
+    async def post(self, provider: str, path: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """POST a JSON request and return the decoded JSON response"""
+        client = await self._client(provider)
+        async with self._track(provider):
+            response = await client.post(path, json=payload)
+            response.raise_for_status()
+            return response.json()
+
+    @asynccontextmanager
+    async def stream(
+        self,
+        provider: str,
+        path: str,
+        payload: Dict[str, Any],
+    ) -> AsyncIterator[httpx.Response]:
+        """POST a JSON request and yield the streaming response"""
+        client = await self._client(provider)
+        async with self._track(provider):
+            async with client.stream(
+                "POST", path, json=payload, headers={"Accept": "text/event-stream"}
+            ) as response:
+                response.raise_for_status()
+                yield response
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Pool saturation statistics per provider"""
+        return {name: stats.as_dict() for name, stats in self._stats.items()}
@@ -0,0 +1,111 @@
+"""
+Adaptive model routing
+Tracks rolling latency, error rate and cost per model and orders fallback
+candidates so degraded models are tried last and cheaper healthy ones first
+"""
+
+from collections import deque
+from typing import Optional, Dict, Any, List, Hashable, Deque, Tuple
+import time
+
+from app.core.config import get_settings
+
+settings = get_settings()
+
+
+class ModelHealth:
+    """Rolling window of recent call outcomes for one model"""
+
+    def __init__(self, max_samples: int, window_seconds: float):
+        self.window_seconds = window_seconds
+        # (timestamp, latency seconds, succeeded, cost)
+        self._samples: Deque[Tuple[float, float, bool, float]] = deque(maxlen=max_samples)
+
+    def record(self, latency: float, success: bool, cost: float = 0.0) -> None:
+        self._samples.append((time.monotonic(), latency, success, cost))
+
+    def _recent(self) -> List[Tuple[float, float, bool, float]]:
+        cutoff = time.monotonic() - self.window_seconds
+        return [sample for sample in self._samples if sample[0] >= cutoff]
+
+    def average_cost(self) -> Optional[float]:
+        """Mean cost of recent successful calls, or None without any"""
+        costs = [cost for _, _, success, cost in self._recent() if success]
+        return sum(costs) / len(costs) if costs else None
+
+    @staticmethod
+    def _percentile(values: List[float], pct: float) -> float:
+        if not values:
+            return 0.0
+        ordered = sorted(values)
+        index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Summary of the samples inside the time window"""
+        samples = self._recent()
+        latencies = [latency for _, latency, success, _ in samples if success]
+        errors = sum(1 for _, _, success, _ in samples if not success)
+        return {
+            "samples": len(samples),
+            "p50_latency": round(self._percentile(latencies, 50), 3),
+            "p95_latency": round(self._percentile(latencies, 95), 3),
+            "error_rate": round(errors / len(samples), 3) if samples else 0.0,
+            "avg_cost": round(sum(cost for *_, cost in samples) / len(samples), 6) if samples else 0.0,
+        }
+
+
+class ModelRouter:
+    """Orders a model and its fallback chain by recent health"""
+
+    def __init__(self, fallback_chains: Dict[Hashable, List[Hashable]]):
+        self.fallback_chains = fallback_chains
+        self._health: Dict[Hashable, ModelHealth] = {}
+        self.failovers = 0
+
+    def _model_health(self, model: Hashable) -> ModelHealth:
+        if model not in self._health:
+            self._health[model] = ModelHealth(
+                settings.LLM_ROUTER_MAX_SAMPLES,
+                settings.LLM_ROUTER_WINDOW_SECONDS,
+            )
+        return self._health[model]
+
+    def record(self, model: Hashable, latency: float, success: bool, cost: float = 0.0) -> None:
+        """Record the outcome of one call"""
+        self._model_health(model).record(latency, success, cost)
+
+    def is_healthy(self, model: Hashable, latency_slo: Optional[float] = None) -> bool:
+        """
+        A model is degraded when it errors too often or its p95 latency breaks
+        the task's SLO; too few recent samples count as healthy
+        """
+        snapshot = self._model_health(model).snapshot()
+        if snapshot["samples"] < settings.LLM_ROUTER_MIN_SAMPLES:
+            return True
+        if snapshot["error_rate"] > settings.LLM_ROUTER_ERROR_THRESHOLD:
+            return False
+        if latency_slo is not None and snapshot["p95_latency"] > latency_slo:
+            return False
+        return True
+
+    def _cost_rank(self, model: Hashable) -> float:
+        cost = self._model_health(model).average_cost()
+        return float("inf") if cost is None else cost
+
+    def route(self, preferred: Hashable, latency_slo: Optional[float] = None) -> List[Hashable]:
+        """
+        Candidates to try in order: the preferred model while healthy, healthy
+        fallbacks by recent average cost, then degraded ones. Fallbacks without
+        cost samples, and equal costs, keep their chain order
+        """
+        chain = [preferred] + [m for m in self.fallback_chains.get(preferred, []) if m != preferred]
+        healthy = [m for m in chain if self.is_healthy(m, latency_slo)]
+        degraded = [m for m in chain if m not in healthy]
+        if healthy and healthy[0] == preferred:
+            return [preferred] + sorted(healthy[1:], key=self._cost_rank) + degraded
+        return sorted(healthy, key=self._cost_rank) + degraded
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Rolling health per model"""
+        return {str(getattr(m, "value", m)): h.snapshot() for m, h in self._health.items()}
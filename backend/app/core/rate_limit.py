@@ -0,0 +1,135 @@
+"""
+Redis-backed token-bucket rate limiting for LLM providers
+Meters requests-per-minute and tokens-per-minute quotas per model
+"""
+
+from typing import Optional, Dict, Any, List
+import asyncio
+import logging
+import time
+
+from redis.exceptions import RedisError
+
+from app.core.cache import CacheManager
+from app.core.config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Refill both buckets for elapsed time, then take the request and token cost
+# only if both can afford it. Returns {admitted, requests_left, tokens_left,
+# retry_after_ms}.
+TOKEN_BUCKET_SCRIPT = """
+local now = tonumber(ARGV[1])
+local rpm = tonumber(ARGV[2])
+local tpm = tonumber(ARGV[3])
+local request_cost = tonumber(ARGV[4])
+local token_cost = tonumber(ARGV[5])
+
+local function refill(key, capacity)
+    local state = redis.call("hmget", key, "level", "ts")
+    local level = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    return math.min(capacity, level + math.max(0, now - ts) * capacity / 60)
+end
+
+local requests = refill(KEYS[1], rpm)
+local tokens = refill(KEYS[2], tpm)
+local admitted = 0
+local wait = 0
+
+if requests >= request_cost and tokens >= token_cost then
+    requests = requests - request_cost
+    tokens = tokens - token_cost
+    admitted = 1
+else
+    wait = math.max((request_cost - requests) * 60 / rpm, (token_cost - tokens) * 60 / tpm)
+end
+
+redis.call("hset", KEYS[1], "level", requests, "ts", now)
+redis.call("hset", KEYS[2], "level", tokens, "ts", now)
+redis.call("expire", KEYS[1], 120)
+redis.call("expire", KEYS[2], 120)
+return {admitted, math.floor(requests), math.floor(tokens), math.ceil(wait * 1000)}
+"""
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a request is shed because the model's budget is exhausted"""
+
+    def __init__(self, model: str, retry_after: float):
+        super().__init__(f"Rate limit exhausted for {model}; retry after {retry_after:.1f}s")
+        self.model = model
+        self.retry_after = retry_after
+
+
+class LLMRateLimiter:
+    """Per-model RPM/TPM token buckets shared by all workers"""
+
+    def __init__(self, cache: CacheManager):
+        self.cache = cache
+        self.shed_total = 0
+        self.queued_total = 0
+
+    @property
+    def available(self) -> bool:
+        return settings.LLM_RATE_LIMIT_ENABLED and self.cache.is_connected
+
+    @staticmethod
+    def _keys(model: str) -> List[str]:
+        return [f"ratelimit:{model}:requests", f"ratelimit:{model}:tokens"]
+
+    async def _take(self, model: str, quota: Dict[str, Any], requests: int, tokens: int) -> List[int]:
+        # A request larger than the whole bucket could never be admitted
+        tokens = min(tokens, quota["tpm"])
+        return await self.cache.client.eval(
+            TOKEN_BUCKET_SCRIPT,
+            2,
+            *self._keys(model),
+            time.time(),
+            quota["rpm"],
+            quota["tpm"],
+            requests,
+            tokens,
+        )
+
+    async def acquire(
+        self,
+        model: str,
+        quota: Dict[str, Any],
+        tokens: int,
+        max_wait: Optional[float] = None,
+    ) -> None:
+        """
+        Reserve one request and tokens from the model's budget
+        Waits up to max_wait seconds for refill, then raises RateLimitExceeded
+        """
+        if not self.available:
+            return
+        max_wait = settings.LLM_RATE_LIMIT_MAX_WAIT if max_wait is None else max_wait
+        deadline = time.monotonic() + max_wait
+        queued = False
+        while True:
+            try:
+                admitted, _, _, retry_after_ms = await self._take(model, quota, 1, tokens)
+            except RedisError as exc:
+                # Fail open: the provider's own limits still apply
+                logger.warning("Rate limiter unavailable: %s", exc)
+                return
+            if admitted:
+                return
+            retry_after = retry_after_ms / 1000
+            if time.monotonic() + retry_after > deadline:
+                self.shed_total += 1
+                raise RateLimitExceeded(model, retry_after)
+            if not queued:
+                queued = True
+                self.queued_total += 1
+            await asyncio.sleep(retry_after)
+
+    async def remaining(self, model: str, quota: Dict[str, Any]) -> Dict[str, int]:
+        """Current request and token budget for a model"""
+        if not self.available:
+            return {"requests": quota["rpm"], "tokens": quota["tpm"]}
+        _, requests, tokens, _ = await self._take(model, quota, 0, 0)
+        return {"requests": requests, "tokens": tokens}
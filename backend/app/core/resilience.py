@@ -0,0 +1,170 @@
+"""
+Resilience primitives for outbound calls
+Request deadlines, jittered retries and circuit breakers
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import Enum
+from typing import Optional, Dict, Any, Callable, Awaitable, Iterator, TypeVar
+import asyncio
+import random
+import time
+
+T = TypeVar("T")
+
+# Absolute monotonic deadline for the current request, if one is set
+_request_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """Raised when the request's time budget is used up"""
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because its circuit is open"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Circuit {name} is open; retry after {retry_after:.1f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+@contextmanager
+def deadline_scope(seconds: float) -> Iterator[None]:
+    """
+    Bound everything awaited inside the block to a time budget
+    Nested scopes can only shorten the enclosing deadline
+    """
+    deadline = time.monotonic() + seconds
+    current = _request_deadline.get()
+    token = _request_deadline.set(deadline if current is None else min(current, deadline))
+    try:
+        yield
+    finally:
+        _request_deadline.reset(token)
+
+
+def remaining_time() -> Optional[float]:
+    """Seconds left in the current request budget, or None without a deadline"""
+    deadline = _request_deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def call_timeout(default: float) -> float:
+    """Per-call timeout: the default capped by the remaining request budget"""
+    remaining = remaining_time()
+    if remaining is None:
+        return default
+    if remaining <= 0:
+        raise DeadlineExceeded("Request deadline exceeded")
+    return min(default, remaining)
+
+
+class RetryPolicy:
+    """Retry settings for one kind of call"""
+
+    def __init__(
+        self,
+        max_retries: int = 3,
+        retry_delay: float = 1.0,
+        timeout: float = 60.0,
+        max_delay: float = 30.0,
+    ):
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.timeout = timeout
+        self.max_delay = max_delay
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff for the given retry attempt"""
+        return random.uniform(0, min(self.max_delay, self.retry_delay * 2 ** attempt))
+
+
+async def run_with_retries(
+    fn: Callable[[], Awaitable[T]],
+    policy: RetryPolicy,
+    is_retryable: Callable[[BaseException], bool],
+) -> T:
+    """
+    Run fn with a per-attempt timeout, retrying retryable errors with backoff
+    Attempts and backoff sleeps never outlive the request deadline
+    """
+    attempt = 0
+    while True:
+        try:
+            # Raises before fn() runs once the deadline has passed
+            timeout = call_timeout(policy.timeout)
+            return await asyncio.wait_for(fn(), timeout)
+        except DeadlineExceeded:
+            raise
+        except Exception as exc:
+            if attempt >= policy.max_retries or not is_retryable(exc):
+                raise
+            delay = policy.backoff(attempt)
+            if isinstance(exc, CircuitOpenError):
+                delay = max(delay, exc.retry_after)
+            remaining = remaining_time()
+            if remaining is not None and delay >= remaining:
+                raise
+            attempt += 1
+            await asyncio.sleep(delay)
+
+
+class CircuitState(str, Enum):
+    """Circuit breaker states"""
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker
+    After failure_threshold failures the circuit opens and rejects calls for
+    recovery_timeout seconds, then lets a single trial call through
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = CircuitState.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._trial_in_flight = False
+
+    def before_call(self) -> None:
+        """Raise CircuitOpenError if the call must not be attempted"""
+        if self.state == CircuitState.CLOSED:
+            return
+        if self.state == CircuitState.OPEN:
+            elapsed = time.monotonic() - self.opened_at
+            if elapsed < self.recovery_timeout:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, self.recovery_timeout - elapsed)
+            self.state = CircuitState.HALF_OPEN
+        if self._trial_in_flight:
+            self.rejected += 1
+            raise CircuitOpenError(self.name, self.recovery_timeout)
+        self._trial_in_flight = True
+
+    def record_success(self) -> None:
+        self.state = CircuitState.CLOSED
+        self.failures = 0
+        self._trial_in_flight = False
+
+    def release(self) -> None:
+        """End a call without a verdict (e.g. cancelled) so another trial may run"""
+        self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self._trial_in_flight = False
+        self.failures += 1
+        if self.state == CircuitState.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = CircuitState.OPEN
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"state": self.state.value, "failures": self.failures, "rejected": self.rejected}
@@ -0,0 +1,188 @@
+"""
+Hybrid retrieval over the knowledge base
+BM25 keyword search and FAISS vector search fused by reciprocal rank, an
+optional rerank of the top hits by a cheap model, and a cache of results
+for repeated queries
+"""
+
+from typing import Optional, Dict, Any, List, Tuple
+import hashlib
+import json
+import logging
+import re
+
+from redis.exceptions import RedisError
+
+from app.core.cache import CacheManager, cache_manager
+from app.core.config import get_settings
+from app.core.llm import LLMService, TaskType, llm_service
+from app.core.tokenizer import get_tokenizer
+from app.core.vector_store import KnowledgeBase, SearchHit, knowledge_base
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+RERANK_PROMPT = """Rank the passages by how well they answer the query.
+Reply with a JSON array of passage numbers, most relevant first.
+Leave out passages that do not help answer the query.
+
+Query: {query}
+
+Passages:
+{passages}
+
+Ranking:"""
+
+_JSON_ARRAY = re.compile(r"\[[\d,\s]*\]")
+
+
+def reciprocal_rank_fusion(rankings: List[List[int]], k: Optional[int] = None) -> List[Tuple[int, float]]:
+    """
+    Fuse ranked id lists: each list adds 1 / (k + rank) to an id's score
+    Ranks rather than raw scores are used, so BM25 and cosine scores need
+    no calibration against each other
+    """
+    k = k if k is not None else settings.RETRIEVAL_RRF_K
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def parse_ranking(text: str, count: int) -> Optional[List[int]]:
+    """Zero-based passage order from a rerank reply, or None if it has none"""
+    match = _JSON_ARRAY.search(text)
+    if match is None:
+        return None
+    order: List[int] = []
+    for number in json.loads(match.group(0)):
+        if 1 <= number <= count and number - 1 not in order:
+            order.append(number - 1)
+    return order or None
+
+
+class HybridRetriever:
+    """
+    Retrieval engine for the RETRIEVAL task
+    Both searches run over the local knowledge base; the LLM is only asked to
+    reorder the fused top hits when reranking is on
+    """
+
+    def __init__(self, kb: KnowledgeBase, llm: LLMService, cache: CacheManager):
+        self.kb = kb
+        self.llm = llm
+        self.cache = cache
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.reranks = 0
+        self.vector_failures = 0
+
+    async def _cache_key(self, query: str, k: int, rerank: bool) -> str:
+        """Key on the normalized query and the index version, so updates invalidate"""
+        normalized = " ".join(query.lower().split())
+        digest = hashlib.sha256(f"{normalized}\x00{k}\x00{int(rerank)}".encode("utf-8")).hexdigest()
+        return f"retrieval:{await self.kb.current_version()}:{digest}"
+
+    async def retrieve(self, query: str, k: int = 5, rerank: Optional[bool] = None) -> List[SearchHit]:
+        """Top-k chunks for the query; scores are fused ranks, not similarities"""
+        rerank = settings.RETRIEVAL_RERANK_ENABLED if rerank is None else rerank
+        key = await self._cache_key(query, k, rerank)
+        cached = await self._cached(key)
+        if cached is not None:
+            return cached
+
+        hits = await self._search(query, max(k, settings.RETRIEVAL_RERANK_CANDIDATES if rerank else k))
+        if rerank:
+            hits = await self._rerank(query, hits)
+        hits = hits[:k]
+
+        if self.cache.is_connected:
+            try:
+                await self.cache.set(
+                    key, [{"id": hit.chunk.id, "score": hit.score} for hit in hits], settings.RETRIEVAL_CACHE_TTL
+                )
+            except RedisError as exc:
+                logger.warning("Retrieval cache write failed: %s", exc)
+        return hits
+
+    async def _cached(self, key: str) -> Optional[List[SearchHit]]:
+        if not self.cache.is_connected:
+            return None
+        try:
+            entries = await self.cache.get(key)
+        except RedisError as exc:
+            logger.warning("Retrieval cache lookup failed: %s", exc)
+            return None
+        if entries is None:
+            self.cache_misses += 1
+            return None
+        self.cache_hits += 1
+        chunks = await self.kb.get_chunks([entry["id"] for entry in entries])
+        return [SearchHit(chunks[entry["id"]], entry["score"]) for entry in entries if entry["id"] in chunks]
+
+    async def _search(self, query: str, limit: int) -> List[SearchHit]:
+        """Fuse keyword and vector candidates; a failing embedder leaves keyword results"""
+        candidates = settings.RETRIEVAL_CANDIDATES
+        keyword = await self.kb.keyword_search(query, candidates)
+        try:
+            semantic = await self.kb.search(query, candidates)
+        except Exception as exc:
+            self.vector_failures += 1
+            logger.warning("Vector search failed, using keyword results only: %s", exc)
+            semantic = []
+
+        chunks = {hit.chunk.id: hit.chunk for hit in keyword + semantic}
+        fused = reciprocal_rank_fusion([
+            [hit.chunk.id for hit in keyword],
+            [hit.chunk.id for hit in semantic],
+        ])
+        return [SearchHit(chunks[chunk_id], score) for chunk_id, score in fused[:limit]]
+
+    async def _rerank(self, query: str, hits: List[SearchHit]) -> List[SearchHit]:
+        """
+        Reorder hits by a cheap model's judgement
+        Passages the model leaves out keep their fused order after the ranked
+        ones; an unusable reply keeps the fused order
+        """
+        if len(hits) < 2:
+            return hits
+        tokenizer = get_tokenizer()
+        passages = "\n\n".join(
+            f"[{number}] {hit.chunk.title}\n"
+            f"{tokenizer.truncate(hit.chunk.text, settings.RETRIEVAL_RERANK_PASSAGE_TOKENS)}"
+            for number, hit in enumerate(hits, start=1)
+        )
+        try:
+            reply = await self.llm.generate(
+                RERANK_PROMPT.format(query=query, passages=passages),
+                task=TaskType.RETRIEVAL,
+                temperature=0.0,
+                max_tokens=128,
+            )
+        except Exception as exc:
+            logger.warning("Retrieval rerank failed, keeping fused order: %s", exc)
+            return hits
+        order = parse_ranking(reply, len(hits))
+        if order is None:
+            return hits
+        self.reranks += 1
+        ranked = set(order)
+        return [hits[i] for i in order] + [hit for i, hit in enumerate(hits) if i not in ranked]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "reranks": self.reranks,
+            "vector_failures": self.vector_failures,
+        }
+
+
+# Global retriever over the shared knowledge base
+retriever = HybridRetriever(knowledge_base, llm_service, cache_manager)
+
+
+async def get_retriever() -> HybridRetriever:
+    """Dependency for getting the hybrid retriever"""
+    return retriever
@@ -0,0 +1,259 @@
+"""
+Priority-aware scheduling for LLM calls
+Strict priority between traffic classes, weighted fair queuing between
+users/sessions inside a class, and queue-depth admission control. Bulk and
+background calls together never hold every slot, so interactive and standard
+calls are admitted even while long batch work saturates the gate
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Optional, Dict, Any, List, Iterator, Tuple
+import asyncio
+import heapq
+import itertools
+import time
+
+from app.core.config import get_settings
+from app.core.telemetry import Histogram, METRIC_PREFIX, format_labels
+
+settings = get_settings()
+
+
+class Priority(IntEnum):
+    """Traffic classes; lower values are always served first"""
+    INTERACTIVE = 0     # A user is waiting on the reply (role play)
+    STANDARD = 1        # Request/response API work
+    BULK = 2            # Long-running research and analysis
+    BACKGROUND = 3      # Offline batch jobs
+
+
+# Waiting requests allowed per class before new ones are rejected
+QUEUE_DEPTH_LIMITS: Dict[Priority, int] = {
+    Priority.INTERACTIVE: 200,
+    Priority.STANDARD: 200,
+    Priority.BULK: 100,
+    Priority.BACKGROUND: 1000,
+}
+
+# Classes limited to LLM_SCHEDULER_LOW_PRIORITY_SHARE of the slots
+LOW_PRIORITY = (Priority.BULK, Priority.BACKGROUND)
+
+DEFAULT_TENANT = "anonymous"
+
+# (priority override, tenant) for calls made in the current context
+_schedule_context: ContextVar[Tuple[Optional[Priority], Optional[str]]] = ContextVar(
+    "schedule_context", default=(None, None)
+)
+
+
+class SchedulerQueueFull(Exception):
+    """Raised when a request is rejected because its class queue is full"""
+
+    def __init__(self, priority: Priority, depth: int):
+        super().__init__(f"LLM queue for {priority.name.lower()} traffic is full ({depth} waiting)")
+        self.priority = priority
+        self.depth = depth
+
+
+@contextmanager
+def scheduling_scope(tenant: Optional[str] = None, priority: Optional[Priority] = None) -> Iterator[None]:
+    """Attribute LLM calls in the block to a tenant and optionally force their priority"""
+    current_priority, current_tenant = _schedule_context.get()
+    token = _schedule_context.set((
+        priority if priority is not None else current_priority,
+        tenant if tenant is not None else current_tenant,
+    ))
+    try:
+        yield
+    finally:
+        _schedule_context.reset(token)
+
+
+def current_schedule() -> Tuple[Optional[Priority], str]:
+    """Priority override and tenant of the current context"""
+    priority, tenant = _schedule_context.get()
+    return priority, tenant or DEFAULT_TENANT
+
+
+class _Waiter:
+    __slots__ = ("future", "priority", "cancelled")
+
+    def __init__(self, future: asyncio.Future, priority: Priority):
+        self.future = future
+        self.priority = priority
+        self.cancelled = False
+
+
+class LLMScheduler:
+    """
+    Concurrency gate in front of the provider clients
+    Up to max_concurrency calls run at once; the rest queue by class. Bulk and
+    background calls share at most low_priority_limit of those slots, so the
+    remainder is always free for interactive and standard traffic. Within a
+    class, start-time fair queuing gives each tenant a share proportional to
+    its weight, so one busy session cannot crowd out the others.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: Optional[int] = None,
+        queue_limits: Optional[Dict[Priority, int]] = None,
+        low_priority_share: Optional[float] = None,
+    ):
+        self.max_concurrency = max_concurrency or settings.LLM_SCHEDULER_MAX_CONCURRENCY
+        self.queue_limits = queue_limits or QUEUE_DEPTH_LIMITS
+        share = settings.LLM_SCHEDULER_LOW_PRIORITY_SHARE if low_priority_share is None else low_priority_share
+        self.low_priority_limit = max(1, int(self.max_concurrency * share))
+        self.active = 0
+        self._active: Dict[Priority, int] = {p: 0 for p in Priority}
+        self.weights: Dict[str, float] = {}
+        self._queues: Dict[Priority, List[Tuple[float, int, _Waiter]]] = {p: [] for p in Priority}
+        self._depth: Dict[Priority, int] = {p: 0 for p in Priority}
+        self._virtual_time: Dict[Priority, float] = {p: 0.0 for p in Priority}
+        self._last_finish: Dict[Tuple[Priority, str], float] = {}
+        self._sequence = itertools.count()
+        self.wait_seconds: Dict[Priority, Histogram] = {p: Histogram() for p in Priority}
+        self.admitted: Dict[Priority, int] = {p: 0 for p in Priority}
+        self.rejected: Dict[Priority, int] = {p: 0 for p in Priority}
+
+    def set_weight(self, tenant: str, weight: float) -> None:
+        """Give a tenant a larger (or smaller) share of its class"""
+        self.weights[tenant] = weight
+
+    @property
+    def queued(self) -> int:
+        return sum(self._depth.values())
+
+    def _can_start(self, priority: Priority) -> bool:
+        if self.active >= self.max_concurrency:
+            return False
+        if priority in LOW_PRIORITY:
+            return sum(self._active[p] for p in LOW_PRIORITY) < self.low_priority_limit
+        return True
+
+    def _start(self, priority: Priority) -> None:
+        self.active += 1
+        self._active[priority] += 1
+
+    async def acquire(self, priority: Priority, tenant: str = DEFAULT_TENANT, cost: float = 1.0) -> float:
+        """
+        Wait for a slot; returns seconds spent queued
+        Raises SchedulerQueueFull instead of queueing past the class limit;
+        pass the same priority to release() when the call is done
+        """
+        ahead = any(self._depth[p] for p in Priority if p <= priority)
+        if self._can_start(priority) and not ahead:
+            self._start(priority)
+            self.admitted[priority] += 1
+            self.wait_seconds[priority].observe(0.0)
+            return 0.0
+
+        depth = self._depth[priority]
+        if depth >= self.queue_limits.get(priority, 0):
+            self.rejected[priority] += 1
+            raise SchedulerQueueFull(priority, depth)
+
+        # Start-time fair queuing: a tenant's tag advances by cost/weight per
+        # request, and never lags the class's virtual clock
+        key = (priority, tenant)
+        tag = max(self._virtual_time[priority], self._last_finish.get(key, 0.0)) + cost / self.weights.get(tenant, 1.0)
+        self._last_finish[key] = tag
+        if len(self._last_finish) > 10000:
+            self._prune()
+
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), priority)
+        heapq.heappush(self._queues[priority], (tag, next(self._sequence), waiter))
+        self._depth[priority] += 1
+        enqueued = time.perf_counter()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Granted a slot just as we were cancelled; hand it on
+                self.release(priority)
+            else:
+                waiter.cancelled = True
+                self._depth[priority] -= 1
+            raise
+        waited = time.perf_counter() - enqueued
+        self.admitted[priority] += 1
+        self.wait_seconds[priority].observe(waited)
+        return waited
+
+    def release(self, priority: Priority) -> None:
+        """Free a slot of the given class and hand slots to the next waiters"""
+        self.active -= 1
+        self._active[priority] -= 1
+        while self.active < self.max_concurrency:
+            waiter = self._next_waiter()
+            if waiter is None:
+                return
+            self._start(waiter.priority)
+            waiter.future.set_result(None)
+
+    def _next_waiter(self) -> Optional[_Waiter]:
+        """Oldest-tagged waiter of the highest class that may take a slot now"""
+        for priority in Priority:
+            if not self._can_start(priority):
+                continue
+            queue = self._queues[priority]
+            while queue:
+                tag, _, waiter = heapq.heappop(queue)
+                if waiter.cancelled:
+                    continue
+                self._depth[priority] -= 1
+                self._virtual_time[priority] = tag
+                return waiter
+        return None
+
+    def _prune(self) -> None:
+        """Forget tenants whose tags the class clock has already passed"""
+        self._last_finish = {
+            key: tag for key, tag in self._last_finish.items() if tag > self._virtual_time[key[0]]
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "max_concurrency": self.max_concurrency,
+            "low_priority_limit": self.low_priority_limit,
+            "classes": {
+                priority.name.lower(): {
+                    "active": self._active[priority],
+                    "queued": self._depth[priority],
+                    "admitted": self.admitted[priority],
+                    "rejected": self.rejected[priority],
+                    "avg_wait": round(
+                        self.wait_seconds[priority].sum / self.wait_seconds[priority].count, 4
+                    ) if self.wait_seconds[priority].count else 0.0,
+                }
+                for priority in Priority
+            },
+        }
+
+    def render_prometheus(self) -> str:
+        """Queue depth, admissions and queue-wait histograms per class"""
+        prefix = f"{METRIC_PREFIX}_scheduler"
+        lines = [
+            f"# HELP {prefix}_active LLM calls currently holding a slot",
+            f"# TYPE {prefix}_active gauge",
+            f"{prefix}_active {self.active}",
+            f"# HELP {prefix}_queued LLM calls waiting for a slot",
+            f"# TYPE {prefix}_queued gauge",
+        ]
+        lines += [f"{prefix}_queued{format_labels(priority=p.name.lower())} {self._depth[p]}" for p in Priority]
+        for name, counts in (("admitted_total", self.admitted), ("rejected_total", self.rejected)):
+            lines.append(f"# TYPE {prefix}_{name} counter")
+            lines += [f"{prefix}_{name}{format_labels(priority=p.name.lower())} {counts[p]}" for p in Priority]
+        lines.append(f"# HELP {prefix}_wait_seconds Time spent queued for a slot")
+        lines.append(f"# TYPE {prefix}_wait_seconds histogram")
+        for priority in Priority:
+            histogram = self.wait_seconds[priority]
+            label = priority.name.lower()
+            for le, count in histogram.cumulative():
+                lines.append(f"{prefix}_wait_seconds_bucket{format_labels(priority=label, le=le)} {count}")
+            lines.append(f"{prefix}_wait_seconds_sum{format_labels(priority=label)} {histogram.sum:.6f}")
+            lines.append(f"{prefix}_wait_seconds_count{format_labels(priority=label)} {histogram.count}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,393 @@
+"""
+LLM usage telemetry
+Per-call token, latency and cost accounting, aggregated in process, exported
+as Prometheus text and flushed to Redis in batches
+"""
+
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field, asdict
+from enum import Enum
+from typing import Optional, Dict, Any, List, Deque, Iterator, Tuple
+import asyncio
+import json
+import logging
+import time
+
+from redis.exceptions import RedisError
+
+from app.core.cache import CacheManager
+from app.core.config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds in seconds
+LATENCY_BUCKETS: Tuple[float, ...] = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+METRIC_PREFIX = "tokenholic_llm"
+
+
+class CacheOutcome(str, Enum):
+    """How a call was served relative to the response cache"""
+    HIT = "hit"                     # Exact prompt-hash hit
+    SEMANTIC_HIT = "semantic_hit"   # Similar-query hit
+    COALESCED = "coalesced"         # Shared another request's provider call
+    MISS = "miss"                   # Went to the provider
+    BYPASS = "bypass"               # Cache not used (streaming, opted out)
+
+
+@dataclass
+class LLMCallRecord:
+    """Usage and timings of one completed LLM call"""
+    model: str
+    task: str
+    cache: CacheOutcome
+    success: bool = True
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0      # Prompt tokens served from the provider's context cache
+    cost: float = 0.0
+    queue_time: float = 0.0     # Waiting for a scheduler slot and rate-limit admission
+    ttft: float = 0.0           # Time to first token; the whole call when not streaming
+    total_time: float = 0.0
+    estimated: bool = True      # Token counts estimated locally, not reported by the provider
+    timestamp: float = field(default_factory=time.time)
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["cache"] = self.cache.value
+        return data
+
+
+class CallTrace:
+    """Mutable state for one LLM call while it runs"""
+
+    def __init__(self, task: Optional[str], model: str, cache: CacheOutcome = CacheOutcome.BYPASS):
+        self.started = time.perf_counter()
+        self.task = task or "none"
+        self.model = model
+        self.cache = cache
+        self.queue_time = 0.0
+        self.ttft: Optional[float] = None
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.cost = 0.0
+        self.estimated = True
+
+    def first_token(self) -> None:
+        if self.ttft is None:
+            self.ttft = time.perf_counter() - self.started
+
+    def usage(
+        self,
+        prompt_tokens: int,
+        completion_tokens: int,
+        cost: float,
+        estimated: bool = True,
+        cached_tokens: int = 0,
+    ) -> None:
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.cached_tokens = cached_tokens
+        self.cost = cost
+        self.estimated = estimated
+
+    def finish(self, success: bool) -> LLMCallRecord:
+        total = time.perf_counter() - self.started
+        return LLMCallRecord(
+            model=self.model,
+            task=self.task,
+            cache=self.cache,
+            success=success,
+            prompt_tokens=self.prompt_tokens,
+            completion_tokens=self.completion_tokens,
+            cached_tokens=self.cached_tokens,
+            cost=self.cost,
+            queue_time=self.queue_time,
+            ttft=self.ttft if self.ttft is not None else total,
+            total_time=total,
+            estimated=self.estimated,
+        )
+
+
+# Calls made while handling the current HTTP request, if it is being tracked
+_request_usage: ContextVar[Optional[List[LLMCallRecord]]] = ContextVar("request_usage", default=None)
+
+
+@contextmanager
+def usage_scope() -> Iterator[List[LLMCallRecord]]:
+    """Collect every LLM call recorded inside the block"""
+    records: List[LLMCallRecord] = []
+    token = _request_usage.set(records)
+    try:
+        yield records
+    finally:
+        _request_usage.reset(token)
+
+
+def summarize_usage(records: List[LLMCallRecord]) -> Dict[str, Any]:
+    """Per-request breakdown: totals plus one entry per model"""
+    by_model: Dict[str, Dict[str, Any]] = {}
+    for record in records:
+        entry = by_model.setdefault(
+            record.model, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0}
+        )
+        entry["calls"] += 1
+        entry["prompt_tokens"] += record.prompt_tokens
+        entry["completion_tokens"] += record.completion_tokens
+        entry["cost"] = round(entry["cost"] + record.cost, 6)
+    return {
+        "calls": len(records),
+        "cache_hits": sum(1 for r in records if r.cache in (CacheOutcome.HIT, CacheOutcome.SEMANTIC_HIT)),
+        "prompt_tokens": sum(r.prompt_tokens for r in records),
+        "completion_tokens": sum(r.completion_tokens for r in records),
+        "cost": round(sum(r.cost for r in records), 6),
+        "models": by_model,
+    }
+
+
+class Histogram:
+    """Fixed-bucket histogram in the Prometheus layout"""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """(le, cumulative count) pairs including +Inf"""
+        pairs: List[Tuple[str, int]] = []
+        running = 0
+        for bound, count in zip(self.buckets, self.counts):
+            running += count
+            pairs.append((f"{bound:g}", running))
+        pairs.append(("+Inf", self.count))
+        return pairs
+
+
+def format_labels(**labels: str) -> str:
+    """Render Prometheus label pairs"""
+    body = ",".join(f'{key}="{value}"' for key, value in labels.items())
+    return "{" + body + "}"
+
+
+class LLMTelemetry:
+    """
+    In-process aggregates of LLM usage
+    record() is synchronous and O(1); a background task flushes pending records
+    to Redis as daily per-model/task rollups plus a capped list of recent calls
+    """
+
+    def __init__(self, cache: CacheManager):
+        self.cache = cache
+        # (model, task, cache outcome, status) -> calls
+        self._calls: Dict[Tuple[str, str, str, str], int] = {}
+        # (model, task) -> [prompt tokens, completion tokens, cost, cached prompt tokens]
+        self._usage: Dict[Tuple[str, str], List[float]] = {}
+        self._latency: Dict[Tuple[str, str], Histogram] = {}
+        self._ttft: Dict[Tuple[str, str], Histogram] = {}
+        self._queue: Dict[Tuple[str, str], Histogram] = {}
+        self._pending: Deque[LLMCallRecord] = deque(maxlen=settings.LLM_TELEMETRY_BUFFER_SIZE)
+        self._flusher: Optional[asyncio.Task] = None
+        self.flushed_total = 0
+        self.flush_errors = 0
+        # Records evicted unwritten because the pending buffer was full
+        self.dropped = 0
+
+    def record(self, record: LLMCallRecord) -> None:
+        """Account for one finished call"""
+        request_records = _request_usage.get()
+        if request_records is not None:
+            request_records.append(record)
+        if not settings.LLM_TELEMETRY_ENABLED:
+            return
+
+        status = "ok" if record.success else "error"
+        call_key = (record.model, record.task, record.cache.value, status)
+        self._calls[call_key] = self._calls.get(call_key, 0) + 1
+
+        key = (record.model, record.task)
+        usage = self._usage.setdefault(key, [0, 0, 0.0, 0])
+        usage[0] += record.prompt_tokens
+        usage[1] += record.completion_tokens
+        usage[2] += record.cost
+        usage[3] += record.cached_tokens
+        if record.success:
+            self._latency.setdefault(key, Histogram()).observe(record.total_time)
+            self._ttft.setdefault(key, Histogram()).observe(record.ttft)
+        self._queue.setdefault(key, Histogram()).observe(record.queue_time)
+        if len(self._pending) == self._pending.maxlen:
+            self.dropped += 1
+        self._pending.append(record)
+
+    # Export
+
+    def render_prometheus(self) -> str:
+        """Aggregates in the Prometheus text exposition format"""
+        lines: List[str] = []
+
+        lines.append(f"# HELP {METRIC_PREFIX}_calls_total LLM calls by model, task, cache outcome and status")
+        lines.append(f"# TYPE {METRIC_PREFIX}_calls_total counter")
+        for (model, task, cache, status), count in sorted(self._calls.items()):
+            labels = format_labels(model=model, task=task, cache=cache, status=status)
+            lines.append(f"{METRIC_PREFIX}_calls_total{labels} {count}")
+
+        for index, name, help_text in (
+            (0, "prompt_tokens_total", "Prompt tokens sent to providers"),
+            (1, "completion_tokens_total", "Completion tokens received from providers"),
+            (2, "cost_cny_total", "Estimated provider spend in CNY"),
+            (3, "cached_prompt_tokens_total", "Prompt tokens served from provider context caches"),
+        ):
+            lines.append(f"# HELP {METRIC_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name} counter")
+            for (model, task), usage in sorted(self._usage.items()):
+                value = usage[index]
+                rendered = f"{value:.6f}" if index == 2 else str(int(value))
+                lines.append(f"{METRIC_PREFIX}_{name}{format_labels(model=model, task=task)} {rendered}")
+
+        for name, histograms, help_text in (
+            ("latency_seconds", self._latency, "End-to-end latency of successful calls"),
+            ("ttft_seconds", self._ttft, "Time to first token of successful calls"),
+            ("queue_seconds", self._queue, "Time spent waiting for a slot and rate-limit admission"),
+        ):
+            lines.append(f"# HELP {METRIC_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name} histogram")
+            for (model, task), histogram in sorted(histograms.items()):
+                for le, count in histogram.cumulative():
+                    labels = format_labels(model=model, task=task, le=le)
+                    lines.append(f"{METRIC_PREFIX}_{name}_bucket{labels} {count}")
+                labels = format_labels(model=model, task=task)
+                lines.append(f"{METRIC_PREFIX}_{name}_sum{labels} {histogram.sum:.6f}")
+                lines.append(f"{METRIC_PREFIX}_{name}_count{labels} {histogram.count}")
+
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict[str, Any]:
+        """JSON-friendly totals per model and task"""
+        models: Dict[str, Dict[str, Any]] = {}
+        for (model, task), (prompt, completion, cost, cached) in self._usage.items():
+            calls = sum(c for (m, t, _, _), c in self._calls.items() if (m, t) == (model, task))
+            hits = sum(
+                c for (m, t, outcome, _), c in self._calls.items()
+                if (m, t) == (model, task)
+                and outcome in (CacheOutcome.HIT.value, CacheOutcome.SEMANTIC_HIT.value)
+            )
+            latency = self._latency.get((model, task))
+            models.setdefault(model, {})[task] = {
+                "calls": calls,
+                "cache_hits": hits,
+                "prompt_tokens": int(prompt),
+                "completion_tokens": int(completion),
+                "cached_tokens": int(cached),
+                "cost": round(cost, 6),
+                "avg_latency": round(latency.sum / latency.count, 3) if latency and latency.count else 0.0,
+            }
+        return {
+            "models": models,
+            "pending": len(self._pending),
+            "flushed": self.flushed_total,
+            "flush_errors": self.flush_errors,
+            "dropped": self.dropped,
+        }
+
+    # Persistence
+
+    async def flush(self) -> int:
+        """Write up to one batch of pending records to Redis; returns how many"""
+        if not self._pending or not self.cache.is_connected:
+            return 0
+        batch = [self._pending.popleft() for _ in range(min(len(self._pending), settings.LLM_TELEMETRY_BATCH_SIZE))]
+
+        # Roll the batch up first so each model/task costs a handful of commands
+        rollups: Dict[Tuple[str, str], Dict[str, float]] = {}
+        for record in batch:
+            day = time.strftime("%Y%m%d", time.gmtime(record.timestamp))
+            fields = rollups.setdefault((day, f"{record.model}|{record.task}"), {})
+            fields["calls"] = fields.get("calls", 0) + 1
+            fields["errors"] = fields.get("errors", 0) + (0 if record.success else 1)
+            fields["cache_hits"] = fields.get("cache_hits", 0) + (
+                1 if record.cache in (CacheOutcome.HIT, CacheOutcome.SEMANTIC_HIT) else 0
+            )
+            fields["prompt_tokens"] = fields.get("prompt_tokens", 0) + record.prompt_tokens
+            fields["completion_tokens"] = fields.get("completion_tokens", 0) + record.completion_tokens
+            fields["cached_tokens"] = fields.get("cached_tokens", 0) + record.cached_tokens
+            fields["cost"] = fields.get("cost", 0.0) + record.cost
+
+        retention = settings.LLM_TELEMETRY_RETENTION_DAYS * 86400
+        try:
+            async with self.cache.client.pipeline(transaction=False) as pipe:
+                for (day, prefix), fields in rollups.items():
+                    key = f"telemetry:llm:{day}"
+                    for name, value in fields.items():
+                        if name == "cost":
+                            pipe.hincrbyfloat(key, f"{prefix}|{name}", value)
+                        elif value:
+                            pipe.hincrby(key, f"{prefix}|{name}", int(value))
+                    pipe.expire(key, retention)
+                pipe.lpush("telemetry:llm:recent", *(json.dumps(r.to_dict()) for r in batch))
+                pipe.ltrim("telemetry:llm:recent", 0, settings.LLM_TELEMETRY_RECENT_CALLS - 1)
+                await pipe.execute()
+        except RedisError as exc:
+            # Keep the batch for the next attempt, minus its oldest records if
+            # calls recorded meanwhile left too little room in the buffer
+            self.flush_errors += 1
+            room = self._pending.maxlen - len(self._pending)
+            keep = batch[len(batch) - room:] if room else []
+            self.dropped += len(batch) - len(keep)
+            self._pending.extendleft(reversed(keep))
+            logger.warning("Telemetry flush failed: %s", exc)
+            return 0
+        self.flushed_total += len(batch)
+        return len(batch)
+
+    async def flush_all(self) -> None:
+        while await self.flush():
+            pass
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(settings.LLM_TELEMETRY_FLUSH_INTERVAL)
+            try:
+                await self.flush_all()
+            except Exception as exc:
+                logger.warning("Telemetry flush loop error: %s", exc)
+
+    def start(self) -> None:
+        """Start the background flusher"""
+        if settings.LLM_TELEMETRY_ENABLED and self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        """Stop the background flusher and write out what is left"""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush_all()
+
+    async def daily_usage(self, day: Optional[str] = None) -> Dict[str, Dict[str, float]]:
+        """Persisted rollups for a UTC day (YYYYMMDD), keyed by model|task"""
+        day = day or time.strftime("%Y%m%d", time.gmtime())
+        raw = await self.cache.client.hgetall(f"telemetry:llm:{day}")
+        usage: Dict[str, Dict[str, float]] = {}
+        for name, value in raw.items():
+            prefix, _, metric = name.rpartition("|")
+            usage.setdefault(prefix, {})[metric] = float(value)
+        return usage
@@ -0,0 +1,250 @@
+"""
+Offline token counting for Qwen and GLM models
+A fast per-family heuristic by default, or exact counts from the model's
+tiktoken vocab file when one is configured and tiktoken is installed
+"""
+
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional, Dict, Any, List, Callable
+import logging
+import math
+import re
+
+from app.core.config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Overhead per chat message for role markers and separators
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Strings longer than this are counted directly rather than memoized
+MEMO_MAX_LENGTH = 4096
+
+_CJK = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]")
+_WORD = re.compile(r"[A-Za-z]+")
+_DIGIT = re.compile(r"[0-9]")
+_SPACE = re.compile(r"\s")
+
+# Pre-tokenization patterns of the published vocabularies; Qwen splits
+# numbers into single digits, GLM-4 into groups of up to three
+PRETOKENIZE_PATTERNS: Dict[str, str] = {
+    "qwen": (
+        r"(?i:'s|'t|'re|'ve|'m|'ll|'d)|[^\r\n\p{L}\p{N}]?\p{L}+|\p{N}"
+        r"| ?[^\s\p{L}\p{N}]+[\r\n]*|\s*[\r\n]+|\s+(?!\S)|\s+"
+    ),
+    "glm": (
+        r"(?i:'s|'t|'re|'ve|'m|'ll|'d)|[^\r\n\p{L}\p{N}]?\p{L}+|\p{N}{1,3}"
+        r"| ?[^\s\p{L}\p{N}]+[\r\n]*|\s*[\r\n]+|\s+(?!\S)|\s+"
+    ),
+}
+
+
+@dataclass(frozen=True)
+class TokenizerProfile:
+    """Average characters per token by script for one tokenizer family"""
+    cjk_chars_per_token: float
+    latin_chars_per_token: float
+    digits_per_token: float
+    # Estimates are used for budgeting, so err on the high side
+    safety_margin: float = 1.1
+
+
+TOKENIZER_PROFILES: Dict[str, TokenizerProfile] = {
+    "qwen": TokenizerProfile(cjk_chars_per_token=1.4, latin_chars_per_token=4.0, digits_per_token=1.0),
+    "glm": TokenizerProfile(cjk_chars_per_token=1.5, latin_chars_per_token=4.0, digits_per_token=3.0),
+}
+
+
+class PromptTooLarge(ValueError):
+    """Raised when a prompt cannot be trimmed to fit the model's context window"""
+
+    def __init__(self, tokens: int, budget: int):
+        super().__init__(f"Prompt needs {tokens} tokens but only {budget} are available")
+        self.tokens = tokens
+        self.budget = budget
+
+
+class Tokenizer:
+    """Token counter for one tokenizer family"""
+
+    def __init__(
+        self,
+        family: str,
+        profile: TokenizerProfile,
+        encode: Optional[Callable[[str], List[int]]] = None,
+    ):
+        self.family = family
+        self.profile = profile
+        self._encode = encode
+        self._memo = lru_cache(maxsize=settings.TOKENIZER_MEMO_SIZE)(self._count)
+
+    @property
+    def exact(self) -> bool:
+        """Whether counts come from the real vocabulary"""
+        return self._encode is not None
+
+    def _count(self, text: str) -> int:
+        if self._encode is not None:
+            return len(self._encode(text))
+
+        # Each pass is a single C-level scan, so this stays in microseconds
+        cjk = len(_CJK.findall(text))
+        words = _WORD.findall(text)
+        letters = sum(map(len, words))
+        digits = len(_DIGIT.findall(text))
+        spaces = len(_SPACE.findall(text))
+        other = len(text) - cjk - letters - digits - spaces
+
+        profile = self.profile
+        tokens = (
+            cjk / profile.cjk_chars_per_token
+            + max(len(words), letters / profile.latin_chars_per_token)
+            + digits / profile.digits_per_token
+            + other
+        )
+        return math.ceil(tokens * profile.safety_margin)
+
+    def count(self, text: str) -> int:
+        """Tokens in a piece of text"""
+        if not text:
+            return 0
+        if len(text) > MEMO_MAX_LENGTH:
+            return self._count(text)
+        return self._memo(text)
+
+    def count_messages(self, messages: List[Dict[str, Any]]) -> int:
+        """Tokens for a chat prompt, including per-message overhead"""
+        return sum(self.count(str(m.get("content") or "")) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Longest prefix of text that fits in max_tokens"""
+        if self.count(text) <= max_tokens:
+            return text
+        low, high = 0, len(text)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self._count(text[:middle]) <= max_tokens:
+                low = middle
+            else:
+                high = middle - 1
+        return text[:low]
+
+    def chunk(self, text: str, max_tokens: int) -> List[str]:
+        """
+        Split text into pieces of at most max_tokens
+        Paragraphs are kept whole where possible and packed greedily
+        """
+        chunks: List[str] = []
+        current: List[str] = []
+        current_tokens = 0
+
+        def flush() -> None:
+            nonlocal current, current_tokens
+            if current:
+                chunks.append("\n\n".join(current))
+            current, current_tokens = [], 0
+
+        for paragraph in text.split("\n\n"):
+            tokens = self.count(paragraph) + 1
+            if tokens > max_tokens:
+                flush()
+                while paragraph:
+                    # Always make progress, even if one character is over budget
+                    head = self.truncate(paragraph, max_tokens) or paragraph[0]
+                    chunks.append(head)
+                    paragraph = paragraph[len(head):]
+                continue
+            if current_tokens + tokens > max_tokens:
+                flush()
+            current.append(paragraph)
+            current_tokens += tokens
+        flush()
+        return chunks
+
+
+def _load_encoder(family: str, path: str) -> Optional[Callable[[str], List[int]]]:
+    """Build an exact encoder from a tiktoken-format vocab file"""
+    try:
+        import tiktoken
+        from tiktoken.load import load_tiktoken_bpe
+    except ImportError:
+        logger.warning("tiktoken is not installed; %s token counts are estimated", family)
+        return None
+    try:
+        encoding = tiktoken.Encoding(
+            name=family,
+            pat_str=PRETOKENIZE_PATTERNS[family],
+            mergeable_ranks=load_tiktoken_bpe(path),
+            special_tokens={},
+        )
+    except Exception as exc:
+        logger.warning("Could not load %s vocab from %s: %s", family, path, exc)
+        return None
+    return encoding.encode_ordinary
+
+
+_tokenizers: Dict[str, Tokenizer] = {}
+
+
+def get_tokenizer(family: str = "qwen") -> Tokenizer:
+    """Shared tokenizer for a family, exact when its vocab file is configured"""
+    if family not in _tokenizers:
+        paths = {"qwen": settings.QWEN_TOKENIZER_PATH, "glm": settings.GLM_TOKENIZER_PATH}
+        path = paths.get(family)
+        encode = _load_encoder(family, path) if path else None
+        _tokenizers[family] = Tokenizer(family, TOKENIZER_PROFILES.get(family, TOKENIZER_PROFILES["qwen"]), encode)
+    return _tokenizers[family]
+
+
+def count_tokens(text: str, family: str = "qwen") -> int:
+    """Tokens in a piece of text for a tokenizer family"""
+    return get_tokenizer(family).count(text)
+
+
+def count_message_tokens(messages: List[Dict[str, Any]], family: str = "qwen") -> int:
+    """Tokens for a chat prompt for a tokenizer family"""
+    return get_tokenizer(family).count_messages(messages)
+
+
+def fit_messages(
+    messages: List[Dict[str, Any]],
+    budget: int,
+    tokenizer: Tokenizer,
+) -> List[Dict[str, Any]]:
+    """
+    Trim a chat prompt to a token budget
+    Leading system messages and the latest message are kept; the oldest turns
+    in between are dropped first, then the latest message is truncated.
+    Returns the original list untouched when it already fits.
+    """
+    total = tokenizer.count_messages(messages)
+    if total <= budget:
+        return messages
+
+    leading = 0
+    while leading < len(messages) - 1 and messages[leading].get("role") == "system":
+        leading += 1
+    head = messages[:leading]
+    middle = messages[leading:-1]
+    last = messages[-1]
+
+    dropped = 0
+    while middle and total > budget:
+        total -= tokenizer.count_messages(middle[:1])
+        middle = middle[1:]
+        dropped += 1
+    fitted = head + middle + [last]
+
+    if total > budget:
+        fixed = tokenizer.count_messages(head + middle) + MESSAGE_OVERHEAD_TOKENS
+        room = budget - fixed
+        if room <= 0:
+            raise PromptTooLarge(total, budget)
+        content = str(last.get("content") or "")
+        fitted[-1] = {**last, "content": tokenizer.truncate(content, room)}
+        logger.warning("Prompt over budget: dropped %d messages and truncated the latest to %d tokens", dropped, room)
+    else:
+        logger.warning("Prompt over budget: dropped %d oldest messages", dropped)
+    return fitted
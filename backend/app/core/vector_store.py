@@ -0,0 +1,874 @@
+"""
+Knowledge-base vector store
+FAISS index over the knowledge_base/ markdown tree. The main index is
+memory-mapped from disk; new and deleted documents go to an append log and a
+small in-memory delta index until compaction folds them into a new main index.
+Workers on one host share the files; compaction and log rotation are
+serialized between them with file locks
+"""
+
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Callable, Awaitable, Iterable, Iterator, Set, Tuple
+import asyncio
+import fcntl
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import sqlite3
+import struct
+import time
+
+import faiss
+import numpy as np
+
+from app.core.config import get_settings
+from app.core.llm import llm_service
+from app.core.tokenizer import get_tokenizer
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+BatchEmbedder = Callable[[List[str]], Awaitable[np.ndarray]]
+
+_HEADING = re.compile(r"^(#{1,3})\s+(.*)$")
+
+# Keyword-index analysis: latin words and numbers, and runs of CJK
+# characters, which are indexed as overlapping bigrams
+_TERM = re.compile(r"[a-z0-9]+|[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]+")
+_LATIN = re.compile(r"[a-z0-9]")
+STOPWORDS = {"a", "an", "and", "are", "as", "for", "in", "is", "of", "on", "or", "the", "to", "with"}
+
+
+@dataclass
+class DocumentChunk:
+    """A retrievable piece of a knowledge-base document"""
+    id: int
+    source: str
+    title: str
+    text: str
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def embedding_text(self) -> str:
+        """Text to embed: the heading path gives the body its context"""
+        return f"{self.title}\n{self.text}" if self.title else self.text
+
+
+@dataclass
+class SearchHit:
+    """A chunk returned by a search, with its similarity score"""
+    chunk: DocumentChunk
+    score: float
+
+
+@contextmanager
+def file_lock(path: Path, blocking: bool = True) -> Iterator[bool]:
+    """
+    Exclusive advisory lock shared by every process on the host
+    Yields whether it was acquired; only a non-blocking attempt can fail
+    """
+    with open(path, "a") as handle:
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def chunk_id(source: str, index: int) -> int:
+    """Stable positive 60-bit id for the index-th chunk of a source file"""
+    return int(hashlib.sha1(f"{source}#{index}".encode()).hexdigest()[:15], 16)
+
+
+def split_markdown(text: str, source: str, max_tokens: Optional[int] = None) -> List[DocumentChunk]:
+    """
+    Split a markdown document into chunks along its headings
+    Sections longer than max_tokens are split further by paragraph
+    """
+    max_tokens = max_tokens or settings.VECTOR_CHUNK_TOKENS
+    tokenizer = get_tokenizer()
+    sections: List[Tuple[str, str]] = []
+    headings: List[str] = []
+    lines: List[str] = []
+
+    def close_section() -> None:
+        body = "\n".join(lines).strip()
+        if body:
+            sections.append((" > ".join(headings), body))
+        lines.clear()
+
+    for line in text.splitlines():
+        match = _HEADING.match(line)
+        if match:
+            close_section()
+            level = len(match.group(1))
+            headings[level - 1:] = [match.group(2).strip()]
+        else:
+            lines.append(line)
+    close_section()
+
+    chunks: List[DocumentChunk] = []
+    for title, body in sections:
+        for piece in tokenizer.chunk(body, max_tokens):
+            if piece.strip():
+                chunks.append(DocumentChunk(chunk_id(source, len(chunks)), source, title, piece.strip()))
+    return chunks
+
+
+def lexical_terms(text: str) -> List[str]:
+    """
+    Terms for the keyword index of mixed Chinese/English text
+    Without a segmenter, CJK bigrams give BM25 word-like units; a lone
+    CJK character is kept as a unigram
+    """
+    terms: List[str] = []
+    for run in _TERM.findall(text.lower()):
+        if _LATIN.match(run):
+            if run not in STOPWORDS:
+                terms.append(run)
+        elif len(run) == 1:
+            terms.append(run)
+        else:
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return terms
+
+
+def load_knowledge_base(root: Path, max_tokens: Optional[int] = None) -> List[DocumentChunk]:
+    """Chunk every markdown file under root; sources are paths relative to root"""
+    chunks: List[DocumentChunk] = []
+    for path in sorted(root.rglob("*.md")):
+        source = path.relative_to(root).as_posix()
+        chunks.extend(split_markdown(path.read_text(encoding="utf-8"), source, max_tokens))
+    return chunks
+
+
+class ChunkStore:
+    """
+    SQLite table of chunk text and metadata keyed by vector id, plus an FTS5
+    keyword index over the analyzed title and text of each chunk
+    """
+
+    def __init__(self, path: Path):
+        self._db = sqlite3.connect(str(path), check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "id INTEGER PRIMARY KEY, source TEXT, title TEXT, text TEXT, metadata TEXT)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS chunks_source ON chunks (source)")
+        self._db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS chunk_terms USING fts5(title, text)")
+        # Stores created before the keyword index existed are backfilled once
+        if not self._db.execute("SELECT 1 FROM chunk_terms LIMIT 1").fetchone():
+            rows = self._db.execute("SELECT id, title, text FROM chunks").fetchall()
+            self._index_terms([DocumentChunk(row[0], "", row[1], row[2]) for row in rows])
+        self._db.commit()
+
+    def _index_terms(self, chunks: List[DocumentChunk]) -> None:
+        self._db.executemany("DELETE FROM chunk_terms WHERE rowid = ?", [(c.id,) for c in chunks])
+        self._db.executemany(
+            "INSERT INTO chunk_terms (rowid, title, text) VALUES (?, ?, ?)",
+            [(c.id, " ".join(lexical_terms(c.title)), " ".join(lexical_terms(c.text))) for c in chunks],
+        )
+
+    def put_many(self, chunks: Iterable[DocumentChunk]) -> None:
+        chunks = list(chunks)
+        self._db.executemany(
+            "INSERT OR REPLACE INTO chunks VALUES (?, ?, ?, ?, ?)",
+            [(c.id, c.source, c.title, c.text, json.dumps(c.metadata)) for c in chunks],
+        )
+        self._index_terms(chunks)
+        self._db.commit()
+
+    def get_many(self, ids: List[int]) -> Dict[int, DocumentChunk]:
+        if not ids:
+            return {}
+        placeholders = ",".join("?" * len(ids))
+        rows = self._db.execute(f"SELECT * FROM chunks WHERE id IN ({placeholders})", ids).fetchall()
+        return {
+            row[0]: DocumentChunk(row[0], row[1], row[2], row[3], json.loads(row[4] or "{}"))
+            for row in rows
+        }
+
+    def ids_for_source(self, source: str) -> List[int]:
+        return [row[0] for row in self._db.execute("SELECT id FROM chunks WHERE source = ?", (source,))]
+
+    def keyword_search(self, query: str, k: int) -> List[Tuple[int, float]]:
+        """Top-k (id, BM25 score) for chunks sharing any term with the query; titles weigh double"""
+        terms = dict.fromkeys(lexical_terms(query))
+        if not terms:
+            return []
+        match = " OR ".join('"' + term.replace('"', '""') + '"' for term in terms)
+        rows = self._db.execute(
+            "SELECT rowid, bm25(chunk_terms, 2.0, 1.0) AS rank FROM chunk_terms "
+            "WHERE chunk_terms MATCH ? ORDER BY rank LIMIT ?",
+            (match, k),
+        )
+        # FTS5 reports BM25 negated so that better matches sort first
+        return [(row[0], -row[1]) for row in rows]
+
+    def delete_many(self, ids: List[int]) -> None:
+        self._db.executemany("DELETE FROM chunks WHERE id = ?", [(i,) for i in ids])
+        self._db.executemany("DELETE FROM chunk_terms WHERE rowid = ?", [(i,) for i in ids])
+        self._db.commit()
+
+    def clear(self) -> None:
+        self._db.execute("DELETE FROM chunks")
+        self._db.execute("DELETE FROM chunk_terms")
+        self._db.commit()
+
+    def count(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def close(self) -> None:
+        self._db.close()
+
+
+class LogRotated(Exception):
+    """The append log was replaced by compaction since it was last read"""
+
+
+LogRecord = Tuple[int, int, Optional[np.ndarray]]
+
+
+class AppendLog:
+    """
+    Append-only log of vector additions and deletions since the last compaction
+    Each record is an op byte and an int64 id, followed by the vector for adds.
+    A torn record at the tail (crash mid-write) is ignored on replay and cut
+    off before the next append, so new records never land behind it. Appends
+    and rotation hold append.lock, so rotating never drops another process's
+    records; rotation replaces the file, which readers notice by its inode.
+    """
+
+    ADD = 1
+    DELETE = 0
+    HEADER = struct.Struct("<Bq")
+
+    def __init__(self, path: Path, dim: int):
+        self.path = path
+        self.dim = dim
+        self.vector_size = dim * 4
+        self.lock_path = path.with_suffix(".lock")
+        # Size of the log when this process last found it free of torn records
+        self._checked_size: Optional[int] = None
+
+    def size(self) -> int:
+        return self.path.stat().st_size if self.path.exists() else 0
+
+    def identity(self) -> Optional[int]:
+        """Inode of the current log file; changes whenever it is rotated"""
+        return self.path.stat().st_ino if self.path.exists() else None
+
+    def _parse(self, data: bytes) -> Tuple[List[LogRecord], int]:
+        """Whole records in data and the length they span"""
+        records: List[LogRecord] = []
+        position = 0
+        header = self.HEADER.size
+        while position + header <= len(data):
+            op, vector_id = self.HEADER.unpack_from(data, position)
+            if op not in (self.ADD, self.DELETE):
+                break
+            end = position + header + (self.vector_size if op == self.ADD else 0)
+            if end > len(data):
+                break
+            vector = None
+            if op == self.ADD:
+                vector = np.frombuffer(data, dtype=np.float32, count=self.dim, offset=position + header)
+            records.append((op, vector_id, vector))
+            position = end
+        return records, position
+
+    def _truncate_torn_tail(self) -> None:
+        """Cut off a partial record left by a crash; call with the append lock held"""
+        size = self.size()
+        if size == self._checked_size or not size:
+            return
+        with open(self.path, "rb") as log:
+            _, end = self._parse(log.read())
+        if end < size:
+            logger.warning("Truncating %d torn bytes at the end of %s", size - end, self.path)
+            os.truncate(self.path, end)
+
+    def append(self, adds: Optional[Tuple[np.ndarray, np.ndarray]] = None, deletes: Iterable[int] = ()) -> None:
+        parts: List[bytes] = []
+        if adds is not None:
+            ids, vectors = adds
+            for vector_id, vector in zip(ids, vectors):
+                parts.append(self.HEADER.pack(self.ADD, int(vector_id)))
+                parts.append(np.ascontiguousarray(vector, dtype=np.float32).tobytes())
+        for vector_id in deletes:
+            parts.append(self.HEADER.pack(self.DELETE, int(vector_id)))
+        with file_lock(self.lock_path):
+            self._truncate_torn_tail()
+            with open(self.path, "ab") as log:
+                log.write(b"".join(parts))
+                log.flush()
+                os.fsync(log.fileno())
+                self._checked_size = log.tell()
+
+    def replay(
+        self, offset: int = 0, identity: Optional[int] = None
+    ) -> Tuple[List[LogRecord], int, Optional[int]]:
+        """
+        Records after offset as (op, id, vector), the offset after the last
+        whole record and the identity of the file they were read from
+        Raises LogRotated if identity is given and the log has been replaced
+        """
+        if not self.path.exists():
+            if identity is not None:
+                raise LogRotated(str(self.path))
+            return [], 0, None
+        with open(self.path, "rb") as log:
+            current = os.fstat(log.fileno()).st_ino
+            if identity is not None and current != identity:
+                raise LogRotated(str(self.path))
+            log.seek(offset)
+            records, position = self._parse(log.read())
+        return records, offset + position, current
+
+    def rotate(self, offset: int) -> None:
+        """Drop everything before offset, keeping records appended since"""
+        with file_lock(self.lock_path):
+            tail = b""
+            if self.path.exists():
+                with open(self.path, "rb") as log:
+                    log.seek(offset)
+                    tail = log.read()
+            temp = self.path.with_suffix(".tmp")
+            with open(temp, "wb") as log:
+                log.write(tail)
+                log.flush()
+                os.fsync(log.fileno())
+            os.replace(temp, self.path)
+            self._checked_size = None
+
+
+def _index_kind(factory: str) -> str:
+    if factory.startswith("IVF"):
+        return "ivf"
+    if "HNSW" in factory:
+        return "hnsw"
+    return "flat"
+
+
+def choose_factory(count: int) -> str:
+    """
+    FAISS factory string for a corpus size
+    Exact search is fast enough for small corpora; larger ones use IVF with
+    about 4*sqrt(n) lists (rounded to a power of two) so they can be mmapped
+    """
+    if settings.VECTOR_INDEX_FACTORY:
+        return settings.VECTOR_INDEX_FACTORY
+    if count < settings.VECTOR_IVF_MIN_VECTORS:
+        return "IDMap2,Flat"
+    nlist = 2 ** round(math.log2(4 * math.sqrt(count)))
+    return f"IVF{nlist},Flat"
+
+
+def _export(index: faiss.Index, dim: int) -> Tuple[np.ndarray, np.ndarray]:
+    """All (ids, vectors) held by an index built by this module"""
+    if isinstance(index, faiss.IndexIDMap2):
+        ids = faiss.vector_to_array(index.id_map).astype(np.int64)
+        vectors = index.index.reconstruct_n(0, index.ntotal) if index.ntotal else np.empty((0, dim), np.float32)
+        return ids, vectors
+    invlists = faiss.extract_index_ivf(index).invlists
+    all_ids: List[np.ndarray] = []
+    all_vectors: List[np.ndarray] = []
+    for list_no in range(invlists.nlist):
+        size = invlists.list_size(list_no)
+        if not size:
+            continue
+        all_ids.append(faiss.rev_swig_ptr(invlists.get_ids(list_no), size).copy())
+        codes = faiss.rev_swig_ptr(invlists.get_codes(list_no), size * invlists.code_size).copy()
+        all_vectors.append(codes.view(np.float32).reshape(size, dim))
+    if not all_ids:
+        return np.empty(0, np.int64), np.empty((0, dim), np.float32)
+    return np.concatenate(all_ids).astype(np.int64), np.vstack(all_vectors)
+
+
+class VectorIndex:
+    """
+    On-disk FAISS index plus append log for one knowledge base
+    Files: manifest.json, index.<generation>.faiss and append.log. Any
+    worker may append; building and compacting must hold compaction_lock()
+    and are best done on a separate instance, since a VectorIndex is not safe
+    to use from two threads. Other workers pick up new log records and index
+    generations through refresh().
+    """
+
+    def __init__(self, directory: Path, dim: int):
+        self.directory = directory
+        self.dim = dim
+        self.log = AppendLog(directory / "append.log", dim)
+        self.manifest: Dict[str, Any] = {}
+        self._main: Optional[faiss.Index] = None
+        self._delta = self._empty_delta()
+        self._delta_ids: Set[int] = set()
+        self._tombstones: Set[int] = set()
+        self._log_offset = 0
+        self._log_identity: Optional[int] = None
+        self._last_refresh = 0.0
+
+    def _empty_delta(self) -> faiss.Index:
+        return faiss.IndexIDMap2(faiss.IndexFlatIP(self.dim))
+
+    @property
+    def _manifest_path(self) -> Path:
+        return self.directory / "manifest.json"
+
+    def compaction_lock(self, blocking: bool = True):
+        """Cross-process lock around reading, rewriting and publishing a generation"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        return file_lock(self.directory / "compact.lock", blocking)
+
+    def _index_path(self, generation: int) -> Path:
+        return self.directory / f"index.{generation}.faiss"
+
+    def _read_manifest(self) -> Dict[str, Any]:
+        if not self._manifest_path.exists():
+            return {}
+        return json.loads(self._manifest_path.read_text())
+
+    def open(self) -> None:
+        """Map the current index generation and replay the append log"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.manifest = self._read_manifest()
+        self._main = None
+        if self.manifest:
+            path = str(self._index_path(self.manifest["generation"]))
+            # Only IVF inverted lists can be served straight from the mapping
+            flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if self.manifest["kind"] == "ivf" else 0
+            self._main = faiss.read_index(path, flags)
+            self._set_search_params(self._main)
+        self._delta = self._empty_delta()
+        self._delta_ids = set()
+        self._tombstones = set()
+        self._log_offset = 0
+        self._log_identity = None
+        self._apply_log()
+        self._last_refresh = time.monotonic()
+
+    def _set_search_params(self, index: faiss.Index) -> None:
+        kind = _index_kind(self.manifest.get("factory", ""))
+        if kind == "ivf":
+            faiss.extract_index_ivf(index).nprobe = settings.VECTOR_SEARCH_NPROBE
+        elif kind == "hnsw":
+            faiss.ParameterSpace().set_index_parameter(index, "efSearch", settings.VECTOR_SEARCH_EF)
+
+    def _apply_log(self) -> None:
+        try:
+            changes = self.log.replay(self._log_offset, self._log_identity)
+        except LogRotated:
+            # Offsets into the old file mean nothing in the new one
+            self.open()
+            return
+        self.apply_changes(self._log_offset, *changes)
+
+    def read_changes(self) -> Optional[Tuple[int, List[LogRecord], int, Optional[int]]]:
+        """
+        Log records written since the last replay, without applying them
+        None when a new generation or a rotated log needs open() instead.
+        Only reads files, so it is safe off the serving thread; pass the
+        result to apply_changes().
+        """
+        if self._read_manifest().get("generation") != self.manifest.get("generation"):
+            return None
+        offset = self._log_offset
+        try:
+            return (offset, *self.log.replay(offset, self._log_identity))
+        except LogRotated:
+            return None
+
+    def apply_changes(
+        self, start: int, records: List[LogRecord], offset: int, identity: Optional[int]
+    ) -> None:
+        """Apply records read from start; ignored if another replay got there first"""
+        if start != self._log_offset or (self._log_identity is not None and identity != self._log_identity):
+            return
+        self._log_offset, self._log_identity = offset, identity
+        adds: Dict[int, np.ndarray] = {}
+        for op, vector_id, vector in records:
+            if op == AppendLog.ADD:
+                adds[vector_id] = vector
+                self._tombstones.discard(vector_id)
+            else:
+                adds.pop(vector_id, None)
+                self._tombstones.add(vector_id)
+        deleted = [i for i in self._tombstones if i in self._delta_ids]
+        self._remove_from_delta(list(adds) + deleted)
+        if adds:
+            ids = np.fromiter(adds.keys(), dtype=np.int64, count=len(adds))
+            self._delta.add_with_ids(np.vstack(list(adds.values())), ids)
+            self._delta_ids.update(adds)
+
+    def _remove_from_delta(self, ids: List[int]) -> None:
+        present = [i for i in ids if i in self._delta_ids]
+        if present:
+            self._delta.remove_ids(np.array(present, dtype=np.int64))
+            self._delta_ids.difference_update(present)
+
+    def refresh_due(self, force: bool = False) -> bool:
+        """Whether to look for changes now; claims the slot so concurrent callers skip"""
+        if not force and time.monotonic() - self._last_refresh < settings.VECTOR_REFRESH_INTERVAL:
+            return False
+        self._last_refresh = time.monotonic()
+        return True
+
+    def refresh(self, force: bool = False) -> None:
+        """Pick up a new index generation or log records written by another process"""
+        if not self.refresh_due(force):
+            return
+        manifest = self._read_manifest()
+        if manifest.get("generation") != self.manifest.get("generation"):
+            self.open()
+        elif self.log.size() != self._log_offset or self.log.identity() != self._log_identity:
+            self._apply_log()
+
+    @property
+    def count(self) -> int:
+        """Approximate live vectors (main + delta - tombstones)"""
+        main = self._main.ntotal if self._main is not None else 0
+        return main + len(self._delta_ids) - len(self._tombstones)
+
+    @property
+    def pending(self) -> int:
+        """Log records awaiting compaction"""
+        return len(self._delta_ids) + len(self._tombstones)
+
+    @property
+    def version(self) -> str:
+        """Changes whenever the searchable contents change"""
+        return f"{self.manifest.get('generation', 0)}.{self._log_offset}"
+
+    def log_add(self, ids: np.ndarray, vectors: np.ndarray) -> None:
+        """
+        Durably log vector additions without touching the in-memory indexes
+        Safe off the serving thread; they become searchable at refresh()
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        faiss.normalize_L2(vectors)
+        self.log.append(adds=(ids, vectors))
+
+    def log_delete(self, ids: Iterable[int]) -> None:
+        self.log.append(deletes=ids)
+
+    def add(self, ids: np.ndarray, vectors: np.ndarray) -> None:
+        """Add or replace vectors; durable once the log write returns"""
+        self.log_add(ids, vectors)
+        self._apply_log()
+
+    def delete(self, ids: Iterable[int]) -> None:
+        self.log_delete(ids)
+        self._apply_log()
+
+    def search(self, vector: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        """Top-k (id, cosine similarity) over the main and delta indexes"""
+        query = np.ascontiguousarray(vector, dtype=np.float32).reshape(1, self.dim)
+        faiss.normalize_L2(query)
+        scores: Dict[int, float] = {}
+
+        if self._delta.ntotal:
+            distances, labels = self._delta.search(query, min(k, self._delta.ntotal))
+            for label, score in zip(labels[0], distances[0]):
+                if label >= 0:
+                    scores[int(label)] = float(score)
+
+        if self._main is not None and self._main.ntotal:
+            # Main-index hits replaced or deleted since the last compaction are
+            # dropped, so over-fetch a little to still return k results
+            dead = self._delta_ids | self._tombstones
+            fetch = min(self._main.ntotal, k + min(len(dead), 4 * k))
+            distances, labels = self._main.search(query, fetch)
+            for label, score in zip(labels[0], distances[0]):
+                label = int(label)
+                if label >= 0 and label not in dead:
+                    scores[label] = max(scores.get(label, -1.0), float(score))
+
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def _write_generation(self, ids: np.ndarray, vectors: np.ndarray, log_offset: int, reopen: bool) -> None:
+        """Build a new main index, publish it atomically and trim the log"""
+        factory = choose_factory(len(ids))
+        index = faiss.index_factory(self.dim, factory, faiss.METRIC_INNER_PRODUCT)
+        if not index.is_trained:
+            nlist = faiss.extract_index_ivf(index).nlist
+            sample = vectors
+            if len(vectors) > nlist * settings.VECTOR_TRAIN_POINTS_PER_LIST:
+                rng = np.random.default_rng(0)
+                sample = vectors[rng.choice(len(vectors), nlist * settings.VECTOR_TRAIN_POINTS_PER_LIST, replace=False)]
+            index.train(sample)
+        if len(ids):
+            index.add_with_ids(vectors, ids)
+
+        generation = self.manifest.get("generation", 0) + 1
+        path = self._index_path(generation)
+        faiss.write_index(index, str(path.with_suffix(".tmp")))
+        os.replace(path.with_suffix(".tmp"), path)
+        manifest = {
+            "generation": generation,
+            "factory": factory,
+            "kind": _index_kind(factory),
+            "dim": self.dim,
+            "count": int(len(ids)),
+            "built_at": time.time(),
+        }
+        temp = self._manifest_path.with_suffix(".tmp")
+        temp.write_text(json.dumps(manifest))
+        os.replace(temp, self._manifest_path)
+        self.log.rotate(log_offset)
+
+        # Readers that still map an older generation keep their open file
+        for old in self.directory.glob("index.*.faiss"):
+            if old != path:
+                old.unlink(missing_ok=True)
+        if reopen:
+            self.open()
+
+    def build(self, ids: np.ndarray, vectors: np.ndarray, reopen: bool = True) -> None:
+        """
+        Replace the whole index with these vectors
+        Pass reopen=False when building off the serving thread, then call open()
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        faiss.normalize_L2(vectors)
+        self._write_generation(np.asarray(ids, dtype=np.int64), vectors, self.log.size(), reopen)
+
+    def compact(self, reopen: bool = True) -> None:
+        """
+        Fold the append log into a new main index generation
+        Records appended while compaction runs stay in the log
+        """
+        self._apply_log()
+        offset = self._log_offset
+        dead = self._delta_ids | self._tombstones
+        parts_ids: List[np.ndarray] = []
+        parts_vectors: List[np.ndarray] = []
+        if self._main is not None:
+            ids, vectors = _export(self._main, self.dim)
+            keep = ~np.isin(ids, np.fromiter(dead, dtype=np.int64, count=len(dead)))
+            parts_ids.append(ids[keep])
+            parts_vectors.append(vectors[keep])
+        ids, vectors = _export(self._delta, self.dim)
+        parts_ids.append(ids)
+        parts_vectors.append(vectors)
+        self._write_generation(np.concatenate(parts_ids), np.vstack(parts_vectors), offset, reopen)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "generation": self.manifest.get("generation", 0),
+            "factory": self.manifest.get("factory"),
+            "vectors": self.count,
+            "pending": self.pending,
+            "log_bytes": self._log_offset,
+        }
+
+
+class KnowledgeBase:
+    """
+    Searchable knowledge base: chunk text in SQLite, vectors in a VectorIndex
+    Opening is cheap (the index is mapped, not loaded), so each worker opens
+    lazily on first use. All disk I/O runs in worker threads: new
+    generations, including ones another worker compacted, are opened on a
+    separate VectorIndex that replaces self.index when ready, and log records
+    are read off the loop and applied on it, so the index being searched is
+    only ever touched on the event loop.
+    """
+
+    def __init__(
+        self,
+        path: Optional[Path] = None,
+        source_dir: Optional[Path] = None,
+        embed: Optional[BatchEmbedder] = None,
+        dim: Optional[int] = None,
+    ):
+        self.path = Path(path or settings.VECTOR_STORE_PATH)
+        self.source_dir = Path(source_dir or settings.KNOWLEDGE_BASE_PATH)
+        self.embed = embed
+        self.dim = dim or settings.EMBEDDING_DIMENSIONS
+        self.index = VectorIndex(self.path, self.dim)
+        self.chunks: Optional[ChunkStore] = None
+        self._write_lock = asyncio.Lock()
+
+    def _ensure_open(self) -> None:
+        if self.chunks is None:
+            self.index.open()
+            self.chunks = ChunkStore(self.path / "chunks.db")
+
+    def _opened(self) -> Tuple[VectorIndex, ChunkStore]:
+        index = VectorIndex(self.path, self.dim)
+        index.open()
+        return index, ChunkStore(self.path / "chunks.db")
+
+    async def _open(self) -> None:
+        """Open on first use without reading the index on the event loop"""
+        if self.chunks is not None:
+            return
+        index, chunks = await asyncio.to_thread(self._opened)
+        if self.chunks is None:
+            self.index, self.chunks = index, chunks
+        else:
+            chunks.close()
+
+    async def refresh(self, force: bool = False) -> None:
+        """Pick up other workers' log records and index generations"""
+        index = self.index
+        if not index.refresh_due(force):
+            return
+        changes = await asyncio.to_thread(index.read_changes)
+        if changes is not None:
+            index.apply_changes(*changes)
+            return
+        fresh = VectorIndex(self.path, self.dim)
+        await asyncio.to_thread(fresh.open)
+        if self.index is index:
+            self.index = fresh
+
+    async def _embed(self, texts: List[str]) -> np.ndarray:
+        if self.embed is None:
+            raise RuntimeError("KnowledgeBase has no embedder configured")
+        if not texts:
+            return np.empty((0, self.dim), dtype=np.float32)
+        return np.asarray(await self.embed(texts), dtype=np.float32)
+
+    async def build_from_directory(self, source_dir: Optional[Path] = None) -> int:
+        """Rebuild the whole index from the markdown tree; returns the chunk count"""
+        root = Path(source_dir or self.source_dir)
+        chunks = load_knowledge_base(root)
+        vectors = await self._embed([c.embedding_text for c in chunks])
+        ids = np.array([c.id for c in chunks], dtype=np.int64)
+        async with self._write_lock:
+            await self._open()
+            self.index = await asyncio.to_thread(self._built, ids, vectors)
+            await asyncio.to_thread(self._replace_chunks, chunks)
+        logger.info("Built knowledge base from %s: %d chunks", root, len(chunks))
+        return len(chunks)
+
+    def _built(self, ids: np.ndarray, vectors: np.ndarray) -> VectorIndex:
+        index = VectorIndex(self.path, self.dim)
+        with index.compaction_lock():
+            index.open()
+            index.build(ids, vectors)
+        return index
+
+    def _replace_chunks(self, chunks: List[DocumentChunk]) -> None:
+        self.chunks.clear()
+        self.chunks.put_many(chunks)
+
+    def _compacted(self, min_pending: int) -> Optional[VectorIndex]:
+        """
+        A VectorIndex over a new compacted generation, or None when
+        min_pending is set and either another worker is already compacting or
+        fewer records are pending
+        """
+        index = VectorIndex(self.path, self.dim)
+        with index.compaction_lock(blocking=not min_pending) as acquired:
+            if not acquired:
+                return None
+            # Reread under the lock: another worker may have just compacted
+            index.open()
+            if min_pending and index.pending < min_pending:
+                return None
+            index.compact()
+        return index
+
+    def _write_additions(self, chunks: List[DocumentChunk], vectors: np.ndarray) -> None:
+        self.chunks.put_many(chunks)
+        self.index.log_add(np.array([c.id for c in chunks], dtype=np.int64), vectors)
+
+    def _write_deletions(self, ids: List[int]) -> None:
+        self.index.log_delete(ids)
+        self.chunks.delete_many(ids)
+
+    async def add_documents(self, chunks: List[DocumentChunk]) -> None:
+        """Add or replace chunks without rebuilding the index"""
+        vectors = await self._embed([c.embedding_text for c in chunks])
+        async with self._write_lock:
+            await self._open()
+            await asyncio.to_thread(self._write_additions, chunks, vectors)
+            await self.refresh(force=True)
+        if self.index.pending >= settings.VECTOR_COMPACT_THRESHOLD:
+            await self.compact(min_pending=settings.VECTOR_COMPACT_THRESHOLD)
+
+    async def upsert_source(self, source: str, text: str) -> int:
+        """Re-chunk one document, replacing whatever it previously produced"""
+        chunks = split_markdown(text, source)
+        await self._open()
+        stale = set(await asyncio.to_thread(self.chunks.ids_for_source, source)) - {c.id for c in chunks}
+        if stale:
+            await self.delete_documents(list(stale))
+        await self.add_documents(chunks)
+        return len(chunks)
+
+    async def delete_documents(self, ids: List[int]) -> None:
+        async with self._write_lock:
+            await self._open()
+            await asyncio.to_thread(self._write_deletions, ids)
+            await self.refresh(force=True)
+
+    async def compact(self, min_pending: int = 0) -> None:
+        """
+        Fold pending additions and deletions into a new index generation
+        With min_pending, skips if fewer records are pending or another
+        worker is compacting, rather than waiting for it
+        """
+        async with self._write_lock:
+            await self._open()
+            # Searches keep using the current generation until the swap
+            index = await asyncio.to_thread(self._compacted, min_pending)
+            if index is not None:
+                self.index = index
+            else:
+                await self.refresh(force=True)
+
+    async def search(self, query: str, k: int = 5) -> List[SearchHit]:
+        """Chunks most similar to the query"""
+        vector = (await self._embed([query]))[0]
+        return await self.search_vector(vector, k)
+
+    async def search_vector(self, vector: np.ndarray, k: int = 5) -> List[SearchHit]:
+        await self._open()
+        await self.refresh()
+        results = self.index.search(vector, k)
+        chunks = await self.get_chunks([vector_id for vector_id, _ in results])
+        return [SearchHit(chunks[i], score) for i, score in results if i in chunks]
+
+    def _keyword_search(self, query: str, k: int) -> List[SearchHit]:
+        results = self.chunks.keyword_search(query, k)
+        chunks = self.chunks.get_many([chunk_id for chunk_id, _ in results])
+        return [SearchHit(chunks[i], score) for i, score in results if i in chunks]
+
+    async def keyword_search(self, query: str, k: int = 5) -> List[SearchHit]:
+        """Chunks ranked by BM25 over the query's terms"""
+        await self._open()
+        return await asyncio.to_thread(self._keyword_search, query, k)
+
+    async def get_chunks(self, ids: List[int]) -> Dict[int, DocumentChunk]:
+        await self._open()
+        return await asyncio.to_thread(self.chunks.get_many, ids)
+
+    async def current_version(self) -> str:
+        """Version of the searchable contents, refreshed from disk"""
+        await self._open()
+        await self.refresh()
+        return self.index.version
+
+    def stats(self) -> Dict[str, Any]:
+        self._ensure_open()
+        return {**self.index.stats(), "chunks": self.chunks.count()}
+
+
+# Global knowledge base instance, embedding through the shared LLM service
+knowledge_base = KnowledgeBase(embed=llm_service.embeddings.embed_many)
+
+
+async def get_knowledge_base() -> KnowledgeBase:
+    """Dependency for getting the knowledge base"""
+    return knowledge_base
@@ -3,15 +3,22 @@ Main FastAPI Application Entry Point
 """
 
 from contextlib import asynccontextmanager
+from typing import AsyncIterator, List
+import logging
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.api import api_router
+from app.core.cache import cache_manager
 from app.core.config import get_settings
 from app.core.database import close_db, init_db
+from app.core.llm import llm_service
+from app.core.scheduler import scheduling_scope
+from app.core.telemetry import LLMCallRecord, summarize_usage, usage_scope
 
 settings = get_settings()
+logger = logging.getLogger(__name__)
 
 
 @asynccontextmanager
@@ -19,8 +26,12 @@ async def lifespan(app: FastAPI):
     """Application lifespan handler for startup and shutdown events"""
     # Startup
     await init_db()
+    await cache_manager.connect()
+    await llm_service.connect()
     yield
     # Shutdown
+    await llm_service.disconnect()
+    await cache_manager.disconnect()
     await close_db()
 
 
@@ -44,6 +55,51 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+async def _log_usage_at_end(
+    request: Request, body: AsyncIterator[bytes], records: List[LLMCallRecord]
+) -> AsyncIterator[bytes]:
+    """Pass a streamed body through, then log the request's LLM usage"""
+    try:
+        async for chunk in body:
+            yield chunk
+    finally:
+        if records:
+            usage = summarize_usage(records)
+            logger.info(
+                "LLM usage for streamed %s %s: calls=%d tokens=%d cost=%.6f",
+                request.method,
+                request.url.path,
+                usage["calls"],
+                usage["prompt_tokens"] + usage["completion_tokens"],
+                usage["cost"],
+            )
+
+
+@app.middleware("http")
+async def llm_usage_headers(request: Request, call_next):
+    """
+    Report the LLM calls, tokens and cost spent on each request
+    Headers cover non-streamed responses only: a streamed body's calls are
+    still running when its headers go out, so its usage is logged once the
+    stream ends instead. LLM calls are fair-queued per session
+    (X-Session-ID), else per client.
+    """
+    tenant = request.headers.get("X-Session-ID") or (request.client.host if request.client else None)
+    with usage_scope() as records, scheduling_scope(tenant=tenant):
+        response = await call_next(request)
+    if "content-length" not in response.headers:
+        # The records list keeps filling while the body is produced
+        response.body_iterator = _log_usage_at_end(request, response.body_iterator, records)
+        return response
+    if records:
+        usage = summarize_usage(records)
+        response.headers["X-LLM-Calls"] = str(usage["calls"])
+        response.headers["X-LLM-Tokens"] = str(usage["prompt_tokens"] + usage["completion_tokens"])
+        response.headers["X-LLM-Cost"] = f"{usage['cost']:.6f}"
+    return response
+
+
 # Include API routes
 app.include_router(api_router, prefix=settings.API_PREFIX)
 
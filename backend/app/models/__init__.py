@@ -2,13 +2,24 @@
 Models module initialization
 """
 
-from .models import Customer, TokenMap, Solution, RolePlaySession, DifficultyLevel, ScenarioType
+from .models import (
+    Customer,
+    TokenMap,
+    Solution,
+    SolutionVersion,
+    RolePlaySession,
+    RolePlayTurn,
+    DifficultyLevel,
+    ScenarioType,
+)
 
 __all__ = [
     "Customer",
     "TokenMap",
     "Solution",
+    "SolutionVersion",
     "RolePlaySession",
+    "RolePlayTurn",
     "DifficultyLevel",
     "ScenarioType",
 ]
@@ -4,12 +4,18 @@ Database models for Tokenholic application
 
 from datetime import datetime
 from typing import Optional
-from sqlalchemy import String, Text, Integer, Float, DateTime, ForeignKey, JSON, Enum
-from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy import (
+    BigInteger, Boolean, String, Text, Integer, Float, DateTime, ForeignKey, Index, JSON, Enum, UniqueConstraint,
+)
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Mapped, WriteOnlyMapped, mapped_column, relationship
 import enum
 
 from app.core.database import Base
 
+# JSONB on Postgres, so documents can be indexed and queried in SQL; JSON elsewhere
+JSONDocument = JSON().with_variant(JSONB(), "postgresql")
+
 
 class DifficultyLevel(str, enum.Enum):
     """Role play difficulty levels"""
@@ -35,7 +41,8 @@ class Customer(Base):
     industry: Mapped[Optional[str]] = mapped_column(String(100))
     website: Mapped[Optional[str]] = mapped_column(String(500))
     description: Mapped[Optional[str]] = mapped_column(Text)
-    metadata: Mapped[Optional[dict]] = mapped_column(JSON, default=dict)
+    # "metadata" is reserved on declarative classes; the column keeps its name
+    metadata_: Mapped[Optional[dict]] = mapped_column("metadata", JSON, default=dict)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -47,15 +54,30 @@ class Customer(Base):
 class TokenMap(Base):
     """Token Map model - stores AI/LLM usage analysis for customers"""
     __tablename__ = "token_maps"
+    __table_args__ = (
+        # One row per customer and version; serves latest-map and version-page reads
+        Index("ix_token_maps_customer_version", "customer_id", "version", unique=True),
+        # Containment lookups (providers @> '[{"provider": "alibaba"}]') across all maps
+        Index(
+            "ix_token_maps_providers", "providers",
+            postgresql_using="gin", postgresql_ops={"providers": "jsonb_path_ops"},
+        ).ddl_if(dialect="postgresql"),
+        Index(
+            "ix_token_maps_layers", "layers",
+            postgresql_using="gin", postgresql_ops={"layers": "jsonb_path_ops"},
+        ).ddl_if(dialect="postgresql"),
+        # Default operator class so key-existence (?) works as well as containment
+        Index("ix_token_maps_research_data", "research_data", postgresql_using="gin").ddl_if(dialect="postgresql"),
+    )
 
     id: Mapped[str] = mapped_column(String(36), primary_key=True)
     customer_id: Mapped[str] = mapped_column(String(36), ForeignKey("customers.id"), nullable=False)
     customer_name: Mapped[str] = mapped_column(String(255), nullable=False)
-    layers: Mapped[dict] = mapped_column(JSON, default=list)  # Business layers with use cases
-    providers: Mapped[dict] = mapped_column(JSON, default=list)  # Provider distribution
+    layers: Mapped[dict] = mapped_column(JSONDocument, default=list)  # Business layers with use cases
+    providers: Mapped[dict] = mapped_column(JSONDocument, default=list)  # Provider distribution
     total_tokens: Mapped[int] = mapped_column(Integer, default=0)
     confidence_score: Mapped[float] = mapped_column(Float, default=0.0)
-    research_data: Mapped[Optional[dict]] = mapped_column(JSON)  # Raw research data
+    research_data: Mapped[Optional[dict]] = mapped_column(JSONDocument)  # Raw research data
     version: Mapped[int] = mapped_column(Integer, default=1)
     notes: Mapped[Optional[str]] = mapped_column(Text)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
@@ -70,18 +92,42 @@ class Solution(Base):
     __tablename__ = "solutions"
 
     id: Mapped[str] = mapped_column(String(36), primary_key=True)
-    customer_id: Mapped[Optional[str]] = mapped_column(String(36), ForeignKey("customers.id"))
+    customer_id: Mapped[Optional[str]] = mapped_column(String(36), ForeignKey("customers.id"), index=True)
     requirements: Mapped[str] = mapped_column(Text, nullable=False)
     recommendation: Mapped[str] = mapped_column(Text, nullable=False)
     products: Mapped[dict] = mapped_column(JSON, default=list)  # Recommended products
     sources: Mapped[dict] = mapped_column(JSON, default=list)  # Knowledge base sources
-    version: Mapped[int] = mapped_column(Integer, default=1)
-    version_history: Mapped[dict] = mapped_column(JSON, default=list)  # Previous versions
+    version: Mapped[int] = mapped_column(Integer, default=1)  # Latest version, the one held in this row
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
-    # Relationships
+    # Relationships; history is read a version at a time, never loaded with the solution
     customer: Mapped[Optional["Customer"]] = relationship(back_populates="solutions")
+    versions: WriteOnlyMapped["SolutionVersion"] = relationship(
+        back_populates="solution",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+        order_by="SolutionVersion.version",
+    )
+
+
+class SolutionVersion(Base):
+    """One version of a solution, stored as a full snapshot or a delta from the previous version"""
+    __tablename__ = "solution_versions"
+    __table_args__ = (UniqueConstraint("solution_id", "version", name="uq_solution_versions_solution_version"),)
+
+    id: Mapped[int] = mapped_column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    solution_id: Mapped[str] = mapped_column(
+        String(36), ForeignKey("solutions.id", ondelete="CASCADE"), nullable=False
+    )
+    version: Mapped[int] = mapped_column(Integer, nullable=False)
+    is_snapshot: Mapped[bool] = mapped_column(Boolean, default=False)
+    data: Mapped[dict] = mapped_column(JSON, nullable=False)  # Full content, or changed fields as diffs
+    note: Mapped[Optional[str]] = mapped_column(String(500))  # What prompted the revision
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+    # Relationships
+    solution: Mapped["Solution"] = relationship(back_populates="versions")
 
 
 class RolePlaySession(Base):
@@ -92,11 +138,38 @@ class RolePlaySession(Base):
     scenario: Mapped[str] = mapped_column(Enum(ScenarioType), nullable=False)
     difficulty: Mapped[str] = mapped_column(Enum(DifficultyLevel), default=DifficultyLevel.MEDIUM)
     context: Mapped[Optional[str]] = mapped_column(Text)  # Customer context for the scenario
-    messages: Mapped[dict] = mapped_column(JSON, default=list)  # Conversation history
-    scores: Mapped[dict] = mapped_column(JSON, default=list)  # Per-message scores
+    turn_count: Mapped[int] = mapped_column(Integer, default=0, server_default="0")  # Last allocated turn number
     final_score: Mapped[float] = mapped_column(Float, default=0.0)
     feedback: Mapped[Optional[str]] = mapped_column(Text)  # Final feedback
     started_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     ended_at: Mapped[Optional[datetime]] = mapped_column(DateTime)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Relationships; turns are append-only and never loaded as a whole
+    turns: WriteOnlyMapped["RolePlayTurn"] = relationship(
+        back_populates="session",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+        order_by="RolePlayTurn.seq",
+    )
+
+
+class RolePlayTurn(Base):
+    """One message of a role play session, with its score once evaluated"""
+    __tablename__ = "role_play_turns"
+    __table_args__ = (UniqueConstraint("session_id", "seq", name="uq_role_play_turns_session_seq"),)
+
+    id: Mapped[int] = mapped_column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    session_id: Mapped[str] = mapped_column(
+        String(36), ForeignKey("role_play_sessions.id", ondelete="CASCADE"), nullable=False
+    )
+    seq: Mapped[int] = mapped_column(Integer, nullable=False)  # 1-based position in the session
+    role: Mapped[str] = mapped_column(String(20), nullable=False)
+    content: Mapped[str] = mapped_column(Text, nullable=False)
+    tokens: Mapped[int] = mapped_column(Integer, default=0)  # Prompt tokens the message costs
+    score: Mapped[Optional[dict]] = mapped_column(JSON)  # Per-criterion evaluation
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+    # Relationships
+    session: Mapped["RolePlaySession"] = relationship(back_populates="turns")
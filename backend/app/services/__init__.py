@@ -2,10 +2,20 @@
 Services module initialization
 """
 
-# Services will be imported here
-# from .customer_service import CustomerService
-# from .token_map_service import TokenMapService
-# from .solution_service import SolutionService
-# from .role_play_service import RolePlayService
+from .customer_service import CustomerNotFound, CustomerService
+from .role_play_service import RolePlayService, SessionNotFound
+from .solution_service import SolutionNotFound, SolutionService
+from .token_map_analytics import TokenMapAnalytics
+from .token_map_service import TokenMapNotFound, TokenMapService
 
-__all__ = []
+__all__ = [
+    "CustomerNotFound",
+    "CustomerService",
+    "RolePlayService",
+    "SessionNotFound",
+    "SolutionNotFound",
+    "SolutionService",
+    "TokenMapAnalytics",
+    "TokenMapNotFound",
+    "TokenMapService",
+]
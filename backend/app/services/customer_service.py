@@ -0,0 +1,103 @@
+"""
+Customer service
+Customer reads load related maps and solutions explicitly, in a fixed
+number of queries, instead of through lazy relationship access
+"""
+
+from typing import Optional, Dict, Any, List, Tuple
+import uuid
+
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from app.core.config import get_settings
+from app.models import Customer, Solution
+from app.services.token_map_service import SUMMARY_COLUMNS, TokenMapService
+
+settings = get_settings()
+
+# Listed customers skip description and metadata
+LIST_COLUMNS = (Customer.id, Customer.name, Customer.industry, Customer.website, Customer.created_at)
+
+
+class CustomerNotFound(LookupError):
+    """Raised when a customer does not exist"""
+
+    def __init__(self, customer_id: str):
+        super().__init__(f"Customer {customer_id} not found")
+        self.customer_id = customer_id
+
+
+class CustomerService:
+    """Customer storage and bulk reads"""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def create_customer(
+        self,
+        name: str,
+        industry: Optional[str] = None,
+        website: Optional[str] = None,
+        description: Optional[str] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+    ) -> Customer:
+        customer = Customer(
+            id=str(uuid.uuid4()),
+            name=name,
+            industry=industry,
+            website=website,
+            description=description,
+            metadata_=metadata or {},
+        )
+        self.db.add(customer)
+        await self.db.commit()
+        return customer
+
+    async def get_customer(self, customer_id: str, with_history: bool = False) -> Customer:
+        """
+        One customer; with_history also loads its maps and solutions
+        Related rows are loaded with one selectin query each and only their
+        summary columns, so reading layers, research_data or solution text
+        off them is not supported
+        """
+        query = select(Customer).where(Customer.id == customer_id)
+        if with_history:
+            query = query.options(
+                selectinload(Customer.token_maps).load_only(*SUMMARY_COLUMNS),
+                selectinload(Customer.solutions).load_only(
+                    Solution.id, Solution.customer_id, Solution.version, Solution.created_at, Solution.updated_at,
+                ),
+            )
+        customer = (await self.db.execute(query)).scalar_one_or_none()
+        if customer is None:
+            raise CustomerNotFound(customer_id)
+        return customer
+
+    async def list_customers(
+        self,
+        after: Optional[Tuple[str, str]] = None,
+        limit: Optional[int] = None,
+        industry: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        One page of customers by name, each with its latest map summary
+        Pass the (name, id) of the last customer seen as after to get the next
+        page; takes two queries whatever the page size
+        """
+        query = (
+            select(*LIST_COLUMNS)
+            .order_by(Customer.name, Customer.id)
+            .limit(limit or settings.LIST_PAGE_SIZE)
+        )
+        if after is not None:
+            query = query.where(tuple_(Customer.name, Customer.id) > tuple_(*after))
+        if industry is not None:
+            query = query.where(Customer.industry == industry)
+        customers = [dict(row) for row in (await self.db.execute(query)).mappings()]
+
+        latest = await TokenMapService(self.db).latest_summaries([customer["id"] for customer in customers])
+        for customer in customers:
+            customer["latest_token_map"] = latest.get(customer["id"])
+        return customers
@@ -0,0 +1,175 @@
+"""
+Role play session service
+Turns are appended as rows, so writing one costs the same at turn 5 or 500;
+transcripts are read a page at a time and prompts are built from a cached
+tail of recent turns
+"""
+
+from datetime import datetime
+from typing import Optional, Dict, Any, List
+import logging
+import uuid
+
+from redis.exceptions import RedisError
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.cache import CacheManager, cache_manager
+from app.core.config import get_settings
+from app.core.tokenizer import MESSAGE_OVERHEAD_TOKENS, count_tokens
+from app.models import DifficultyLevel, RolePlaySession, RolePlayTurn, ScenarioType
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+class SessionNotFound(LookupError):
+    """Raised when a role play session does not exist"""
+
+    def __init__(self, session_id: str):
+        super().__init__(f"Role play session {session_id} not found")
+        self.session_id = session_id
+
+
+def _tail_entry(turn: RolePlayTurn) -> Dict[str, Any]:
+    return {"seq": turn.seq, "role": turn.role, "content": turn.content, "tokens": turn.tokens}
+
+
+class RolePlayService:
+    """Session lifecycle and transcript storage for role play"""
+
+    def __init__(self, db: AsyncSession, cache: CacheManager = cache_manager):
+        self.db = db
+        self.cache = cache
+
+    @staticmethod
+    def _tail_key(session_id: str) -> str:
+        return f"roleplay:tail:{session_id}"
+
+    async def create_session(
+        self,
+        scenario: ScenarioType,
+        difficulty: DifficultyLevel = DifficultyLevel.MEDIUM,
+        context: Optional[str] = None,
+    ) -> RolePlaySession:
+        session = RolePlaySession(id=str(uuid.uuid4()), scenario=scenario, difficulty=difficulty, context=context)
+        self.db.add(session)
+        await self.db.commit()
+        return session
+
+    async def append_turn(
+        self,
+        session_id: str,
+        role: str,
+        content: str,
+        score: Optional[Dict[str, Any]] = None,
+    ) -> RolePlayTurn:
+        """
+        Append one message to a session's transcript
+        The sequence number comes from an atomic increment on the session
+        row, so concurrent writers never collide or overwrite each other
+        """
+        result = await self.db.execute(
+            update(RolePlaySession)
+            .where(RolePlaySession.id == session_id)
+            .values(turn_count=RolePlaySession.turn_count + 1, updated_at=datetime.utcnow())
+            .returning(RolePlaySession.turn_count)
+        )
+        seq = result.scalar_one_or_none()
+        if seq is None:
+            raise SessionNotFound(session_id)
+        turn = RolePlayTurn(
+            session_id=session_id,
+            seq=seq,
+            role=role,
+            content=content,
+            tokens=count_tokens(content) + MESSAGE_OVERHEAD_TOKENS,
+            score=score,
+        )
+        self.db.add(turn)
+        await self.db.commit()
+
+        if self.cache.is_connected:
+            try:
+                await self.cache.extend_list(
+                    self._tail_key(session_id), [_tail_entry(turn)], settings.ROLE_PLAY_TAIL_TURNS
+                )
+            except RedisError as exc:
+                logger.warning("Could not extend role play tail for %s: %s", session_id, exc)
+        return turn
+
+    async def record_score(self, session_id: str, seq: int, score: Dict[str, Any]) -> None:
+        """Attach an evaluation to one turn"""
+        await self.db.execute(
+            update(RolePlayTurn)
+            .where(RolePlayTurn.session_id == session_id, RolePlayTurn.seq == seq)
+            .values(score=score)
+        )
+        await self.db.commit()
+
+    async def list_turns(
+        self,
+        session_id: str,
+        after_seq: int = 0,
+        limit: Optional[int] = None,
+    ) -> List[RolePlayTurn]:
+        """One page of the transcript; pass the last seq seen to get the next page"""
+        result = await self.db.execute(
+            select(RolePlayTurn)
+            .where(RolePlayTurn.session_id == session_id, RolePlayTurn.seq > after_seq)
+            .order_by(RolePlayTurn.seq)
+            .limit(limit or settings.ROLE_PLAY_PAGE_SIZE)
+        )
+        return list(result.scalars())
+
+    async def recent_turns(self, session_id: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        The newest turns, oldest first, for prompt building
+        Served from the cached tail when it is complete and up to date with
+        the session's turn count; otherwise rebuilt with one indexed query
+        """
+        tail_size = settings.ROLE_PLAY_TAIL_TURNS
+        limit = min(limit or tail_size, tail_size)
+        turn_count = (
+            await self.db.execute(select(RolePlaySession.turn_count).where(RolePlaySession.id == session_id))
+        ).scalar_one_or_none()
+        if turn_count is None:
+            raise SessionNotFound(session_id)
+        if not turn_count:
+            return []
+
+        key = self._tail_key(session_id)
+        if self.cache.is_connected:
+            try:
+                cached = sorted(await self.cache.get_list(key), key=lambda entry: entry["seq"])
+            except RedisError as exc:
+                logger.warning("Could not read role play tail for %s: %s", session_id, exc)
+                cached = []
+            if (
+                cached
+                and cached[-1]["seq"] == turn_count
+                and cached[-1]["seq"] - cached[0]["seq"] + 1 == len(cached)
+                and (len(cached) >= limit or cached[0]["seq"] == 1)
+            ):
+                return cached[-limit:]
+
+        result = await self.db.execute(
+            select(RolePlayTurn)
+            .where(RolePlayTurn.session_id == session_id)
+            .order_by(RolePlayTurn.seq.desc())
+            .limit(tail_size)
+        )
+        tail = [_tail_entry(turn) for turn in reversed(list(result.scalars()))]
+        if self.cache.is_connected:
+            try:
+                await self.cache.replace_list(key, tail)
+            except RedisError as exc:
+                logger.warning("Could not rebuild role play tail for %s: %s", session_id, exc)
+        return tail[-limit:]
+
+    async def prompt_messages(self, session_id: str, limit: Optional[int] = None) -> List[Dict[str, str]]:
+        """Recent turns as chat messages"""
+        return [
+            {"role": entry["role"], "content": entry["content"]}
+            for entry in await self.recent_turns(session_id, limit)
+        ]
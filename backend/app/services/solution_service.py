@@ -0,0 +1,217 @@
+"""
+Solution service
+The solutions row always holds the latest version, so reading it costs the
+same however often it was refined; earlier versions live in
+solution_versions as periodic snapshots with line diffs in between
+"""
+
+from difflib import SequenceMatcher
+from typing import Optional, Dict, Any, List, Union
+import logging
+import uuid
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import get_settings
+from app.models import Solution, SolutionVersion
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Content that is versioned; text fields are stored as line diffs, lists whole
+TEXT_FIELDS = ("requirements", "recommendation")
+LIST_FIELDS = ("products", "sources")
+
+# A diff is a list of ops over the previous text's lines: a positive int
+# copies that many lines, a negative int skips them, a list inserts lines
+TextDiff = List[Union[int, List[str]]]
+
+
+class SolutionNotFound(LookupError):
+    """Raised when a solution, or a requested version of it, does not exist"""
+
+    def __init__(self, solution_id: str, version: Optional[int] = None):
+        what = f"Solution {solution_id}" if version is None else f"Version {version} of solution {solution_id}"
+        super().__init__(f"{what} not found")
+        self.solution_id = solution_id
+        self.version = version
+
+
+def diff_text(old: str, new: str) -> TextDiff:
+    """Line diff that turns old into new"""
+    a = old.splitlines(keepends=True)
+    b = new.splitlines(keepends=True)
+    ops: TextDiff = []
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, a, b, autojunk=False).get_opcodes():
+        if tag == "equal":
+            ops.append(i2 - i1)
+            continue
+        if i2 > i1:
+            ops.append(i1 - i2)
+        if j2 > j1:
+            ops.append(b[j1:j2])
+    return ops
+
+
+def apply_text_diff(old: str, ops: TextDiff) -> str:
+    lines = old.splitlines(keepends=True)
+    out: List[str] = []
+    position = 0
+    for op in ops:
+        if isinstance(op, list):
+            out.extend(op)
+        elif op > 0:
+            out.extend(lines[position:position + op])
+            position += op
+        else:
+            position -= op
+    return "".join(out)
+
+
+def content_of(solution: Solution) -> Dict[str, Any]:
+    return {field: getattr(solution, field) for field in TEXT_FIELDS + LIST_FIELDS}
+
+
+def make_delta(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    """Changed fields only: text as diffs, lists replaced whole"""
+    delta: Dict[str, Any] = {}
+    for field in TEXT_FIELDS:
+        if new[field] != old[field]:
+            delta[field] = diff_text(old[field], new[field])
+    for field in LIST_FIELDS:
+        if new[field] != old[field]:
+            delta[field] = new[field]
+    return delta
+
+
+def apply_delta(content: Dict[str, Any], delta: Dict[str, Any]) -> Dict[str, Any]:
+    content = dict(content)
+    for field, change in delta.items():
+        content[field] = apply_text_diff(content[field], change) if field in TEXT_FIELDS else change
+    return content
+
+
+class SolutionService:
+    """Solution storage with compact version history"""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def create_solution(
+        self,
+        requirements: str,
+        recommendation: str,
+        products: Optional[List[Any]] = None,
+        sources: Optional[List[Any]] = None,
+        customer_id: Optional[str] = None,
+    ) -> Solution:
+        solution = Solution(
+            id=str(uuid.uuid4()),
+            customer_id=customer_id,
+            requirements=requirements,
+            recommendation=recommendation,
+            products=products or [],
+            sources=sources or [],
+            version=1,
+        )
+        self.db.add(solution)
+        self.db.add(SolutionVersion(solution_id=solution.id, version=1, is_snapshot=True, data=content_of(solution)))
+        await self.db.commit()
+        return solution
+
+    async def get_solution(self, solution_id: str) -> Solution:
+        """The latest version; history is not loaded"""
+        solution = await self.db.get(Solution, solution_id)
+        if solution is None:
+            raise SolutionNotFound(solution_id)
+        return solution
+
+    async def revise(self, solution_id: str, note: Optional[str] = None, **changes: Any) -> Solution:
+        """
+        Store a new version with the given fields changed
+        Only the delta from the current version is written, except every
+        SOLUTION_SNAPSHOT_INTERVAL versions, which are stored in full so
+        rebuilding an old version never replays more than that many deltas
+        """
+        unknown = set(changes) - set(TEXT_FIELDS + LIST_FIELDS)
+        if unknown:
+            raise ValueError(f"Unversioned solution fields: {', '.join(sorted(unknown))}")
+
+        # Lock the row so concurrent revisions get consecutive versions
+        solution = await self.db.get(Solution, solution_id, with_for_update=True)
+        if solution is None:
+            raise SolutionNotFound(solution_id)
+        old = content_of(solution)
+        new = {**old, **changes}
+        version = solution.version + 1
+        is_snapshot = (version - 1) % settings.SOLUTION_SNAPSHOT_INTERVAL == 0
+        self.db.add(SolutionVersion(
+            solution_id=solution_id,
+            version=version,
+            is_snapshot=is_snapshot,
+            data=new if is_snapshot else make_delta(old, new),
+            note=note,
+        ))
+        for field, value in changes.items():
+            setattr(solution, field, value)
+        solution.version = version
+        await self.db.commit()
+        return solution
+
+    async def list_versions(
+        self,
+        solution_id: str,
+        before_version: Optional[int] = None,
+        limit: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        One page of history, newest first, without content
+        Pass the last version seen as before_version to get the next page
+        """
+        query = (
+            select(SolutionVersion.version, SolutionVersion.is_snapshot, SolutionVersion.note, SolutionVersion.created_at)
+            .where(SolutionVersion.solution_id == solution_id)
+            .order_by(SolutionVersion.version.desc())
+            .limit(limit or settings.SOLUTION_HISTORY_PAGE_SIZE)
+        )
+        if before_version is not None:
+            query = query.where(SolutionVersion.version < before_version)
+        return [dict(row) for row in (await self.db.execute(query)).mappings()]
+
+    async def get_version(self, solution_id: str, version: int) -> Dict[str, Any]:
+        """
+        Content of one version
+        Reads the nearest snapshot at or before it plus the deltas up to it in
+        a single query
+        """
+        last_snapshot = (
+            select(func.max(SolutionVersion.version))
+            .where(
+                SolutionVersion.solution_id == solution_id,
+                SolutionVersion.is_snapshot.is_(True),
+                SolutionVersion.version <= version,
+            )
+            .scalar_subquery()
+        )
+        rows = (await self.db.execute(
+            select(SolutionVersion.version, SolutionVersion.is_snapshot, SolutionVersion.data)
+            .where(
+                SolutionVersion.solution_id == solution_id,
+                SolutionVersion.version >= last_snapshot,
+                SolutionVersion.version <= version,
+            )
+            .order_by(SolutionVersion.version)
+        )).all()
+        if not rows or rows[-1].version != version:
+            raise SolutionNotFound(solution_id, version)
+
+        content = rows[0].data
+        expected = rows[0].version
+        for row in rows[1:]:
+            expected += 1
+            if row.version != expected:
+                logger.error("Solution %s history has a gap before version %s", solution_id, row.version)
+                raise SolutionNotFound(solution_id, version)
+            content = apply_delta(content, row.data)
+        return {"version": version, **content}
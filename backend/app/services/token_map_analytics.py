@@ -0,0 +1,158 @@
+"""
+Portfolio analytics over token maps
+Filtering and aggregation run in SQL against the JSON documents, using the
+GIN-indexed JSONB operators on Postgres and json_each elsewhere, so the
+dashboards never pull whole maps into Python. Caller-supplied keys are always
+bound parameters, never spliced into SQL or JSON paths
+
+Document shapes:
+    providers: [{"provider": "alibaba", "tokens": 1.2, ...}, ...]
+    layers: {"external": [{"category": ..., "use_cases": [
+        {"name": ..., "model": ..., "tokens": ..., "provider": ...}, ...]}, ...], ...}
+    research_data: {"<research focus>": ..., ...}
+"""
+
+from typing import Optional, Dict, Any, List
+import logging
+
+from sqlalchemy import column, distinct, exists, func, select, true, type_coerce
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import TokenMap
+from app.models.models import JSONDocument
+
+logger = logging.getLogger(__name__)
+
+PROVIDER_KEY = "provider"
+TOKENS_KEY = "tokens"
+USE_CASES_KEY = "use_cases"
+NAME_KEY = "name"
+
+
+class TokenMapAnalytics:
+    """Cross-customer lookups over token map layers, providers and research"""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    @property
+    def _postgres(self) -> bool:
+        return self.db.get_bind().dialect.name == "postgresql"
+
+    def _elements(self, document, key: Optional[str] = None):
+        """
+        Rows of a JSON array (optionally document[key]) with a JSON "value"
+        column, to be joined ON true: both databases let a table-valued
+        function read columns of the tables joined before it
+        """
+        value = column("value", JSONDocument)
+        if self._postgres:
+            array = document if key is None else type_coerce(document, JSONB)[key]
+            return func.jsonb_array_elements(array).table_valued(value)
+        if key is None:
+            return func.json_each(document).table_valued(value)
+        return func.json_each(self._member(document, key)).table_valued(value)
+
+    @staticmethod
+    def _member(document, key: str):
+        """
+        document[key] on SQLite, found by comparing json_each keys to a bound
+        parameter: a JSON path cannot address keys containing quotes
+        """
+        member = func.json_each(document).table_valued("key", "value").alias()
+        return select(member.c.value).where(member.c.key == key).correlate_except(member).scalar_subquery()
+
+    def _uses_provider(self, provider: str):
+        """Filter on maps listing the provider; an indexed containment test on Postgres"""
+        if self._postgres:
+            return type_coerce(TokenMap.providers, JSONB).contains([{PROVIDER_KEY: provider}])
+        entry = self._elements(TokenMap.providers).alias("provider_entry")
+        return exists(
+            select(1).select_from(entry).where(entry.c.value[PROVIDER_KEY].as_string() == provider)
+        )
+
+    async def customers_using_provider(self, provider: str, limit: int = 100) -> List[Dict[str, Any]]:
+        """Customers with at least one map that lists the provider"""
+        result = await self.db.execute(
+            select(TokenMap.customer_id, func.max(TokenMap.customer_name).label("customer_name"))
+            .where(self._uses_provider(provider))
+            .group_by(TokenMap.customer_id)
+            .order_by(TokenMap.customer_id)
+            .limit(limit)
+        )
+        return [dict(row) for row in result.mappings()]
+
+    async def provider_breakdown(self) -> List[Dict[str, Any]]:
+        """Per provider: customers, maps and estimated tokens, largest first"""
+        entry = self._elements(TokenMap.providers).alias("provider_entry")
+        provider = entry.c.value[PROVIDER_KEY].as_string()
+        tokens = func.coalesce(func.sum(entry.c.value[TOKENS_KEY].as_float()), 0.0)
+        result = await self.db.execute(
+            select(
+                provider.label("provider"),
+                func.count(distinct(TokenMap.customer_id)).label("customers"),
+                func.count(distinct(TokenMap.id)).label("maps"),
+                tokens.label("tokens"),
+            )
+            .select_from(TokenMap)
+            .join(entry, true())
+            .where(provider.is_not(None))
+            .group_by(provider)
+            .order_by(tokens.desc(), provider)
+        )
+        return [dict(row) for row in result.mappings()]
+
+    async def top_use_cases(
+        self,
+        layer: str,
+        limit: int = 10,
+        provider: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Most common use cases in one business layer across all maps
+        Optionally only use cases served by the given provider; on Postgres
+        that also prefilters maps by a containment test the layers GIN index
+        serves, so only maps with such a use case are unnested
+        """
+        category = self._elements(TokenMap.layers, layer).alias("category")
+        use_case = self._elements(category.c.value, USE_CASES_KEY).alias("use_case")
+        name = use_case.c.value[NAME_KEY].as_string()
+        customers = func.count(distinct(TokenMap.customer_id))
+        query = (
+            select(
+                name.label("name"),
+                customers.label("customers"),
+                func.coalesce(func.sum(use_case.c.value[TOKENS_KEY].as_float()), 0.0).label("tokens"),
+            )
+            .select_from(TokenMap)
+            .join(category, true())
+            .join(use_case, true())
+            .where(name.is_not(None))
+            .group_by(name)
+            .order_by(customers.desc(), name)
+            .limit(limit)
+        )
+        if provider is not None:
+            query = query.where(use_case.c.value[PROVIDER_KEY].as_string() == provider)
+            if self._postgres:
+                query = query.where(type_coerce(TokenMap.layers, JSONB).contains(
+                    {layer: [{USE_CASES_KEY: [{PROVIDER_KEY: provider}]}]}
+                ))
+        result = await self.db.execute(query)
+        return [dict(row) for row in result.mappings()]
+
+    async def maps_with_research(self, focus: str, limit: int = 100) -> List[Dict[str, Any]]:
+        """Maps whose research covers the focus; the research itself is not loaded"""
+        if self._postgres:
+            has_focus = type_coerce(TokenMap.research_data, JSONB).has_key(focus)
+        else:
+            entry = func.json_each(TokenMap.research_data).table_valued("key").alias("research_entry")
+            has_focus = exists(select(1).select_from(entry).where(entry.c.key == focus))
+        result = await self.db.execute(
+            select(TokenMap.id, TokenMap.customer_id, TokenMap.customer_name, TokenMap.version)
+            .where(has_focus)
+            .order_by(TokenMap.created_at.desc(), TokenMap.id)
+            .limit(limit)
+        )
+        return [dict(row) for row in result.mappings()]
@@ -0,0 +1,129 @@
+"""
+Token map service
+Map versions per customer, with list queries that project summary columns
+and leave the layer and research documents in the database
+"""
+
+from typing import Optional, Dict, Any, List, Sequence
+import uuid
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import get_settings
+from app.models import Customer, TokenMap
+
+settings = get_settings()
+
+# Everything but layers and research_data, which can run to hundreds of KB
+SUMMARY_COLUMNS = (
+    TokenMap.id,
+    TokenMap.customer_id,
+    TokenMap.customer_name,
+    TokenMap.version,
+    TokenMap.providers,
+    TokenMap.total_tokens,
+    TokenMap.confidence_score,
+    TokenMap.created_at,
+    TokenMap.updated_at,
+)
+
+
+class TokenMapNotFound(LookupError):
+    """Raised when a token map does not exist"""
+
+    def __init__(self, map_id: str):
+        super().__init__(f"Token map {map_id} not found")
+        self.map_id = map_id
+
+
+class TokenMapService:
+    """Token map storage and bulk reads"""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def create_token_map(
+        self,
+        customer: Customer,
+        layers: Dict[str, Any],
+        providers: List[Dict[str, Any]],
+        total_tokens: int = 0,
+        confidence_score: float = 0.0,
+        research_data: Optional[Dict[str, Any]] = None,
+        notes: Optional[str] = None,
+    ) -> TokenMap:
+        """
+        Store a map as the customer's next version
+        The customer row is locked first, so concurrent creates are numbered
+        one after the other; the unique (customer_id, version) index rejects
+        anything that slips past
+        """
+        await self.db.execute(select(Customer.id).where(Customer.id == customer.id).with_for_update())
+        latest = (await self.db.execute(
+            select(func.max(TokenMap.version)).where(TokenMap.customer_id == customer.id)
+        )).scalar_one()
+        token_map = TokenMap(
+            id=str(uuid.uuid4()),
+            customer_id=customer.id,
+            customer_name=customer.name,
+            layers=layers,
+            providers=providers,
+            total_tokens=total_tokens,
+            confidence_score=confidence_score,
+            research_data=research_data,
+            version=(latest or 0) + 1,
+            notes=notes,
+        )
+        self.db.add(token_map)
+        await self.db.commit()
+        return token_map
+
+    async def get_token_map(self, map_id: str) -> TokenMap:
+        """The full map, documents included"""
+        token_map = await self.db.get(TokenMap, map_id)
+        if token_map is None:
+            raise TokenMapNotFound(map_id)
+        return token_map
+
+    async def latest_summaries(self, customer_ids: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Summary of each customer's newest map, in one query
+        Ranks maps per customer with a window function instead of querying
+        customer by customer
+        """
+        if not customer_ids:
+            return {}
+        rank = func.row_number().over(
+            partition_by=TokenMap.customer_id,
+            order_by=(TokenMap.version.desc(), TokenMap.created_at.desc()),
+        )
+        ranked = (
+            select(*SUMMARY_COLUMNS, rank.label("rank"))
+            .where(TokenMap.customer_id.in_(customer_ids))
+            .subquery()
+        )
+        result = await self.db.execute(
+            select(*(ranked.c[column.key] for column in SUMMARY_COLUMNS)).where(ranked.c.rank == 1)
+        )
+        return {row["customer_id"]: dict(row) for row in result.mappings()}
+
+    async def list_versions(
+        self,
+        customer_id: str,
+        before_version: Optional[int] = None,
+        limit: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        One page of a customer's map summaries, newest first
+        Pass the last version seen as before_version to get the next page
+        """
+        query = (
+            select(*SUMMARY_COLUMNS)
+            .where(TokenMap.customer_id == customer_id)
+            .order_by(TokenMap.version.desc())
+            .limit(limit or settings.LIST_PAGE_SIZE)
+        )
+        if before_version is not None:
+            query = query.where(TokenMap.version < before_version)
+        return [dict(row) for row in (await self.db.execute(query)).mappings()]
@@ -7,10 +7,12 @@ from typing import AsyncGenerator, Generator
 
 import pytest
 import pytest_asyncio
+from fakeredis import FakeAsyncRedis
 from httpx import AsyncClient
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 
 from app.main import app
+from app.core.cache import CacheManager
 from app.core.database import Base, get_db
 
 # Test database URL (use SQLite for testing)
@@ -63,3 +65,13 @@ async def client(db_session: AsyncSession) -> AsyncGenerator[AsyncClient, None]:
         yield ac
 
     app.dependency_overrides.clear()
+
+
+@pytest_asyncio.fixture
+async def cache() -> AsyncGenerator[CacheManager, None]:
+    """Create cache manager backed by an in-memory Redis"""
+    manager = CacheManager()
+    manager._client = FakeAsyncRedis(decode_responses=True)
+    yield manager
+    await manager.client.flushall()
+    await manager.disconnect()
@@ -0,0 +1,311 @@
+"""
+Tests for the agent base classes
+"""
+
+import asyncio
+from typing import Any
+
+import pytest
+
+from app.agents.base import AgentBase, agent_request_scope
+from app.agents.registry import AgentRegistry
+from app.core.llm import TaskType, llm_service
+
+
+class EchoAgent(AgentBase):
+    """Minimal agent used by the tests"""
+
+    def __init__(self, name: str = "echo"):
+        super().__init__(name=name, description="Echoes its input")
+
+    async def process(self, input_data: Any) -> Any:
+        self.add_to_memory({"role": "user", "content": input_data})
+        await asyncio.sleep(0)
+        return [m["content"] for m in self.memory]
+
+
+@pytest.mark.asyncio
+async def test_agent_construction_inside_running_loop():
+    """Test agents can be built inside a running loop and use the global service"""
+    agent = EchoAgent()
+    assert agent.llm_service is llm_service
+
+
+@pytest.mark.asyncio
+async def test_registry_reuses_instances():
+    """Test the registry hands out one instance per class and arguments"""
+    registry = AgentRegistry()
+    first = registry.get(EchoAgent, name="echo")
+    assert registry.get(EchoAgent, name="echo") is first
+    assert registry.get(EchoAgent, name="other") is not first
+    assert len(registry) == 2
+
+
+@pytest.mark.asyncio
+async def test_shared_agent_memory_is_per_request():
+    """Test concurrent requests using one agent instance do not see each other's memory"""
+    agent = AgentRegistry().get(EchoAgent)
+
+    async def request(text: str):
+        with agent_request_scope():
+            await agent.process(text)
+            return await agent.process(text + "!")
+
+    first, second = await asyncio.gather(request("a"), request("b"))
+    assert first == ["a", "a!"]
+    assert second == ["b", "b!"]
+
+
+@pytest.mark.asyncio
+async def test_pipeline_runs_independent_steps_concurrently():
+    """Test independent steps overlap, respect the concurrency cap and feed dependents"""
+    from app.agents.pipeline import AgentPipeline, StepStatus
+
+    active, peak = 0, 0
+
+    async def fetch(topic):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.02)
+        active -= 1
+        if topic == "broken":
+            raise RuntimeError("source unavailable")
+        return topic.upper()
+
+    async def combine(findings):
+        return sorted(findings.values())
+
+    pipeline = AgentPipeline("test", max_concurrency=2)
+    for topic in ("news", "jobs", "stack", "broken"):
+        pipeline.add_step(topic, fetch, build_input=lambda _, __, t=topic: t, required=False)
+    pipeline.add_step("analysis", combine, depends_on=["news", "jobs", "stack", "broken"])
+
+    order = [result.name async for result in pipeline.stream(None)]
+    result = await pipeline.run(None)
+
+    assert order[-1] == "analysis"
+    assert peak == 2
+    assert result.steps["broken"].status == StepStatus.FAILED
+    assert result.outputs["analysis"] == ["JOBS", "NEWS", "STACK"]
+
+
+@pytest.mark.asyncio
+async def test_pipeline_skips_dependents_of_failed_required_step():
+    """Test a failed required step skips everything downstream"""
+    from app.agents.pipeline import AgentPipeline, StepStatus
+
+    async def fail(_):
+        raise RuntimeError("boom")
+
+    async def never(_):
+        raise AssertionError("should not run")
+
+    pipeline = AgentPipeline("test").add_step("a", fail).add_step("b", never, depends_on=["a"])
+    result = await pipeline.run(None)
+    assert result.steps["a"].status == StepStatus.FAILED
+    assert result.steps["b"].status == StepStatus.SKIPPED
+
+
+@pytest.mark.asyncio
+async def test_pipeline_cancels_work_at_deadline():
+    """Test unfinished steps are cancelled when the deadline passes"""
+    from app.agents.pipeline import AgentPipeline, StepStatus
+
+    async def quick(_):
+        return "done"
+
+    async def slow(_):
+        await asyncio.sleep(10)
+
+    pipeline = (
+        AgentPipeline("test")
+        .add_step("quick", quick)
+        .add_step("slow", slow)
+        .add_step("after", quick, depends_on=["slow"])
+    )
+    result = await pipeline.run(None, timeout=0.05)
+
+    assert result.steps["quick"].status == StepStatus.COMPLETED
+    assert result.steps["slow"].status == StepStatus.CANCELLED
+    assert result.steps["after"].status == StepStatus.CANCELLED
+    assert result.timed_out
+    assert result.duration < 1
+
+
+@pytest.mark.asyncio
+async def test_streaming_step_receives_outputs_as_they_complete():
+    """Test a streaming step sees early results before slow dependencies finish"""
+    from app.agents.pipeline import AgentPipeline, StepStatus
+
+    slow_done = asyncio.Event()
+    seen_before_slow = []
+
+    async def fast(_):
+        return "fast"
+
+    async def slow(_):
+        await asyncio.sleep(0.05)
+        slow_done.set()
+        return "slow"
+
+    async def broken(_):
+        raise RuntimeError("source unavailable")
+
+    async def combine(results):
+        collected = []
+        async for name, output in results:
+            if not slow_done.is_set():
+                seen_before_slow.append(name)
+            collected.append(output)
+        return collected
+
+    # One slot: the streaming step must not hold it while its inputs run
+    pipeline = (
+        AgentPipeline("test", max_concurrency=1)
+        .add_step("fast", fast, required=False)
+        .add_step("slow", slow, required=False)
+        .add_step("broken", broken, required=False)
+        .add_step("analysis", combine, depends_on=["fast", "slow", "broken"], streaming=True)
+    )
+    result = await pipeline.run(None, timeout=1)
+
+    assert seen_before_slow == ["fast"]
+    assert result.steps["analysis"].status == StepStatus.COMPLETED
+    assert result.outputs["analysis"] == ["fast", "slow"]
+
+
+@pytest.mark.asyncio
+async def test_streaming_step_skipped_when_required_dependency_fails():
+    """Test a running streaming step is cancelled once a required input fails"""
+    from app.agents.pipeline import AgentPipeline, StepStatus
+
+    async def fail(_):
+        await asyncio.sleep(0.01)
+        raise RuntimeError("boom")
+
+    async def consume(results):
+        return [name async for name, _ in results]
+
+    pipeline = AgentPipeline("test").add_step("a", fail).add_step("b", consume, depends_on=["a"], streaming=True)
+    result = await pipeline.run(None, timeout=1)
+    assert result.steps["b"].status == StepStatus.SKIPPED
+
+
+def test_pipeline_rejects_cycles():
+    """Test dependency cycles are reported before anything runs"""
+    from app.agents.pipeline import AgentPipeline
+
+    async def noop(_):
+        return None
+
+    pipeline = AgentPipeline("test").add_step("a", noop, depends_on=["b"]).add_step("b", noop, depends_on=["a"])
+    with pytest.raises(ValueError):
+        pipeline.validate()
+
+
+@pytest.mark.asyncio
+async def test_memory_summarizes_when_over_token_budget():
+    """Test overflowing turns are folded into a summary and the window stays bounded"""
+    from app.agents.memory import ConversationMemory, SUMMARY_PREFIX
+
+    summarized = []
+
+    async def summarizer(summary, messages):
+        summarized.extend(messages)
+        return (summary + " " + " ".join(m["content"][:5] for m in messages)).strip()
+
+    memory = ConversationMemory(token_budget=100, max_messages=50, summarizer=summarizer)
+    for turn in range(20):
+        memory.append({"role": "user", "content": f"turn {turn} " + "x" * 40})
+    assert memory.overflowing
+
+    await memory.compact()
+    assert not memory.overflowing
+    assert memory.tokens <= 100
+    assert summarized[0]["content"].startswith("turn 0")
+
+    prompt = memory.prompt_messages("You are a CTO")
+    assert prompt[0] == {"role": "system", "content": "You are a CTO"}
+    assert prompt[1]["content"].startswith(SUMMARY_PREFIX)
+    assert prompt[-1]["content"].startswith("turn 19")
+
+
+@pytest.mark.asyncio
+async def test_memory_prompt_is_extended_incrementally():
+    """Test appends extend the cached prompt instead of rebuilding it"""
+    from app.agents.memory import ConversationMemory
+
+    memory = ConversationMemory(token_budget=1000, max_messages=3)
+    memory.append({"role": "user", "content": "a"})
+    first = memory.prompt_messages()
+    memory.append({"role": "assistant", "content": "b"})
+    assert [m["content"] for m in memory.prompt_messages()] == ["a", "b"]
+    assert len(first) == 1
+
+    # Without a summarizer, message-count overflow just drops the oldest turns
+    for content in "cde":
+        memory.append({"role": "user", "content": content})
+    await memory.compact()
+    assert [m["content"] for m in memory] == ["c", "d", "e"]
+
+
+@pytest.mark.asyncio
+async def test_agent_memory_uses_cheap_summarizer():
+    """Test agent memory summaries go to the turbo model"""
+    from app.core.llm import ModelType
+
+    agent = EchoAgent()
+    models = []
+
+    async def fake_generate(prompt, **kwargs):
+        models.append(kwargs.get("model"))
+        return "summary"
+
+    agent.llm_service = type("Service", (), {"generate": staticmethod(fake_generate)})()
+    with agent_request_scope():
+        agent.memory.token_budget = 20
+        for _ in range(10):
+            agent.add_to_memory({"role": "user", "content": "y" * 40})
+        await agent.memory.compact()
+        assert agent.memory.summary == "summary"
+    assert models == [ModelType.QWEN_TURBO]
+
+
+@pytest.mark.asyncio
+async def test_session_memory_carries_over_between_requests(cache):
+    """Test the summary and window persist per session while working memory stays per request"""
+    agent = EchoAgent()
+    agent.cache = cache
+    prompts = []
+
+    async def fake_generate(prompt, **kwargs):
+        return "summary"
+
+    async def fake_history(messages, **kwargs):
+        prompts.append([m["content"] for m in messages])
+        return f"reply {len(prompts)}"
+
+    agent.llm_service = type(
+        "Service", (), {"generate": staticmethod(fake_generate), "generate_with_history": staticmethod(fake_history)}
+    )()
+
+    with agent_request_scope("session-1"):
+        agent.add_to_memory({"role": "user", "content": "first"})
+        await agent.generate_with_memory(TaskType.PERSONA)
+    with agent_request_scope("session-2"):
+        agent.add_to_memory({"role": "user", "content": "elsewhere"})
+        await agent.generate_with_memory(TaskType.PERSONA)
+    with agent_request_scope("session-1"):
+        agent.add_to_memory({"role": "user", "content": "second"})
+        agent.memory.max_messages = 2
+        await agent.generate_with_memory(TaskType.PERSONA)
+
+    assert prompts[:2] == [["first"], ["elsewhere"]]
+    # The earlier turn was restored ahead of the new one, then summarized away
+    assert prompts[2][0].endswith("summary")
+    assert prompts[2][1:] == ["reply 1", "second"]
+    with agent_request_scope("session-1"):
+        await agent.load_memory()
+        assert agent.memory.summary == "summary"
+        assert [m["content"] for m in agent.memory] == ["reply 1", "second", "reply 3"]
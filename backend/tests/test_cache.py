@@ -0,0 +1,103 @@
+"""
+Tests for the cache manager
+"""
+
+import asyncio
+
+import pytest
+from fakeredis import FakeAsyncRedis, FakeServer
+
+from app.core.cache import CacheManager, LocalCache
+
+
+def test_local_cache_evicts_least_recently_used():
+    """Test the L1 tier stays bounded and keeps recently used keys"""
+    local = LocalCache(max_entries=2)
+    local.set("a", 1, ttl=60)
+    local.set("b", 2, ttl=60)
+    local.get("a")
+    local.set("c", 3, ttl=60)
+
+    assert local.get("a") == (True, 1)
+    assert local.get("b") == (False, None)
+    assert len(local) == 2
+
+
+def test_local_cache_expires_entries():
+    """Test expired L1 entries are reported as missing"""
+    local = LocalCache(max_entries=10)
+    local.set("a", 1, ttl=0)
+    assert local.get("a") == (False, None)
+
+
+@pytest.mark.asyncio
+async def test_l1_tier_serves_hot_keys(cache):
+    """Test prefixed keys are served in process after the first read"""
+    manager = CacheManager(l1_enabled=True)
+    manager._client = cache.client
+
+    await cache.set("session:1", {"user": "a"})
+    assert await manager.get("session:1") == {"user": "a"}
+    assert await manager.get("session:1") == {"user": "a"}
+
+    await cache.set("ratelimit:1", 5)
+    await manager.get("ratelimit:1")
+    await manager.get("ratelimit:1")
+
+    stats = manager.stats()
+    assert stats["l1_hits"] == 1
+    assert stats["l2_hits"] == 3
+
+
+@pytest.mark.asyncio
+async def test_l1_invalidation_across_workers():
+    """Test a write in one worker evicts the key from another worker's L1"""
+    server = FakeServer()
+    workers = []
+    for _ in range(2):
+        manager = CacheManager(l1_enabled=True)
+        manager._client = FakeAsyncRedis(server=server, decode_responses=True)
+        await manager.start_invalidation_listener()
+        workers.append(manager)
+    first, second = workers
+    await asyncio.sleep(0.05)
+
+    await first.set("session:1", {"turn": 1})
+    assert await second.get("session:1") == {"turn": 1}
+
+    await first.set("session:1", {"turn": 2})
+    await asyncio.sleep(0.05)
+    assert await second.get("session:1") == {"turn": 2}
+
+    for manager in workers:
+        await manager.disconnect()
+
+
+@pytest.mark.asyncio
+async def test_bulk_operations(cache):
+    """Test get_many/set_many/delete_many round-trip values"""
+    await cache.set_many({"session:1": {"turn": 1}, "scores:1": [1, 2]}, expire=60)
+
+    values = await cache.get_many(["session:1", "scores:1", "missing"])
+    assert values == {"session:1": {"turn": 1}, "scores:1": [1, 2], "missing": None}
+    assert 0 < await cache.ttl("scores:1") <= 60
+
+    assert await cache.delete_many(["session:1", "scores:1", "missing"]) == 2
+    assert await cache.get_many(["session:1"]) == {"session:1": None}
+
+
+@pytest.mark.asyncio
+async def test_pipeline_executes_in_one_batch(cache):
+    """Test queued pipeline commands return decoded results"""
+    async with cache.pipeline() as pipe:
+        pipe.set("session:1", {"a": 1}).incr("counter").get("session:1")
+
+    assert pipe.results == [True, 1, {"a": 1}]
+
+
+@pytest.mark.asyncio
+async def test_increment_rate_limit_sets_window(cache):
+    """Test the counter and its window are set atomically"""
+    assert await cache.increment_rate_limit("rl:user", window=30) == 1
+    assert await cache.increment_rate_limit("rl:user", window=30) == 2
+    assert 0 < await cache.ttl("rl:user") <= 30
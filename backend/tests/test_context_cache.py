@@ -0,0 +1,125 @@
+"""
+Tests for session prompt-prefix reuse
+"""
+
+import json
+
+import httpx
+import pytest
+
+from app.core.context_cache import ContextCache
+from app.core.llm import DashScopeClient, LLMConfig, LLMService, ModelType, TaskType
+from app.core.llm_transport import LLMTransport
+from app.core.telemetry import usage_scope
+from app.core.tokenizer import get_tokenizer
+
+PERSONA = "You are a skeptical procurement manager at Acme. " * 200
+
+
+def conversation(turns: int):
+    messages = [{"role": "system", "content": PERSONA}]
+    for turn in range(turns):
+        if turn:
+            messages.append({"role": "assistant", "content": f"Reply {turn}"})
+        messages.append({"role": "user", "content": f"Pitch {turn}"})
+    return messages
+
+
+@pytest.mark.asyncio
+async def test_later_turns_reuse_the_cached_prefix(cache):
+    """Test each turn is billed for the previous turn's prompt at the cached rate"""
+    service = LLMService()
+    service.context_cache = ContextCache(cache)
+
+    with usage_scope() as records:
+        for turns in (1, 2, 3):
+            await service.generate_with_history(conversation(turns), task=TaskType.PERSONA, context_session="s1")
+        await service.generate_with_history(conversation(3), task=TaskType.PERSONA)
+
+    first, second, third, untracked = records
+    assert first.cached_tokens == 0
+    assert 0 < second.cached_tokens < second.prompt_tokens
+    assert third.cached_tokens > second.cached_tokens
+    assert untracked.cached_tokens == 0
+    # Cost of a turn stays flat instead of growing with the history
+    assert third.cost < untracked.cost / 2
+    assert service.context_cache.stats()["hits"] == 2
+
+
+@pytest.mark.asyncio
+async def test_changed_prefix_misses_and_short_prompts_are_not_marked(cache):
+    """Test an edited history starts a new cached block and small prompts skip caching"""
+    context_cache = ContextCache(cache)
+    tokenizer = get_tokenizer()
+
+    plan = await context_cache.plan("s1", "qwen-max", conversation(1), tokenizer)
+    assert plan.messages[-1]["cache_control"] == {"type": "ephemeral"}
+    await context_cache.commit(plan)
+
+    edited = conversation(2)
+    edited[0] = {"role": "system", "content": PERSONA + "Now impatient."}
+    assert (await context_cache.plan("s1", "qwen-max", edited, tokenizer)).cached_tokens == 0
+
+    short = await context_cache.plan("s2", "qwen-max", [{"role": "user", "content": "hi"}], tokenizer)
+    assert "cache_control" not in short.messages[-1]
+    glm = await context_cache.plan("s1", "glm-4", conversation(2), tokenizer, supported=False)
+    assert glm.cached_tokens == 0 and "cache_control" not in glm.messages[-1]
+
+
+@pytest.mark.asyncio
+async def test_breakpoint_is_sent_and_provider_usage_wins():
+    """Test the marker becomes a content-part cache_control and reported cache hits are used"""
+    seen = {}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen["payload"] = json.loads(request.content)
+        usage = {"prompt_tokens": 1500, "completion_tokens": 2, "prompt_tokens_details": {"cached_tokens": 1200}}
+        body = (
+            'data: {"choices":[{"delta":{"content":"Hi"}}]}\n\n'
+            'data: {"choices":[{"delta":{},"finish_reason":"stop"}]}\n\n'
+            f'data: {json.dumps({"choices": [], "usage": usage})}\n\n'
+            "data: [DONE]\n\n"
+        )
+        return httpx.Response(200, text=body, headers={"content-type": "text/event-stream"})
+
+    service = LLMService()
+    service.config.providers["dashscope"]["api_key"] = "test-key"
+    service.transport = LLMTransport(service.config.providers, http_transport=httpx.MockTransport(handler))
+    service.dashscope_client = DashScopeClient(service.config, service.transport)
+
+    with usage_scope() as records:
+        chunks = [c async for c in service.stream_with_history(
+            conversation(2), model=ModelType.QWEN_MAX, context_session="s3"
+        )]
+    await service.transport.close()
+
+    assert "".join(c.content for c in chunks) == "Hi"
+    last = seen["payload"]["messages"][-1]
+    assert last["content"] == [{"type": "text", "text": "Pitch 1", "cache_control": {"type": "ephemeral"}}]
+    assert seen["payload"]["messages"][0]["content"] == PERSONA
+    assert records[0].cached_tokens == 1200
+    assert records[0].cost == pytest.approx(service._cost(ModelType.QWEN_MAX, 1500, 2, 1200))
+
+
+@pytest.mark.asyncio
+async def test_planning_error_releases_the_circuit_trial(cache):
+    """Test a failing context-cache plan does not leave a half-open circuit stuck"""
+    from app.core.resilience import CircuitBreaker
+
+    service = LLMService()
+    breaker = service.breakers["dashscope"] = CircuitBreaker("dashscope", failure_threshold=1, recovery_timeout=0.0)
+    breaker.record_failure()
+
+    async def broken_plan(*args, **kwargs):
+        raise RuntimeError("tokenizer unavailable")
+
+    service.context_cache.plan = broken_plan
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            await service.generate_with_history(conversation(1), model=ModelType.QWEN_MAX, context_session="s4")
+        with pytest.raises(RuntimeError):
+            async for _ in service.stream_with_history(
+                conversation(1), model=ModelType.QWEN_MAX, context_session="s4"
+            ):
+                pass
+    assert breaker.stats()["rejected"] == 0
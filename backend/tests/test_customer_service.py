@@ -0,0 +1,107 @@
+"""
+Tests for customer and token map bulk reads
+"""
+
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+import app.models  # noqa: F401  (registers tables on Base)
+from app.services import CustomerNotFound, CustomerService, SolutionService, TokenMapService
+from tests.conftest import test_engine
+
+
+@contextmanager
+def captured_queries():
+    statements = []
+
+    def listener(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(test_engine.sync_engine, "before_cursor_execute", listener)
+    try:
+        yield statements
+    finally:
+        event.remove(test_engine.sync_engine, "before_cursor_execute", listener)
+
+
+async def seed(db, count: int = 6):
+    customers = CustomerService(db)
+    token_maps = TokenMapService(db)
+    created = []
+    for number in range(count):
+        customer = await customers.create_customer(f"Customer {number:02d}", industry="internet")
+        for version in range(1, 4):
+            await token_maps.create_token_map(
+                customer,
+                layers={"external": []},
+                providers=[{"provider": "alibaba", "tokens": version}],
+                total_tokens=number * 100 + version,
+                research_data={"company_news": ["x" * 1000]},
+            )
+        created.append(customer)
+    return created
+
+
+@pytest.mark.asyncio
+async def test_list_takes_two_queries_and_skips_blobs(db_session):
+    """Test a page of customers with their latest maps costs two queries regardless of size"""
+    await seed(db_session)
+    service = CustomerService(db_session)
+
+    with captured_queries() as statements:
+        page = await service.list_customers(limit=4)
+    assert len(statements) == 2
+    assert not any("research_data" in statement or "layers" in statement for statement in statements)
+    assert [customer["name"] for customer in page] == [f"Customer {n:02d}" for n in range(4)]
+    latest = page[1]["latest_token_map"]
+    assert (latest["version"], latest["total_tokens"]) == (3, 103)
+    assert latest["providers"] == [{"provider": "alibaba", "tokens": 3}]
+
+    rest = await service.list_customers(after=(page[-1]["name"], page[-1]["id"]), limit=4)
+    assert [customer["name"] for customer in rest] == ["Customer 04", "Customer 05"]
+
+    newest_first = await TokenMapService(db_session).list_versions(page[0]["id"], limit=2)
+    assert [row["version"] for row in newest_first] == [3, 2]
+
+
+@pytest.mark.asyncio
+async def test_customer_history_loads_in_fixed_queries(db_session):
+    """Test maps and solutions come from one selectin query each"""
+    customer, *_ = await seed(db_session, count=2)
+    await SolutionService(db_session).create_solution("req", "rec", customer_id=customer.id)
+    db_session.expunge_all()
+
+    with captured_queries() as statements:
+        loaded = await CustomerService(db_session).get_customer(customer.id, with_history=True)
+    assert len(statements) == 3
+    assert sorted(token_map.version for token_map in loaded.token_maps) == [1, 2, 3]
+    assert [solution.version for solution in loaded.solutions] == [1]
+
+    with pytest.raises(CustomerNotFound):
+        await CustomerService(db_session).get_customer("missing")
+
+
+@pytest.mark.asyncio
+async def test_token_map_versions_are_unique_per_customer(db_session):
+    """Test versions are allocated under a customer lock and duplicates are rejected"""
+    import uuid
+
+    from sqlalchemy.exc import IntegrityError
+
+    from app.models import TokenMap
+
+    customer, *_ = await seed(db_session, count=1)
+    with captured_queries() as statements:
+        created = await TokenMapService(db_session).create_token_map(customer, layers={}, providers=[])
+    assert created.version == 4
+    assert statements[0].startswith("SELECT customers.id")
+
+    db_session.add(TokenMap(
+        id=str(uuid.uuid4()), customer_id=customer.id, customer_name=customer.name,
+        layers={}, providers=[], version=4,
+    ))
+    with pytest.raises(IntegrityError):
+        await db_session.commit()
+    await db_session.rollback()
@@ -0,0 +1,82 @@
+"""
+Tests for database engine configuration and pool metrics
+"""
+
+import pytest
+from sqlalchemy import exc, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.core.config import Settings
+from app.core.database import (
+    InstrumentedNullPool,
+    InstrumentedQueuePool,
+    PoolMetrics,
+    engine_options,
+    pool_sizes,
+)
+
+
+def make_settings(**overrides) -> Settings:
+    return Settings(_env_file=None, **overrides)
+
+
+def test_engine_options_do_not_follow_debug():
+    """Test pooling, echo and the asyncpg statement cache come from their own settings"""
+    options = engine_options(make_settings(DEBUG=True))
+    assert options["poolclass"] is InstrumentedQueuePool
+    assert options["echo"] is False
+    assert options["pool_pre_ping"] is True
+    assert options["connect_args"] == {"prepared_statement_cache_size": 500, "statement_cache_size": 500}
+    pgbouncer = engine_options(make_settings(DATABASE_STATEMENT_CACHE_SIZE=0))
+    assert pgbouncer["connect_args"] == {"prepared_statement_cache_size": 0, "statement_cache_size": 0}
+
+    unpooled = engine_options(make_settings(DATABASE_POOLING=False, DATABASE_URL="sqlite+aiosqlite:///x.db"))
+    assert unpooled["poolclass"] is InstrumentedNullPool
+    assert "pool_size" not in unpooled and "connect_args" not in unpooled
+
+
+def test_env_example_parses(monkeypatch):
+    """Test every value the example env file sets is valid for Settings"""
+    from pathlib import Path
+
+    example = Path(__file__).resolve().parents[2] / ".env.example"
+    for line in example.read_text().splitlines():
+        if line and not line.startswith("#"):
+            key, _, value = line.partition("=")
+            monkeypatch.setenv(key, value)
+    Settings(_env_file=None)
+
+
+def test_pool_sizes_split_the_connection_budget_across_workers():
+    """Test per-worker sizes stay within DATABASE_MAX_CONNECTIONS"""
+    assert pool_sizes(make_settings()) == (5, 10)
+    assert pool_sizes(make_settings(WEB_CONCURRENCY=4, DATABASE_MAX_CONNECTIONS=40)) == (5, 5)
+    assert pool_sizes(make_settings(WEB_CONCURRENCY=8, DATABASE_MAX_CONNECTIONS=20)) == (2, 0)
+
+
+@pytest.mark.asyncio
+async def test_checkouts_waits_and_timeouts_are_recorded(tmp_path):
+    """Test the instrumented pool counts checkouts, new connections and timeouts"""
+
+    class Pool(InstrumentedQueuePool):
+        metrics = PoolMetrics()
+
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path / 'pool.db'}",
+        poolclass=Pool, pool_size=1, max_overflow=0, pool_timeout=0.05,
+    )
+    async with engine.connect() as conn:
+        await conn.execute(text("select 1"))
+        with pytest.raises(exc.TimeoutError):
+            await engine.connect().start()
+    async with engine.connect() as conn:
+        await conn.execute(text("select 1"))
+
+    metrics = Pool.metrics
+    stats = metrics.stats(engine.pool)
+    assert (stats["checkouts"], stats["connects"], stats["timeouts"]) == (2, 1, 1)
+    assert stats["idle"] == 1 and stats["overflow"] == 0
+    rendered = metrics.render_prometheus(engine.pool)
+    assert "tokenholic_db_pool_wait_seconds_count" in rendered
+    assert 'tokenholic_db_pool_checked_out{worker="' in rendered
+    await engine.dispose()
@@ -0,0 +1,134 @@
+"""
+Tests for the embedding service and its on-disk vector cache
+"""
+
+import json
+
+import httpx
+import numpy as np
+import pytest
+
+from app.core.config import get_settings
+from app.core.embeddings import (
+    EmbeddingService,
+    EmbeddingStore,
+    decode_vector,
+    encode_vector,
+)
+from app.core.llm import LLMConfig
+from app.core.llm_cache import LLMResponseCache
+from app.core.llm_transport import LLMTransport
+
+DIM = 8
+
+
+def embedding_provider(requests: list):
+    """Mock provider returning a distinct vector per input text"""
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        payload = json.loads(request.content)
+        requests.append(payload)
+        data = [
+            {"index": i, "embedding": [float(len(text) + d) for d in range(payload["dimensions"])]}
+            for i, text in enumerate(payload["input"])
+        ]
+        return httpx.Response(200, json={"data": data, "usage": {"total_tokens": 7 * len(data)}})
+
+    return handler
+
+
+def make_service(tmp_path, requests: list, dtype: str = "float16") -> EmbeddingService:
+    config = LLMConfig()
+    config.providers["dashscope"]["api_key"] = "test-key"
+    transport = LLMTransport(config.providers, http_transport=httpx.MockTransport(embedding_provider(requests)))
+    return EmbeddingService(
+        transport, config.providers, dimensions=DIM, store=EmbeddingStore(tmp_path / "embeddings.db", dtype)
+    )
+
+
+@pytest.mark.parametrize("dtype, tolerance", [("float16", 1e-3), ("int8", 1e-2)])
+def test_compact_encodings_round_trip(dtype, tolerance):
+    """Test stored vectors decode close to the originals"""
+    vector = np.random.default_rng(0).standard_normal(64).astype(np.float32)
+    vector /= np.linalg.norm(vector)
+    scale, payload = encode_vector(vector, dtype)
+    assert len(payload) == 64 * (2 if dtype == "float16" else 1)
+    assert np.allclose(decode_vector(scale, payload, dtype), vector, atol=tolerance)
+
+
+@pytest.mark.asyncio
+async def test_batches_to_provider_limit_and_dedupes(tmp_path):
+    """Test texts are sent in provider-sized batches, each distinct text once"""
+    requests = []
+    service = make_service(tmp_path, requests)
+    texts = [f"chunk {i}" for i in range(23)] + ["chunk 0"]
+
+    vectors = await service.embed_many(texts)
+    await service.transport.close()
+
+    assert vectors.shape == (24, DIM)
+    assert [len(r["input"]) for r in requests] == [10, 10, 3]
+    assert requests[0]["model"] == "text-embedding-v3"
+    assert np.array_equal(vectors[0], vectors[-1])
+
+
+@pytest.mark.asyncio
+async def test_reingest_costs_no_api_calls(tmp_path):
+    """Test a second ingest of the same texts is served from disk, across restarts"""
+    requests = []
+    service = make_service(tmp_path, requests, dtype="int8")
+    first = await service.embed_many(["alpha", "beta"])
+    service.close()
+
+    restarted = make_service(tmp_path, requests, dtype="int8")
+    second = await restarted.embed_many(["beta", "alpha"])
+    await restarted.transport.close()
+
+    assert len(requests) == 1
+    assert restarted.stats()["cache_hits"] == 2
+    assert np.allclose(second, first[::-1], rtol=1e-2)
+
+
+@pytest.mark.asyncio
+async def test_store_queries_run_off_the_event_loop(tmp_path):
+    """Test cache lookups and writes happen on the store's own thread"""
+    import threading
+
+    threads = []
+
+    class RecordingStore(EmbeddingStore):
+        def get_many(self, keys):
+            threads.append(threading.current_thread().name)
+            return super().get_many(keys)
+
+        def put_many(self, items):
+            threads.append(threading.current_thread().name)
+            super().put_many(items)
+
+    requests = []
+    service = make_service(tmp_path, requests)
+    service.store = RecordingStore(tmp_path / "recorded.db")
+    await service.embed_many([f"chunk {i}" for i in range(12)])
+    await service.transport.close()
+    service.close()
+
+    assert len(threads) == 3
+    assert all(name.startswith("embedding-store") for name in threads)
+
+
+@pytest.mark.asyncio
+async def test_semantic_cache_survives_embedder_errors(cache, monkeypatch):
+    """Test a failing embedder degrades similarity lookups to misses"""
+
+    async def broken(text):
+        raise httpx.ConnectError("embedding endpoint down")
+
+    monkeypatch.setattr(get_settings(), "LLM_SEMANTIC_CACHE_ENABLED", True)
+    response_cache = LLMResponseCache(cache, broken)
+    messages = [{"role": "user", "content": "prompt"}]
+    await response_cache.remember_similar("qwen-max", "customer-1", messages, "hash", 60)
+    await cache.push_list(
+        response_cache._semantic_key("qwen-max", "customer-1", messages), [{"hash": "h", "vector": [1.0]}], 10
+    )
+
+    assert await response_cache.get_similar("qwen-max", "customer-1", messages) is None
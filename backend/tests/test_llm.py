@@ -0,0 +1,259 @@
+"""
+Tests for the LLM service
+"""
+
+import json
+
+import httpx
+import pytest
+
+from app.core.llm import (
+    ChunkType,
+    DashScopeClient,
+    LLMConfig,
+    LLMService,
+    ModelType,
+    TaskType,
+    parse_stream_event,
+)
+from app.core.llm_cache import LLMResponseCache, compute_prompt_hash
+from app.core.llm_transport import LLMTransport
+
+
+def test_parse_stream_event_separates_thinking():
+    """Test reasoning deltas are kept apart from answer deltas"""
+    event = {
+        "choices": [
+            {"delta": {"reasoning_content": "Let me think", "content": "Hello"}, "finish_reason": None}
+        ]
+    }
+    chunks = parse_stream_event(event, ModelType.QWEN_THINKING)
+    assert [c.type for c in chunks] == [ChunkType.THINKING, ChunkType.ANSWER]
+    assert chunks[0].content == "Let me think"
+    assert chunks[1].content == "Hello"
+
+
+def test_parse_stream_event_finish_reason():
+    """Test the final event carries the finish reason"""
+    event = {"choices": [{"delta": {}, "finish_reason": "stop"}]}
+    chunks = parse_stream_event(event, ModelType.QWEN_MAX)
+    assert len(chunks) == 1
+    assert chunks[0].finish_reason == "stop"
+
+
+@pytest.mark.asyncio
+async def test_stream_matches_generate_without_credentials():
+    """Test the offline stream reassembles to the placeholder response"""
+    service = LLMService()
+    messages = [{"role": "user", "content": "Describe Acme's AI stack"}]
+
+    expected = await service.generate_with_history(messages, task=TaskType.PERSONA)
+    chunks = [c async for c in service.stream_with_history(messages, task=TaskType.PERSONA)]
+
+    assert len(chunks) > 1
+    assert chunks[-1].finish_reason == "stop"
+    assert "".join(c.content for c in chunks).strip() == expected
+
+
+@pytest.mark.asyncio
+async def test_stream_over_pooled_transport():
+    """Test SSE streaming through the shared transport and its pool stats"""
+    events = [
+        {"choices": [{"delta": {"reasoning_content": "plan"}, "finish_reason": None}]},
+        {"choices": [{"delta": {"content": "Hi"}, "finish_reason": None}]},
+        {"choices": [{"delta": {}, "finish_reason": "stop"}]},
+    ]
+    body = "".join(f"data: {json.dumps(e)}\n\n" for e in events) + "data: [DONE]\n\n"
+    seen = {}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen["auth"] = request.headers.get("Authorization")
+        seen["payload"] = json.loads(request.content)
+        return httpx.Response(200, text=body, headers={"Content-Type": "text/event-stream"})
+
+    config = LLMConfig()
+    config.providers["dashscope"]["api_key"] = "test-key"
+    transport = LLMTransport(config.providers, http_transport=httpx.MockTransport(handler))
+    client = DashScopeClient(config, transport)
+
+    chunks = [c async for c in client.stream("hello", ModelType.QWEN_THINKING)]
+    await transport.close()
+
+    assert [(c.type, c.content) for c in chunks] == [
+        (ChunkType.THINKING, "plan"),
+        (ChunkType.ANSWER, "Hi"),
+        (ChunkType.ANSWER, ""),
+    ]
+    assert seen["auth"] == "Bearer test-key"
+    assert seen["payload"]["stream"] is True
+    assert seen["payload"]["enable_thinking"] is True
+
+    stats = transport.stats()["dashscope"]
+    assert stats["requests_total"] == 1
+    assert stats["in_flight"] == 0
+
+
+def test_prompt_hash_is_canonical():
+    """Test equivalent requests produce the same cache key"""
+    messages = [{"role": "user", "content": "hi", "name": "ignored"}]
+    a = compute_prompt_hash("qwen-max", 0.7, 8192, messages)
+    b = compute_prompt_hash("qwen-max", 0.70000001, 8192, [{"content": "hi", "role": "user"}])
+    assert a == b
+    assert a != compute_prompt_hash("qwen-plus", 0.7, 8192, messages)
+
+    service = LLMService()
+    assert service.prompt_hash(messages, ModelType.QWEN_MAX) == a
+
+
+@pytest.mark.asyncio
+async def test_generate_uses_response_cache(cache):
+    """Test cacheable tasks hit the provider once and PERSONA never caches"""
+    service = LLMService()
+    service.response_cache = LLMResponseCache(cache)
+    calls = []
+    original = service.dashscope_client.generate
+
+    async def counting_generate(*args, **kwargs):
+        calls.append(args)
+        return await original(*args, **kwargs)
+
+    service.dashscope_client.generate = counting_generate
+
+    first = await service.generate("Research Acme", task=TaskType.ANALYSIS)
+    second = await service.generate("Research Acme", task=TaskType.ANALYSIS)
+    assert first == second
+    assert len(calls) == 1
+
+    await service.generate("Hello", task=TaskType.PERSONA)
+    await service.generate("Hello", task=TaskType.PERSONA)
+    await service.generate("Research Acme", task=TaskType.ANALYSIS, use_cache=False)
+    assert len(calls) == 4
+
+
+@pytest.mark.asyncio
+async def test_semantic_cache_reuses_similar_prompt(cache, monkeypatch):
+    """Test near-identical research prompts in the same scope reuse an answer"""
+    from app.core.config import get_settings
+
+    monkeypatch.setattr(get_settings(), "LLM_SEMANTIC_CACHE_ENABLED", True)
+
+    async def embed(text: str):
+        return [1.0, 0.0] if "Acme" in text else [0.0, 1.0]
+
+    service = LLMService()
+    service.response_cache = LLMResponseCache(cache, embedder=embed)
+
+    first = await service.generate("Research Acme Corp", task=TaskType.RESEARCH, cache_scope="cust-1")
+    reused = await service.generate("Research Acme Corp.", task=TaskType.RESEARCH, cache_scope="cust-1")
+    other = await service.generate("Research Acme Corp.", task=TaskType.RESEARCH, cache_scope="cust-2")
+
+    persona = [
+        {"role": "system", "content": "You are a skeptical CTO."},
+        {"role": "user", "content": "Research Acme Corp."},
+    ]
+    in_persona = await service.generate_with_history(persona, task=TaskType.RESEARCH, cache_scope="cust-1")
+
+    assert reused == first
+    assert other != first
+    assert in_persona != first
+    assert service.response_cache.semantic_hits == 1
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_calls_are_coalesced():
+    """Test identical in-flight requests share one provider call across workers"""
+    import asyncio
+
+    from fakeredis import FakeAsyncRedis, FakeServer
+
+    from app.core.cache import CacheManager
+
+    server = FakeServer()
+    calls = []
+
+    async def slow_generate(prompt, model, **kwargs):
+        calls.append(prompt)
+        await asyncio.sleep(0.1)
+        return f"map for {prompt}"
+
+    workers = []
+    for _ in range(2):
+        manager = CacheManager()
+        manager._client = FakeAsyncRedis(server=server, decode_responses=True)
+        service = LLMService()
+        service.response_cache = LLMResponseCache(manager)
+        service.dashscope_client.generate = slow_generate
+        workers.append(service)
+
+    results = await asyncio.gather(
+        *(service.generate("Acme", task=TaskType.ANALYSIS) for service in workers for _ in range(3))
+    )
+
+    assert set(results) == {"map for Acme"}
+    assert len(calls) == 1
+    assert sum(service.in_flight.coalesced for service in workers) == 4
+    assert sum(service.response_cache.lease_waits for service in workers) == 1
+
+
+def test_router_demotes_erroring_model():
+    """Test a model with a high recent error rate is tried last"""
+    from app.core.model_router import ModelRouter
+
+    router = ModelRouter({"a": ["b", "c"]})
+    assert router.route("a") == ["a", "b", "c"]
+
+    for _ in range(5):
+        router.record("a", 0.1, False)
+        router.record("b", 2.0, True)
+    assert router.route("a") == ["b", "c", "a"]
+    assert router.route("a", latency_slo=1.0) == ["c", "a", "b"]
+    assert router.stats()["b"]["p95_latency"] == 2.0
+
+
+def test_router_prefers_cheaper_healthy_fallbacks():
+    """Test healthy fallbacks are ordered by recent cost, keeping the preferred model first"""
+    from app.core.model_router import ModelRouter
+
+    router = ModelRouter({"a": ["b", "c", "d"]})
+    for _ in range(5):
+        router.record("a", 0.1, True, cost=0.05)
+        router.record("b", 0.1, True, cost=0.02)
+        router.record("c", 0.1, True, cost=0.01)
+    assert router.route("a") == ["a", "c", "b", "d"]
+
+    for _ in range(10):
+        router.record("a", 0.1, False)
+    assert router.route("a") == ["c", "b", "d", "a"]
+
+
+def test_fallback_chains_come_from_settings():
+    """Test LLM_FALLBACK_CHAINS is parsed into model types"""
+    from app.core.llm import fallback_chains
+
+    assert fallback_chains()[ModelType.QWEN_TURBO] == [ModelType.GLM_4]
+    assert fallback_chains({"qwen-max": ["glm-4"]}) == {ModelType.QWEN_MAX: [ModelType.GLM_4]}
+    with pytest.raises(ValueError):
+        fallback_chains({"qwen-max": ["gpt-4"]})
+
+
+@pytest.mark.asyncio
+async def test_generate_fails_over_to_next_model():
+    """Test a provider error on the preferred model falls back along the chain"""
+    service = LLMService()
+    original = service.dashscope_client.generate
+
+    async def flaky_generate(prompt, model, **kwargs):
+        if model == ModelType.QWEN_MAX:
+            raise httpx.ConnectError("provider unreachable")
+        return await original(prompt, model, **kwargs)
+
+    service.dashscope_client.generate = flaky_generate
+
+    result = await service.generate("Analyse Acme", task=TaskType.ANALYSIS, use_cache=False)
+    assert ModelType.QWEN_PLUS.value in result
+    stats = service.routing_stats()
+    assert stats["failovers"] == 1
+    assert stats["models"]["qwen-max"]["error_rate"] == 1.0
+
+    with pytest.raises(httpx.ConnectError):
+        await service.generate("Analyse Acme", model=ModelType.QWEN_MAX, use_cache=False)
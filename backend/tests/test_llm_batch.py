@@ -0,0 +1,132 @@
+"""
+Tests for batch generation jobs
+"""
+
+import asyncio
+
+import pytest
+from redis.exceptions import RedisError
+
+from app.core.config import get_settings
+from app.core.llm import LLMService, TaskType
+from app.core.llm_batch import BatchRequest, LLMBatchRunner
+
+
+def make_service(cache) -> LLMService:
+    service = LLMService()
+    service.batch = LLMBatchRunner(service, cache)
+    return service
+
+
+@pytest.mark.asyncio
+async def test_batch_caps_concurrency_per_provider(cache, monkeypatch):
+    """Test a batch never exceeds the provider's concurrency cap"""
+    monkeypatch.setattr(get_settings(), "LLM_BATCH_CONCURRENCY", 2)
+    service = make_service(cache)
+    active = {"now": 0, "peak": 0}
+
+    async def slow_generate(prompt, model, **kwargs):
+        active["now"] += 1
+        active["peak"] = max(active["peak"], active["now"])
+        await asyncio.sleep(0.01)
+        active["now"] -= 1
+        return f"map for {prompt}"
+
+    service.dashscope_client.generate = slow_generate
+    requests = [BatchRequest(f"customer-{i}", prompt=f"c{i}", task=TaskType.ANALYSIS) for i in range(6)]
+    seen = []
+
+    async def on_result(result):
+        seen.append(result.id)
+
+    results = await service.generate_batch(requests, job_id="nightly", on_result=on_result)
+
+    assert active["peak"] == 2
+    assert sorted(seen) == sorted(r.id for r in requests)
+    assert results["customer-3"].content == "map for c3"
+    progress = await service.batch.progress("nightly")
+    assert progress == {"job_id": "nightly", "status": "completed", "total": 6, "completed": 6, "failed": 0}
+
+
+@pytest.mark.asyncio
+async def test_batch_resumes_without_redoing_finished_items(cache):
+    """Test a re-run only retries items that did not succeed"""
+    service = make_service(cache)
+    calls = []
+    broken = {"c1"}
+
+    async def flaky_generate(prompt, model, **kwargs):
+        calls.append(prompt)
+        if prompt in broken:
+            raise ValueError("bad response")
+        return prompt.upper()
+
+    service.dashscope_client.generate = flaky_generate
+    requests = [BatchRequest(f"item-{i}", prompt=f"c{i}", task=TaskType.ANALYSIS) for i in range(3)]
+
+    first = await service.generate_batch(requests, job_id="refresh")
+    assert not first["item-1"].succeeded
+    assert (await service.batch.progress("refresh"))["status"] == "incomplete"
+
+    broken.clear()
+    calls.clear()
+    second = await service.generate_batch(requests, job_id="refresh")
+    assert calls == ["c1"]
+    assert all(result.succeeded for result in second.values())
+    assert (await service.batch.progress("refresh"))["failed"] == 0
+
+
+@pytest.mark.asyncio
+async def test_batch_yields_budget_to_interactive_traffic(cache, monkeypatch):
+    """Test items wait while the rate-limit budget is inside the interactive reserve"""
+    monkeypatch.setattr(get_settings(), "LLM_BATCH_BACKOFF", 0.01)
+    service = make_service(cache)
+
+    async def low_budget(model, quota):
+        return {"requests": 1, "tokens": 10}
+
+    service.rate_limiter.remaining = low_budget
+    requests = [BatchRequest("only", prompt="hello", task=TaskType.ANALYSIS)]
+
+    results = await service.generate_batch(requests, job_id="starved", timeout=0.05)
+
+    assert results == {}
+    assert (await service.batch.progress("starved"))["status"] == "incomplete"
+
+
+@pytest.mark.asyncio
+async def test_batch_paces_items_when_the_budget_is_unreadable(cache, monkeypatch):
+    """Test a Redis error reading the budget delays items instead of failing them"""
+    monkeypatch.setattr(get_settings(), "LLM_BATCH_BACKOFF", 0.01)
+    service = make_service(cache)
+
+    async def redis_down(model, quota):
+        raise RedisError("connection refused")
+
+    service.rate_limiter.remaining = redis_down
+    requests = [BatchRequest(f"item-{i}", prompt=f"c{i}", task=TaskType.ANALYSIS) for i in range(2)]
+
+    results = await service.generate_batch(requests, job_id="paced")
+
+    assert all(result.succeeded for result in results.values())
+    assert (await service.batch.progress("paced"))["status"] == "completed"
+
+
+@pytest.mark.asyncio
+async def test_failing_item_callback_does_not_abort_the_batch(cache):
+    """Test an on_result error marks only its item failed and the rest finish"""
+    service = make_service(cache)
+    requests = [BatchRequest(f"item-{i}", prompt=f"c{i}", task=TaskType.ANALYSIS) for i in range(3)]
+    seen = []
+
+    async def on_result(result):
+        if result.id == "item-1":
+            raise IOError("disk full")
+        seen.append(result.id)
+
+    results = await service.generate_batch(requests, job_id="persist", on_result=on_result)
+
+    assert sorted(seen) == ["item-0", "item-2"]
+    assert results["item-1"].error == "OSError: disk full"
+    progress = await service.batch.progress("persist")
+    assert (progress["status"], progress["completed"], progress["failed"]) == ("incomplete", 2, 1)
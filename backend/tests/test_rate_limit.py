@@ -0,0 +1,37 @@
+"""
+Tests for LLM rate limiting
+"""
+
+import pytest
+
+from app.core.rate_limit import LLMRateLimiter, RateLimitExceeded
+
+
+@pytest.mark.asyncio
+async def test_request_quota_sheds_when_exhausted(cache):
+    """Test requests beyond the RPM budget are shed without waiting"""
+    limiter = LLMRateLimiter(cache)
+    quota = {"rpm": 2, "tpm": 10000}
+
+    await limiter.acquire("qwen-max", quota, tokens=10, max_wait=0)
+    await limiter.acquire("qwen-max", quota, tokens=10, max_wait=0)
+    with pytest.raises(RateLimitExceeded) as exc_info:
+        await limiter.acquire("qwen-max", quota, tokens=10, max_wait=0)
+
+    assert 0 < exc_info.value.retry_after <= 30
+    assert limiter.shed_total == 1
+
+
+@pytest.mark.asyncio
+async def test_token_quota_is_metered(cache):
+    """Test token costs drain the TPM bucket and remaining() reports it"""
+    limiter = LLMRateLimiter(cache)
+    quota = {"rpm": 100, "tpm": 1000}
+
+    await limiter.acquire("glm-4", quota, tokens=700, max_wait=0)
+    remaining = await limiter.remaining("glm-4", quota)
+    assert remaining["requests"] == 99
+    assert 300 <= remaining["tokens"] < 310
+
+    with pytest.raises(RateLimitExceeded):
+        await limiter.acquire("glm-4", quota, tokens=700, max_wait=0)
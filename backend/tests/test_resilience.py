@@ -0,0 +1,119 @@
+"""
+Tests for retries, deadlines and circuit breakers
+"""
+
+import asyncio
+
+import pytest
+
+from app.core.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    CircuitState,
+    DeadlineExceeded,
+    RetryPolicy,
+    deadline_scope,
+    remaining_time,
+    run_with_retries,
+)
+
+
+@pytest.mark.asyncio
+async def test_retries_only_retryable_errors():
+    """Test retryable errors are retried and others surface immediately"""
+    attempts = []
+
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise ConnectionError("reset")
+        return "ok"
+
+    policy = RetryPolicy(max_retries=3, retry_delay=0.001, timeout=1.0)
+    assert await run_with_retries(flaky, policy, lambda e: isinstance(e, ConnectionError)) == "ok"
+    assert len(attempts) == 3
+
+    async def broken():
+        attempts.append(1)
+        raise ValueError("bad request")
+
+    attempts.clear()
+    with pytest.raises(ValueError):
+        await run_with_retries(broken, policy, lambda e: isinstance(e, ConnectionError))
+    assert len(attempts) == 1
+
+
+@pytest.mark.asyncio
+async def test_attempt_timeout_is_capped_by_deadline():
+    """Test a hung call is cut off at the request deadline"""
+    async def hang():
+        await asyncio.sleep(10)
+
+    policy = RetryPolicy(max_retries=5, retry_delay=0.001, timeout=5.0)
+    with deadline_scope(0.05):
+        assert remaining_time() <= 0.05
+        with pytest.raises((asyncio.TimeoutError, DeadlineExceeded)):
+            await run_with_retries(hang, policy, lambda e: isinstance(e, asyncio.TimeoutError))
+    assert remaining_time() is None
+
+
+def test_circuit_breaker_opens_and_recovers():
+    """Test the circuit opens after repeated failures and half-opens later"""
+    breaker = CircuitBreaker("dashscope", failure_threshold=2, recovery_timeout=0.0)
+    breaker.before_call()
+    breaker.record_failure()
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == CircuitState.OPEN
+
+    # Recovery elapsed: one trial call is let through, a second is rejected
+    breaker.before_call()
+    assert breaker.state == CircuitState.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    breaker.record_success()
+    assert breaker.state == CircuitState.CLOSED
+
+
+def test_open_circuit_rejects_calls():
+    """Test calls fail fast while the circuit is open"""
+    breaker = CircuitBreaker("bailian", failure_threshold=1, recovery_timeout=60.0)
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError) as exc_info:
+        breaker.before_call()
+    assert exc_info.value.retry_after > 59
+    assert breaker.stats()["rejected"] == 1
+
+
+@pytest.mark.asyncio
+async def test_expired_deadline_creates_no_provider_call(recwarn):
+    """Test a request past its deadline fails without leaving an unawaited call behind"""
+    import gc
+
+    from app.core.llm import LLMService, ModelType
+
+    service = LLMService()
+    with deadline_scope(0.0):
+        with pytest.raises(DeadlineExceeded):
+            await service.generate("Hello", model=ModelType.QWEN_MAX, use_cache=False)
+    gc.collect()
+    assert not [w for w in recwarn if "never awaited" in str(w.message)]
+
+
+@pytest.mark.asyncio
+async def test_retries_past_deadline_never_call_fn(recwarn):
+    """Test run_with_retries raises before creating an attempt once the deadline is spent"""
+    import gc
+
+    calls = []
+
+    async def fn():
+        calls.append(1)
+
+    with deadline_scope(0.0):
+        with pytest.raises(DeadlineExceeded):
+            await run_with_retries(fn, RetryPolicy(), lambda exc: True)
+    gc.collect()
+    assert calls == []
+    assert not [w for w in recwarn if "never awaited" in str(w.message)]
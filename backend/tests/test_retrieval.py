@@ -0,0 +1,110 @@
+"""
+Tests for hybrid knowledge-base retrieval
+"""
+
+import hashlib
+
+import pytest
+
+faiss = pytest.importorskip("faiss")
+np = pytest.importorskip("numpy")
+
+from app.core.llm import LLMService  # noqa: E402
+from app.core.retrieval import HybridRetriever, parse_ranking, reciprocal_rank_fusion  # noqa: E402
+from app.core.vector_store import DocumentChunk, KnowledgeBase, lexical_terms  # noqa: E402
+
+DIM = 32
+
+
+async def fake_embed(texts):
+    vectors = np.zeros((len(texts), DIM), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for word in text.lower().split():
+            vectors[row, int(hashlib.md5(word.encode()).hexdigest(), 16) % DIM] += 1.0
+    return vectors
+
+
+class StubLLM:
+    """Answers every rerank request with a fixed reply"""
+
+    def __init__(self, reply: str):
+        self.reply = reply
+        self.prompts = []
+
+    async def generate(self, prompt, **kwargs):
+        self.prompts.append(prompt)
+        return self.reply
+
+
+async def make_kb(tmp_path, embed=fake_embed) -> KnowledgeBase:
+    kb = KnowledgeBase(tmp_path / "index", tmp_path / "kb", embed=embed, dim=DIM)
+    await kb.add_documents([
+        DocumentChunk(1, "products/pai.md", "PAI", "机器学习平台 for training models"),
+        DocumentChunk(2, "products/eas.md", "EAS", "Elastic inference serving for deployed models"),
+        DocumentChunk(3, "competitive/bedrock.md", "Bedrock", "Hosted foundation models on AWS"),
+    ])
+    return kb
+
+
+def test_bilingual_terms_and_fusion():
+    """Test mixed text is split into words and CJK bigrams, and ranks fuse"""
+    assert lexical_terms("PAI 机器学习 for GPUs") == ["pai", "机器", "器学", "学习", "gpus"]
+    fused = reciprocal_rank_fusion([[1, 2, 3], [3, 1]], k=60)
+    assert [item for item, _ in fused] == [1, 3, 2]
+    assert parse_ranking("Ranking: [3, 1, 3, 9]", 3) == [2, 0]
+    assert parse_ranking("no idea", 3) is None
+
+
+@pytest.mark.asyncio
+async def test_keyword_search_finds_chinese_text(tmp_path):
+    """Test BM25 matches Chinese queries against bigram-indexed chunks"""
+    kb = await make_kb(tmp_path)
+    hits = await kb.keyword_search("机器学习", k=2)
+    assert [hit.chunk.id for hit in hits] == [1]
+
+
+@pytest.mark.asyncio
+async def test_results_are_cached_per_index_version(tmp_path, cache):
+    """Test repeated queries hit the cache until the knowledge base changes"""
+    kb = await make_kb(tmp_path)
+    retriever = HybridRetriever(kb, LLMService(), cache)
+
+    first = await retriever.retrieve("inference serving", k=2)
+    again = await retriever.retrieve("  Inference   serving ", k=2)
+    assert first[0].chunk.id == 2
+    assert [hit.chunk.id for hit in again] == [hit.chunk.id for hit in first]
+    assert retriever.stats()["cache_hits"] == 1
+
+    await kb.add_documents([DocumentChunk(4, "products/eas.md", "EAS GPU", "inference serving on GPU")])
+    await kb.refresh(force=True)
+    await retriever.retrieve("inference serving", k=2)
+    assert retriever.stats()["cache_misses"] == 2
+
+
+@pytest.mark.asyncio
+async def test_rerank_reorders_fused_hits(tmp_path, cache):
+    """Test the cheap model's ranking wins and unranked hits keep fused order"""
+    kb = await make_kb(tmp_path)
+    llm = StubLLM("[3]")
+    retriever = HybridRetriever(kb, llm, cache)
+
+    fused = [hit.chunk.id for hit in await retriever._search("models", 3)]
+    hits = await retriever.retrieve("models", k=3, rerank=True)
+    assert len(llm.prompts) == 1
+    assert [hit.chunk.id for hit in hits] == [fused[2], fused[0], fused[1]]
+    assert retriever.stats()["reranks"] == 1
+
+
+@pytest.mark.asyncio
+async def test_embedder_failure_falls_back_to_keywords(tmp_path, cache):
+    """Test retrieval still answers from BM25 when embeddings are unavailable"""
+    kb = await make_kb(tmp_path)
+
+    async def broken(texts):
+        raise RuntimeError("embedding endpoint down")
+
+    kb.embed = broken
+    retriever = HybridRetriever(kb, StubLLM(""), cache)
+    hits = await retriever.retrieve("AWS foundation models", k=1)
+    assert hits[0].chunk.id == 3
+    assert retriever.stats()["vector_failures"] == 1
@@ -0,0 +1,90 @@
+"""
+Tests for role play transcript storage
+"""
+
+import pytest
+
+import app.models  # noqa: F401  (registers tables on Base)
+from app.core.config import get_settings
+from app.models import ScenarioType
+from app.services import RolePlayService, SessionNotFound
+
+settings = get_settings()
+
+
+@pytest.mark.asyncio
+async def test_turns_get_sequential_seqs_and_keyset_pages(db_session, cache):
+    """Test appends number turns in order and pages resume after the last seq seen"""
+    service = RolePlayService(db_session, cache)
+    session = await service.create_session(ScenarioType.DISCOVERY)
+
+    for number in range(1, 6):
+        turn = await service.append_turn(session.id, "user" if number % 2 else "assistant", f"Turn {number}")
+        assert turn.seq == number
+    await service.record_score(session.id, 2, {"rapport": 4})
+
+    first = await service.list_turns(session.id, limit=2)
+    second = await service.list_turns(session.id, after_seq=first[-1].seq, limit=2)
+    assert [t.seq for t in first] == [1, 2]
+    assert [t.seq for t in second] == [3, 4]
+    assert first[1].score == {"rapport": 4}
+    await db_session.refresh(session)
+    assert session.turn_count == 5
+
+
+@pytest.mark.asyncio
+async def test_recent_turns_come_from_the_cached_tail(db_session, cache):
+    """Test the tail is kept in Redis, capped, and served without reading turn rows"""
+    service = RolePlayService(db_session, cache)
+    session = await service.create_session(ScenarioType.OBJECTION)
+    await service.append_turn(session.id, "user", "Opening")
+
+    # The first read builds the tail; later appends extend it
+    assert [t["content"] for t in await service.recent_turns(session.id)] == ["Opening"]
+    for number in range(settings.ROLE_PLAY_TAIL_TURNS + 3):
+        await service.append_turn(session.id, "assistant", f"Reply {number}")
+
+    cached = await cache.get_list(service._tail_key(session.id))
+    assert len(cached) == settings.ROLE_PLAY_TAIL_TURNS
+    assert cached[-1]["seq"] == settings.ROLE_PLAY_TAIL_TURNS + 4
+
+    messages = await service.prompt_messages(session.id, limit=2)
+    assert messages == [
+        {"role": "assistant", "content": f"Reply {settings.ROLE_PLAY_TAIL_TURNS + 1}"},
+        {"role": "assistant", "content": f"Reply {settings.ROLE_PLAY_TAIL_TURNS + 2}"},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_stale_tail_is_rebuilt_and_missing_sessions_raise(db_session, cache):
+    """Test a tail that lags the turn count is rebuilt from the database"""
+    service = RolePlayService(db_session, cache)
+    session = await service.create_session(ScenarioType.TECHNICAL)
+    await service.append_turn(session.id, "user", "One")
+    await service.recent_turns(session.id)
+
+    # A write that never reached Redis leaves a gap at the end of the tail
+    cache_less = RolePlayService(db_session, cache.__class__())
+    await cache_less.append_turn(session.id, "assistant", "Two")
+    assert len(await cache.get_list(service._tail_key(session.id))) == 1
+
+    assert [t["seq"] for t in await service.recent_turns(session.id)] == [1, 2]
+    assert len(await cache.get_list(service._tail_key(session.id))) == 2
+
+    with pytest.raises(SessionNotFound):
+        await service.append_turn("missing", "user", "Hello")
+    with pytest.raises(SessionNotFound):
+        await service.recent_turns("missing")
+
+
+@pytest.mark.asyncio
+async def test_turn_count_has_a_server_default(db_session):
+    """Test rows inserted without turn_count start at zero, as in the migration"""
+    from sqlalchemy import text
+
+    await db_session.execute(text(
+        "INSERT INTO role_play_sessions (id, scenario, difficulty, final_score, started_at, created_at, updated_at) "
+        "VALUES ('raw-insert', 'DISCOVERY', 'MEDIUM', 0, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)"
+    ))
+    count = await db_session.scalar(text("SELECT turn_count FROM role_play_sessions WHERE id = 'raw-insert'"))
+    assert count == 0
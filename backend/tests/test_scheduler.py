@@ -0,0 +1,123 @@
+"""
+Tests for LLM request scheduling
+"""
+
+import asyncio
+
+import pytest
+
+from app.core.llm import LLMService, TaskType
+from app.core.scheduler import LLMScheduler, Priority, SchedulerQueueFull, scheduling_scope
+
+
+async def record_grants(scheduler: LLMScheduler, order: list, name: str, priority: Priority, tenant: str = "t"):
+    await scheduler.acquire(priority, tenant)
+    order.append((name, priority))
+
+
+async def drain(scheduler: LLMScheduler, order: list, expected: int, held: Priority) -> list:
+    """Release the held slot, then each granted one, until all waiters ran"""
+    released = 0
+    scheduler.release(held)
+    while len(order) < expected:
+        await asyncio.sleep(0)
+        scheduler.release(order[released][1])
+        released += 1
+    return [name for name, _ in order]
+
+
+@pytest.mark.asyncio
+async def test_interactive_jumps_ahead_of_bulk():
+    """Test a queued interactive call is served before earlier bulk calls"""
+    scheduler = LLMScheduler(max_concurrency=1)
+    await scheduler.acquire(Priority.BULK)
+    order = []
+    tasks = [asyncio.create_task(record_grants(scheduler, order, f"bulk-{i}", Priority.BULK)) for i in range(2)]
+    await asyncio.sleep(0)
+    tasks.append(asyncio.create_task(record_grants(scheduler, order, "persona", Priority.INTERACTIVE)))
+    await asyncio.sleep(0)
+
+    names = await drain(scheduler, order, 3, Priority.BULK)
+    await asyncio.gather(*tasks)
+    assert names == ["persona", "bulk-0", "bulk-1"]
+    assert scheduler.stats()["classes"]["interactive"]["admitted"] == 1
+
+
+@pytest.mark.asyncio
+async def test_tenants_share_a_class_fairly():
+    """Test a busy session cannot push a later session to the back of the queue"""
+    scheduler = LLMScheduler(max_concurrency=1)
+    await scheduler.acquire(Priority.STANDARD)
+    order = []
+    tasks = [
+        asyncio.create_task(record_grants(scheduler, order, f"a{i}", Priority.STANDARD, tenant="a"))
+        for i in range(3)
+    ]
+    await asyncio.sleep(0)
+    tasks.append(asyncio.create_task(record_grants(scheduler, order, "b0", Priority.STANDARD, tenant="b")))
+    await asyncio.sleep(0)
+
+    names = await drain(scheduler, order, 4, Priority.STANDARD)
+    await asyncio.gather(*tasks)
+    assert names.index("b0") <= 1
+
+
+@pytest.mark.asyncio
+async def test_admission_control_and_cancellation():
+    """Test full class queues reject and cancelled waiters give up their place"""
+    scheduler = LLMScheduler(max_concurrency=1, queue_limits={p: 1 for p in Priority})
+    await scheduler.acquire(Priority.BULK)
+    waiter = asyncio.create_task(scheduler.acquire(Priority.BULK))
+    await asyncio.sleep(0)
+
+    with pytest.raises(SchedulerQueueFull):
+        await scheduler.acquire(Priority.BULK)
+    assert scheduler.stats()["classes"]["bulk"]["rejected"] == 1
+
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    assert scheduler.queued == 0
+    scheduler.release(Priority.BULK)
+    assert scheduler.active == 0
+
+
+@pytest.mark.asyncio
+async def test_bulk_cannot_take_every_slot():
+    """Test interactive calls are admitted while bulk work saturates its share"""
+    scheduler = LLMScheduler(max_concurrency=4, low_priority_share=0.5)
+    order = []
+    bulk = [asyncio.create_task(record_grants(scheduler, order, f"bulk-{i}", Priority.BULK)) for i in range(4)]
+    await asyncio.sleep(0)
+    assert [name for name, _ in order] == ["bulk-0", "bulk-1"]
+    assert scheduler.queued == 2
+
+    assert await asyncio.wait_for(scheduler.acquire(Priority.INTERACTIVE), 1) == 0.0
+    stats = scheduler.stats()
+    assert stats["active"] == 3
+    assert stats["classes"]["bulk"]["active"] == 2
+
+    scheduler.release(Priority.BULK)
+    await asyncio.sleep(0)
+    assert len(order) == 3
+    for _ in range(3):
+        scheduler.release(Priority.BULK)
+        await asyncio.sleep(0)
+    await asyncio.gather(*bulk)
+    scheduler.release(Priority.INTERACTIVE)
+    assert scheduler.active == 0
+
+
+@pytest.mark.asyncio
+async def test_service_schedules_by_task_and_scope():
+    """Test calls take their task's class unless the context overrides it"""
+    service = LLMService()
+    assert service._priority(TaskType.PERSONA) == Priority.INTERACTIVE
+    assert service._priority(TaskType.RESEARCH) == Priority.BULK
+    with scheduling_scope(priority=Priority.BACKGROUND):
+        assert service._priority(TaskType.PERSONA) == Priority.BACKGROUND
+
+    await service.generate("Hello", task=TaskType.PERSONA)
+    stats = service.scheduler.stats()
+    assert stats["active"] == 0
+    assert stats["classes"]["interactive"]["admitted"] == 1
@@ -0,0 +1,88 @@
+"""
+Tests for solution version history
+"""
+
+import pytest
+from sqlalchemy import event, func, select
+
+import app.models  # noqa: F401  (registers tables on Base)
+from app.core.config import get_settings
+from app.models import SolutionVersion
+from app.services import SolutionNotFound, SolutionService
+from app.services.solution_service import apply_text_diff, diff_text
+from tests.conftest import test_engine
+
+settings = get_settings()
+
+BASE = "".join(f"Paragraph {n}: use PAI for training and EAS for serving.\n" for n in range(40))
+
+
+def test_text_diff_round_trips():
+    """Test line diffs rebuild the new text exactly, including a missing final newline"""
+    new = BASE.replace("Paragraph 3:", "Paragraph three:").replace("Paragraph 30:", "") + "Closing note"
+    ops = diff_text(BASE, new)
+    assert apply_text_diff(BASE, ops) == new
+    assert apply_text_diff("", diff_text("", "a\nb")) == "a\nb"
+    assert sum(len(op) for op in ops if isinstance(op, list)) < 5
+
+
+@pytest.mark.asyncio
+async def test_versions_are_deltas_between_snapshots(db_session):
+    """Test every version is rebuilt exactly while only every Nth is stored in full"""
+    service = SolutionService(db_session)
+    solution = await service.create_solution("Needs GPU training", BASE, products=["PAI"])
+    expected = {1: BASE}
+    for version in range(2, settings.SOLUTION_SNAPSHOT_INTERVAL + 4):
+        text = expected[version - 1].replace(f"Paragraph {version}:", f"Revised {version}:")
+        products = ["PAI", "EAS"] if version > 5 else ["PAI"]
+        await service.revise(solution.id, note=f"round {version}", recommendation=text, products=products)
+        expected[version] = text
+
+    latest = await service.get_solution(solution.id)
+    assert latest.version == settings.SOLUTION_SNAPSHOT_INTERVAL + 3
+    for version, text in expected.items():
+        content = await service.get_version(solution.id, version)
+        assert content["recommendation"] == text
+        assert content["products"] == (["PAI", "EAS"] if version > 5 else ["PAI"])
+        assert content["requirements"] == "Needs GPU training"
+
+    snapshots = (await db_session.execute(
+        select(SolutionVersion.version).where(SolutionVersion.is_snapshot.is_(True)).order_by(SolutionVersion.version)
+    )).scalars().all()
+    assert snapshots == [1, settings.SOLUTION_SNAPSHOT_INTERVAL + 1]
+    delta_size = (await db_session.execute(
+        select(func.max(func.length(SolutionVersion.data))).where(SolutionVersion.is_snapshot.is_(False))
+    )).scalar_one()
+    assert delta_size < len(BASE) / 4
+
+
+@pytest.mark.asyncio
+async def test_history_pages_and_bounded_reads(db_session):
+    """Test history lists without content and old versions replay at most one snapshot interval"""
+    service = SolutionService(db_session)
+    solution = await service.create_solution("req", BASE)
+    for version in range(2, 2 * settings.SOLUTION_SNAPSHOT_INTERVAL + 1):
+        await service.revise(solution.id, recommendation=BASE + f"Update {version}\n")
+
+    page = await service.list_versions(solution.id, limit=3)
+    assert [entry["version"] for entry in page] == [20, 19, 18]
+    assert "data" not in page[0]
+    older = await service.list_versions(solution.id, before_version=page[-1]["version"], limit=3)
+    assert [entry["version"] for entry in older] == [17, 16, 15]
+
+    rows = []
+    listener = lambda conn, cursor, statement, *args: rows.append(statement)  # noqa: E731
+    event.listen(test_engine.sync_engine, "before_cursor_execute", listener)
+    try:
+        content = await service.get_version(solution.id, 2 * settings.SOLUTION_SNAPSHOT_INTERVAL)
+    finally:
+        event.remove(test_engine.sync_engine, "before_cursor_execute", listener)
+    assert content["recommendation"].endswith(f"Update {2 * settings.SOLUTION_SNAPSHOT_INTERVAL}\n")
+    assert len(rows) == 1
+
+    with pytest.raises(SolutionNotFound):
+        await service.get_version(solution.id, 99)
+    with pytest.raises(SolutionNotFound):
+        await service.revise("missing", recommendation="x")
+    with pytest.raises(ValueError):
+        await service.revise(solution.id, version=3)
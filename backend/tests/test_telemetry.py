@@ -0,0 +1,208 @@
+"""
+Tests for LLM usage telemetry
+"""
+
+import json
+from collections import deque
+
+import httpx
+import pytest
+from redis.exceptions import RedisError
+
+from app.core.cache import CacheManager
+from app.core.llm import LLMConfig, LLMService, ModelType, TaskType
+from app.core.llm_cache import LLMResponseCache
+from app.core.llm_transport import LLMTransport
+from app.core.telemetry import (
+    CacheOutcome,
+    LLMCallRecord,
+    LLMTelemetry,
+    summarize_usage,
+    usage_scope,
+)
+
+
+@pytest.mark.asyncio
+async def test_generate_records_usage_and_cache_outcome(cache):
+    """Test each call is accounted with tokens, cost and its cache outcome"""
+    service = LLMService()
+    service.response_cache = LLMResponseCache(cache)
+    service.telemetry = LLMTelemetry(cache)
+
+    with usage_scope() as records:
+        await service.generate("Analyse Acme", task=TaskType.ANALYSIS)
+        await service.generate("Analyse Acme", task=TaskType.ANALYSIS)
+
+    assert [r.cache for r in records] == [CacheOutcome.MISS, CacheOutcome.HIT]
+    miss, hit = records
+    assert miss.model == ModelType.QWEN_MAX.value
+    assert miss.task == TaskType.ANALYSIS.value
+    assert miss.prompt_tokens > 0 and miss.completion_tokens > 0
+    assert miss.cost > 0
+    assert hit.total_tokens == 0 and hit.cost == 0
+
+    usage = summarize_usage(records)
+    assert usage["calls"] == 2
+    assert usage["cache_hits"] == 1
+    assert usage["models"]["qwen-max"]["prompt_tokens"] == miss.prompt_tokens
+
+    snapshot = service.telemetry.snapshot()["models"]["qwen-max"]["analysis"]
+    assert snapshot["calls"] == 2
+    assert snapshot["cache_hits"] == 1
+
+
+def test_render_prometheus():
+    """Test counters and histograms use the Prometheus text format"""
+    telemetry = LLMTelemetry(CacheManager())
+    telemetry.record(LLMCallRecord(
+        "qwen-max", "query", CacheOutcome.MISS,
+        prompt_tokens=100, completion_tokens=50, cost=0.01, ttft=0.3, total_time=0.7,
+    ))
+    telemetry.record(LLMCallRecord("qwen-max", "query", CacheOutcome.MISS, success=False, total_time=5.0))
+
+    text = telemetry.render_prometheus()
+    assert 'tokenholic_llm_calls_total{model="qwen-max",task="query",cache="miss",status="ok"} 1' in text
+    assert 'tokenholic_llm_calls_total{model="qwen-max",task="query",cache="miss",status="error"} 1' in text
+    assert 'tokenholic_llm_prompt_tokens_total{model="qwen-max",task="query"} 100' in text
+    # Only the successful call lands in the latency histogram
+    assert 'tokenholic_llm_latency_seconds_bucket{model="qwen-max",task="query",le="0.5"} 0' in text
+    assert 'tokenholic_llm_latency_seconds_bucket{model="qwen-max",task="query",le="1"} 1' in text
+    assert 'tokenholic_llm_latency_seconds_count{model="qwen-max",task="query"} 1' in text
+
+
+@pytest.mark.asyncio
+async def test_flush_rolls_up_to_redis(cache):
+    """Test pending records are written as daily rollups and recent calls"""
+    telemetry = LLMTelemetry(cache)
+    for cache_outcome in (CacheOutcome.MISS, CacheOutcome.HIT, CacheOutcome.MISS):
+        tokens = 0 if cache_outcome == CacheOutcome.HIT else 10
+        telemetry.record(LLMCallRecord(
+            "qwen-plus", "retrieval", cache_outcome,
+            prompt_tokens=tokens, completion_tokens=tokens, cost=0.5 if tokens else 0.0,
+        ))
+
+    await telemetry.stop()
+
+    usage = (await telemetry.daily_usage())["qwen-plus|retrieval"]
+    assert usage["calls"] == 3
+    assert usage["cache_hits"] == 1
+    assert usage["prompt_tokens"] == 20
+    assert usage["cost"] == pytest.approx(1.0)
+    assert await cache.client.llen("telemetry:llm:recent") == 3
+    assert telemetry.snapshot()["pending"] == 0
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_drops_oldest_records_first(cache, monkeypatch):
+    """Test a failed flush keeps the newest records and counts what it drops"""
+    telemetry = LLMTelemetry(cache)
+    telemetry._pending = deque(maxlen=4)
+
+    def record(tokens: int) -> None:
+        telemetry.record(LLMCallRecord("qwen-plus", "query", CacheOutcome.MISS, prompt_tokens=tokens))
+
+    for tokens in range(4):
+        record(tokens)
+
+    class FailingPipeline:
+        """Records two more calls while the write is in flight, then fails"""
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):
+            return False
+
+        def __getattr__(self, name):
+            return lambda *args, **kwargs: None
+
+        async def execute(self):
+            record(4)
+            record(5)
+            raise RedisError("connection reset")
+
+    monkeypatch.setattr(cache.client, "pipeline", lambda **kwargs: FailingPipeline())
+    assert await telemetry.flush() == 0
+    assert [r.prompt_tokens for r in telemetry._pending] == [2, 3, 4, 5]
+
+    record(6)
+    snapshot = telemetry.snapshot()
+    assert snapshot["dropped"] == 3
+    assert snapshot["flush_errors"] == 1
+    assert [r.prompt_tokens for r in telemetry._pending] == [3, 4, 5, 6]
+
+
+@pytest.mark.asyncio
+async def test_stream_prefers_provider_usage():
+    """Test streamed calls record the provider's token counts and TTFT"""
+    events = [
+        {"choices": [{"delta": {"content": "Hi"}, "finish_reason": None}]},
+        {"choices": [{"delta": {}, "finish_reason": "stop"}]},
+        {"choices": [], "usage": {"prompt_tokens": 12, "completion_tokens": 3, "total_tokens": 15}},
+    ]
+    body = "".join(f"data: {json.dumps(e)}\n\n" for e in events) + "data: [DONE]\n\n"
+    seen = {}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen["payload"] = json.loads(request.content)
+        return httpx.Response(200, text=body, headers={"Content-Type": "text/event-stream"})
+
+    service = LLMService()
+    service.config = LLMConfig()
+    service.config.providers["dashscope"]["api_key"] = "test-key"
+    service.transport = LLMTransport(service.config.providers, http_transport=httpx.MockTransport(handler))
+    service.dashscope_client.config = service.config
+    service.dashscope_client.transport = service.transport
+    service.telemetry = LLMTelemetry(CacheManager())
+
+    with usage_scope() as records:
+        chunks = [c async for c in service.stream("hello", model=ModelType.QWEN_MAX)]
+    await service.transport.close()
+
+    assert [c.content for c in chunks] == ["Hi", ""]
+    assert seen["payload"]["stream_options"] == {"include_usage": True}
+    (record,) = records
+    assert record.cache == CacheOutcome.BYPASS
+    assert (record.prompt_tokens, record.completion_tokens) == (12, 3)
+    assert record.estimated is False
+    assert 0 < record.ttft <= record.total_time
+
+
+@pytest.mark.asyncio
+async def test_streamed_response_usage_is_logged_when_the_body_ends(client, caplog):
+    """Test calls made while a response streams are counted once it finishes"""
+    from fastapi.responses import JSONResponse, StreamingResponse
+
+    from app.core.llm import llm_service
+    from app.main import app
+
+    def call() -> None:
+        llm_service.telemetry.record(LLMCallRecord(
+            "qwen-max", "query", CacheOutcome.MISS, prompt_tokens=10, completion_tokens=5, cost=0.01,
+        ))
+
+    async def plain():
+        call()
+        return JSONResponse({"ok": True})
+
+    async def streamed():
+        async def body():
+            for part in ("a", "b"):
+                call()
+                yield part
+        return StreamingResponse(body(), media_type="text/event-stream")
+
+    app.add_api_route("/test-usage/plain", plain)
+    app.add_api_route("/test-usage/streamed", streamed)
+    try:
+        response = await client.get("/test-usage/plain")
+        assert response.headers["X-LLM-Calls"] == "1"
+        assert response.headers["X-LLM-Tokens"] == "15"
+
+        with caplog.at_level("INFO", logger="app.main"):
+            response = await client.get("/test-usage/streamed")
+        assert response.text == "ab"
+        assert "X-LLM-Calls" not in response.headers
+        assert "calls=2 tokens=30 cost=0.020000" in caplog.text
+    finally:
+        app.router.routes[-2:] = []
@@ -0,0 +1,133 @@
+"""
+Tests for token map portfolio analytics
+"""
+
+import uuid
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+
+import app.models  # noqa: F401  (registers tables on Base)
+from app.models import Customer, TokenMap
+from app.services.token_map_analytics import TokenMapAnalytics
+
+
+def use_case(name: str, provider: str, tokens: float):
+    return {"name": name, "model": "qwen-max", "tokens": tokens, "provider": provider}
+
+
+async def seed(db):
+    maps = {
+        "Acme": (
+            [{"provider": "alibaba", "tokens": 3.0}, {"provider": "volcano", "tokens": 1.0}],
+            {"external": [{"category": "Support", "use_cases": [
+                use_case("Customer service bot", "alibaba", 2.0), use_case("Video generation", "volcano", 1.0),
+            ]}]},
+            {"tech_stack": ["k8s"], "company_news": []},
+        ),
+        "Globex": (
+            [{"provider": "volcano", "tokens": 5.0}],
+            {"external": [{"category": "Marketing", "use_cases": [use_case("Customer service bot", "volcano", 4.0)]}],
+             "internal": [{"category": "IT", "use_cases": [use_case("Code assistant", "volcano", 1.0)]}]},
+            {"company_news": ["funding"]},
+        ),
+        "Initech": ([], {}, None),
+    }
+    for name, (providers, layers, research) in maps.items():
+        customer = Customer(id=str(uuid.uuid4()), name=name)
+        db.add(customer)
+        db.add(TokenMap(
+            id=str(uuid.uuid4()), customer_id=customer.id, customer_name=name,
+            providers=providers, layers=layers, research_data=research,
+        ))
+    await db.commit()
+
+
+@pytest.mark.asyncio
+async def test_provider_lookups_run_in_sql(db_session):
+    """Test provider filters and per-provider totals across customers"""
+    await seed(db_session)
+    analytics = TokenMapAnalytics(db_session)
+
+    assert [row["customer_name"] for row in await analytics.customers_using_provider("alibaba")] == ["Acme"]
+    assert len(await analytics.customers_using_provider("volcano")) == 2
+    assert await analytics.customers_using_provider("baidu") == []
+
+    breakdown = await analytics.provider_breakdown()
+    assert [(row["provider"], row["customers"], row["tokens"]) for row in breakdown] == [
+        ("volcano", 2, 6.0), ("alibaba", 1, 3.0),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_use_cases_and_research_filters(db_session):
+    """Test use cases aggregate within one layer and research lookups skip the blob"""
+    await seed(db_session)
+    analytics = TokenMapAnalytics(db_session)
+
+    top = await analytics.top_use_cases("external")
+    assert top[0] == {"name": "Customer service bot", "customers": 2, "tokens": 6.0}
+    assert [row["name"] for row in top] == ["Customer service bot", "Video generation"]
+    assert [row["name"] for row in await analytics.top_use_cases("internal")] == ["Code assistant"]
+    assert [row["name"] for row in await analytics.top_use_cases("external", provider="alibaba")] == [
+        "Customer service bot"
+    ]
+
+    rows = await analytics.maps_with_research("tech_stack")
+    assert [row["customer_name"] for row in rows] == ["Acme"]
+    assert "research_data" not in rows[0]
+    assert len(await analytics.maps_with_research("company_news")) == 2
+
+
+def test_postgres_filters_use_indexable_operators():
+    """Test the Postgres filters compile to JSONB containment and key-existence operators"""
+
+    class PostgresAnalytics(TokenMapAnalytics):
+        _postgres = True
+
+    analytics = PostgresAnalytics(None)
+    sql = str(select(TokenMap.id).where(analytics._uses_provider("alibaba")).compile(dialect=postgresql.dialect()))
+    assert "token_maps.providers @>" in sql
+    elements = analytics._elements(TokenMap.layers, "external")
+    assert "jsonb_array_elements(token_maps.layers ->" in str(
+        select(elements.c.value).compile(dialect=postgresql.dialect())
+    )
+
+
+@pytest.mark.asyncio
+async def test_provider_use_cases_prefilter_with_layers_index():
+    """Test provider-filtered use cases add a containment test the layers GIN index can serve"""
+    statements = []
+
+    class Capture:
+        async def execute(self, statement):
+            statements.append(statement)
+            return type("Result", (), {"mappings": lambda self: []})()
+
+    class PostgresAnalytics(TokenMapAnalytics):
+        _postgres = True
+
+    await PostgresAnalytics(Capture()).top_use_cases("external", provider="alibaba")
+    compiled = statements[0].compile(dialect=postgresql.dialect())
+    assert "token_maps.layers @>" in str(compiled)
+    assert {"external": [{"use_cases": [{"provider": "alibaba"}]}]} in compiled.params.values()
+
+
+@pytest.mark.asyncio
+async def test_keys_with_quotes_are_looked_up_literally(db_session):
+    """Test layer and research keys are bound parameters, not JSON path text, on SQLite"""
+    customer = Customer(id=str(uuid.uuid4()), name="Quoted")
+    db_session.add(customer)
+    db_session.add(TokenMap(
+        id=str(uuid.uuid4()), customer_id=customer.id, customer_name="Quoted", providers=[],
+        layers={'partner "beta"': [{"category": "Pilot", "use_cases": [use_case("Agent", "alibaba", 1.0)]}]},
+        research_data={'news" OR 1=1': []},
+    ))
+    await db_session.commit()
+    analytics = TokenMapAnalytics(db_session)
+
+    assert [row["name"] for row in await analytics.top_use_cases('partner "beta"')] == ["Agent"]
+    assert await analytics.top_use_cases("partner") == []
+    assert len(await analytics.maps_with_research('news" OR 1=1')) == 1
+    assert await analytics.maps_with_research("news") == []
@@ -0,0 +1,112 @@
+"""
+Tests for offline token counting
+"""
+
+import timeit
+
+import httpx
+import pytest
+
+from app.core.llm import LLMService, ModelType, TaskType
+from app.core.tokenizer import (
+    MESSAGE_OVERHEAD_TOKENS,
+    PromptTooLarge,
+    count_message_tokens,
+    count_tokens,
+    fit_messages,
+    get_tokenizer,
+)
+
+
+def test_count_tokens_by_script():
+    """Test CJK, Latin and digits are weighted per tokenizer family"""
+    assert count_tokens("") == 0
+    assert count_tokens("hello world") == 3
+    assert count_tokens("阿里云通义千问") == 6
+    # Qwen splits numbers into single digits, GLM groups them
+    assert count_tokens("123456", "qwen") > count_tokens("123456", "glm")
+    messages = [{"role": "user", "content": "hello world"}]
+    assert count_message_tokens(messages) == 3 + MESSAGE_OVERHEAD_TOKENS
+
+
+def test_count_tokens_is_fast():
+    """Test counting a typical prompt stays in the microsecond range"""
+    tokenizer = get_tokenizer("qwen")
+    text = "分析阿里云客户的 token 使用情况 and model mix for 2025. " * 20
+    per_call = timeit.timeit(lambda: tokenizer._count(text), number=200) / 200
+    assert per_call < 0.001
+
+
+def test_truncate_and_chunk_respect_budget():
+    """Test truncation and chunking never exceed the token budget"""
+    tokenizer = get_tokenizer("qwen")
+    text = "\n\n".join(f"Paragraph {i} " + "word " * 30 for i in range(10))
+    assert tokenizer.count(tokenizer.truncate(text, 50)) <= 50
+
+    chunks = tokenizer.chunk(text, 100)
+    assert len(chunks) > 1
+    assert all(tokenizer.count(chunk) <= 100 for chunk in chunks)
+    assert "".join(chunks).replace("\n", "") == text.replace("\n", "")
+
+
+def test_fit_messages_drops_oldest_turns_first():
+    """Test system prompt and latest message survive trimming"""
+    tokenizer = get_tokenizer("qwen")
+    messages = [{"role": "system", "content": "You are a sales assistant"}]
+    messages += [{"role": "user", "content": f"turn {i} " + "x" * 200} for i in range(10)]
+
+    short = messages[:2]
+    assert fit_messages(short, 10_000, tokenizer) is short
+    fitted = fit_messages(messages, 200, tokenizer)
+    assert fitted[0] == messages[0]
+    assert fitted[-1] == messages[-1]
+    assert len(fitted) < len(messages)
+    assert tokenizer.count_messages(fitted) <= 200
+
+    with pytest.raises(PromptTooLarge):
+        fit_messages(messages, 5, tokenizer)
+
+
+@pytest.mark.asyncio
+async def test_generate_trims_oversized_prompt():
+    """Test oversized prompts are truncated to the model's context window"""
+    service = LLMService()
+    seen = []
+
+    async def capture(prompt, model, **kwargs):
+        seen.append(prompt)
+        return "ok"
+
+    service.dashscope_client.generate = capture
+    window = service.config.get_model_config(ModelType.QWEN_MAX)["context_window"]
+    prompt = "客户" * window
+
+    await service.generate(prompt, model=ModelType.QWEN_MAX, use_cache=False)
+    assert len(seen[0]) < len(prompt)
+    assert count_tokens(seen[0]) <= window
+
+
+@pytest.mark.asyncio
+async def test_each_candidate_gets_its_own_window():
+    """Test a long-context model is not cut to a smaller fallback's window"""
+    service = LLMService()
+    preferred = service.config.get_model_for_task(TaskType.RESEARCH)
+    candidates = service._candidates(TaskType.RESEARCH, None)
+    windows = {m: service.config.get_model_config(m)["context_window"] for m in candidates}
+    assert min(windows.values()) < windows[preferred]
+    seen = {}
+
+    async def capture(prompt, model, **kwargs):
+        seen[model] = prompt
+        if model == preferred:
+            raise httpx.ConnectError("down")
+        return "ok"
+
+    service.dashscope_client.generate = capture
+    service.bailian_client.generate = capture
+    prompt = "客户 " * (min(windows.values()) + 1000)
+
+    await service.generate(prompt, task=TaskType.RESEARCH, use_cache=False)
+    assert seen[preferred] == prompt
+    smaller = [m for m in seen if windows[m] < count_tokens(prompt)]
+    assert smaller and all(len(seen[m]) < len(prompt) for m in smaller)
@@ -0,0 +1,198 @@
+"""
+Tests for the knowledge-base vector store
+"""
+
+import hashlib
+
+import pytest
+
+faiss = pytest.importorskip("faiss")
+np = pytest.importorskip("numpy")
+
+from app.core.config import get_settings  # noqa: E402
+from app.core.vector_store import (  # noqa: E402
+    AppendLog,
+    DocumentChunk,
+    KnowledgeBase,
+    VectorIndex,
+    choose_factory,
+    split_markdown,
+)
+
+DIM = 32
+
+
+async def fake_embed(texts):
+    """Bag-of-words hashing embedder: shared words mean similar vectors"""
+    vectors = np.zeros((len(texts), DIM), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for word in text.lower().split():
+            vectors[row, int(hashlib.md5(word.encode()).hexdigest(), 16) % DIM] += 1.0
+    return vectors
+
+
+def write_tree(root):
+    (root / "products").mkdir(parents=True)
+    (root / "products" / "pai.md").write_text(
+        "# PAI\nMachine learning platform for training models\n\n"
+        "## EAS\nElastic inference serving for deployed models\n",
+        encoding="utf-8",
+    )
+    (root / "competitive").mkdir()
+    (root / "competitive" / "azure_openai.md").write_text(
+        "# Azure OpenAI\nHosted GPT models on Azure\n", encoding="utf-8"
+    )
+
+
+def test_split_markdown_tracks_heading_path():
+    """Test chunks carry their heading path and stable ids"""
+    chunks = split_markdown("# PAI\nintro\n## EAS\nserving\n### GPU\ncards\n", "products/pai.md")
+    assert [c.title for c in chunks] == ["PAI", "PAI > EAS", "PAI > EAS > GPU"]
+    again = split_markdown("# PAI\nintro\n", "products/pai.md")
+    assert again[0].id == chunks[0].id
+
+
+def test_choose_factory_by_corpus_size():
+    """Test small corpora use exact search and large ones IVF"""
+    assert choose_factory(500) == "IDMap2,Flat"
+    assert choose_factory(1_000_000) == "IVF4096,Flat"
+
+
+@pytest.mark.asyncio
+async def test_build_and_search_from_markdown_tree(tmp_path):
+    """Test the markdown tree is indexed and searchable by meaning"""
+    write_tree(tmp_path / "kb")
+    kb = KnowledgeBase(tmp_path / "index", tmp_path / "kb", embed=fake_embed, dim=DIM)
+
+    assert await kb.build_from_directory() == 3
+    hits = await kb.search("inference serving for deployed models", k=1)
+    assert hits[0].chunk.title == "PAI > EAS"
+    assert hits[0].chunk.source == "products/pai.md"
+    assert kb.stats()["chunks"] == 3
+
+
+@pytest.mark.asyncio
+async def test_incremental_adds_survive_restart_and_compaction(tmp_path):
+    """Test appended and deleted documents replay from the log and fold into the index"""
+    write_tree(tmp_path / "kb")
+    kb = KnowledgeBase(tmp_path / "index", tmp_path / "kb", embed=fake_embed, dim=DIM)
+    await kb.build_from_directory()
+    generation = kb.index.stats()["generation"]
+
+    new = DocumentChunk(42, "products/dashscope.md", "DashScope", "Model API for Qwen text generation")
+    await kb.add_documents([new])
+    removed = (await kb.search("Hosted GPT models on Azure", k=1))[0].chunk.id
+    await kb.delete_documents([removed])
+    assert kb.index.pending == 2
+
+    # A fresh worker maps the same files and replays the log
+    restarted = KnowledgeBase(tmp_path / "index", tmp_path / "kb", embed=fake_embed, dim=DIM)
+    hits = await restarted.search("Qwen text generation API", k=3)
+    assert hits[0].chunk.id == 42
+    assert removed not in [h.chunk.id for h in hits]
+
+    await restarted.compact()
+    stats = restarted.index.stats()
+    assert stats["generation"] == generation + 1
+    assert stats["pending"] == 0 and stats["log_bytes"] == 0
+    assert stats["vectors"] == 3
+    assert (await restarted.search("Qwen text generation API", k=1))[0].chunk.id == 42
+
+
+@pytest.mark.asyncio
+async def test_compaction_builds_a_new_index_and_yields_to_other_workers(tmp_path):
+    """Test compaction never touches the index being searched and skips when another worker holds the lock"""
+    write_tree(tmp_path / "kb")
+    kb = KnowledgeBase(tmp_path / "index", tmp_path / "kb", embed=fake_embed, dim=DIM)
+    await kb.build_from_directory()
+    await kb.add_documents([DocumentChunk(42, "products/dashscope.md", "DashScope", "Model API for Qwen")])
+    serving = kb.index
+
+    # Another worker is compacting: automatic compaction backs off
+    with VectorIndex(tmp_path / "index", DIM).compaction_lock():
+        await kb.compact(min_pending=1)
+    assert kb.index is serving and serving.pending == 1
+
+    await kb.compact()
+    assert kb.index is not serving
+    assert serving.pending == 1
+    assert kb.index.pending == 0
+    assert (await kb.search("Model API for Qwen", k=1))[0].chunk.id == 42
+
+
+@pytest.mark.asyncio
+async def test_refresh_opens_new_generations_off_the_event_loop(tmp_path, monkeypatch):
+    """Test a generation compacted by another worker is opened in a thread and swapped in"""
+    import threading
+
+    write_tree(tmp_path / "kb")
+    serving = KnowledgeBase(tmp_path / "index", tmp_path / "kb", embed=fake_embed, dim=DIM)
+    await serving.build_from_directory()
+    other = KnowledgeBase(tmp_path / "index", tmp_path / "kb", embed=fake_embed, dim=DIM)
+    await other.add_documents([DocumentChunk(42, "products/dashscope.md", "DashScope", "Model API for Qwen")])
+    await other.compact()
+
+    opened_on_loop = []
+    original_open = VectorIndex.open
+
+    def recording_open(self):
+        opened_on_loop.append(threading.current_thread() is threading.main_thread())
+        original_open(self)
+
+    monkeypatch.setattr(VectorIndex, "open", recording_open)
+    before = serving.index
+    await serving.refresh(force=True)
+
+    assert opened_on_loop == [False]
+    assert serving.index is not before
+    assert (await serving.search("Model API for Qwen", k=1))[0].chunk.id == 42
+
+
+def test_append_cuts_off_a_torn_tail(tmp_path):
+    """Test records appended after a crash mid-write replay at the right boundaries"""
+    log = AppendLog(tmp_path / "append.log", DIM)
+    log.append(deletes=[1])
+    with open(log.path, "ab") as handle:
+        handle.write(b"\x01\x02\x03\x04")
+    assert [record[1] for record in log.replay()[0]] == [1]
+
+    log.append(deletes=[2])
+    assert [(op, vector_id) for op, vector_id, _ in log.replay()[0]] == [(0, 1), (0, 2)]
+
+
+def test_reader_reopens_after_the_log_is_rotated(tmp_path):
+    """Test a reader holding an offset into a rotated log replays the new file from the start"""
+    writer = VectorIndex(tmp_path, DIM)
+    writer.open()
+    writer.delete([5])
+    reader = VectorIndex(tmp_path, DIM)
+    reader.open()
+
+    # Compaction rotates the log; the next record is longer than the old offset
+    writer.log.rotate(writer.log.size())
+    writer.add(np.array([200], dtype=np.int64), np.ones((1, DIM), dtype=np.float32))
+
+    reader.refresh(force=True)
+    assert reader.stats()["pending"] == 1
+    assert reader.search(np.ones(DIM, dtype=np.float32), k=1)[0][0] == 200
+
+
+def test_ivf_index_is_memory_mapped(tmp_path, monkeypatch):
+    """Test large indexes are written as IVF and served from a read-only mapping"""
+    monkeypatch.setattr(get_settings(), "VECTOR_IVF_MIN_VECTORS", 100)
+    rng = np.random.default_rng(1)
+    vectors = rng.random((2000, DIM), dtype=np.float32)
+    ids = np.arange(2000, dtype=np.int64) + 10
+
+    index = VectorIndex(tmp_path, DIM)
+    index.open()
+    index.build(ids, vectors)
+    assert index.manifest["kind"] == "ivf"
+
+    index.add(np.array([5000], dtype=np.int64), vectors[:1] * 1.0)
+    results = index.search(vectors[0], k=2)
+    assert {vector_id for vector_id, _ in results} == {10, 5000}
+
+    index.compact()
+    assert index.stats()["vectors"] == 2001
+    assert index.search(vectors[0], k=2)[0][1] == pytest.approx(1.0, abs=1e-4)